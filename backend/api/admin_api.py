@@ -193,6 +193,12 @@ def delete_exercise(exercise_id):
         return jsonify({'error': 'Exercise not found'}), 404
     
     try:
+        from models import TrainingProgramSessionExercise
+        # Program sessions keep the exercise by name; drop the library link first (tables created
+        # before the FK had ON DELETE SET NULL would otherwise reject the delete)
+        db.session.query(TrainingProgramSessionExercise).filter(
+            TrainingProgramSessionExercise.exercise_id == exercise.id
+        ).update({TrainingProgramSessionExercise.exercise_id: None}, synchronize_session=False)
         db.session.delete(exercise)
         db.session.commit()
         try:
@@ -280,7 +286,8 @@ def propagate_exercise_notes(exercise_id):
     user_id = get_jwt_identity()
     if not is_admin_or_assistant(user_id):
         return jsonify({'error': 'Unauthorized'}), 403
-    from models import TrainingProgram, TrainingActionNote
+    from models import TrainingProgram, TrainingProgramSession, TrainingProgramSessionExercise, TrainingActionNote
+    from sqlalchemy import or_
     Exercise = get_exercise_model()
     exercise = db.session.query(Exercise).filter_by(id=exercise_id).first()
     if not exercise:
@@ -292,37 +299,62 @@ def propagate_exercise_notes(exercise_id):
     voice_url = exercise.voice_url or ''
     if not name_fa and not name_en:
         return jsonify({'error': 'Exercise has no name'}), 400
-    programs = db.session.query(TrainingProgram).all()
-    updated = 0
-    for program in programs:
-        sessions_list = program.get_sessions() if hasattr(program, 'get_sessions') else []
-        for session_idx, session in enumerate(sessions_list):
-            exercises_list = session.get('exercises') or []
+    # Program exercises that are this library exercise (by exercise_id or name), via the indexed
+    # training_program_session_exercises table; then the existing notes for them in one query.
+    conditions = [TrainingProgramSessionExercise.exercise_id == exercise.id]
+    if name_fa:
+        conditions.append(TrainingProgramSessionExercise.name_fa == name_fa)
+    if name_en:
+        conditions.append(TrainingProgramSessionExercise.name_en == name_en)
+    targets = db.session.query(
+        TrainingProgramSession.training_program_id,
+        TrainingProgramSession.session_index,
+        TrainingProgramSessionExercise.exercise_index,
+    ).join(
+        TrainingProgramSession, TrainingProgramSession.id == TrainingProgramSessionExercise.session_id
+    ).filter(or_(*conditions)).distinct().all()
+    # Programs still in the legacy sessions JSON column (migrate_training_program_sessions.py not run yet)
+    # have no child rows: match their exercises by name in the JSON, as before the tables existed
+    targets = set(targets)
+    for program in db.session.query(TrainingProgram).filter(TrainingProgram.sessions_json.isnot(None)).all():
+        for session_idx, session in enumerate(program.get_sessions()):
+            exercises_list = (session.get('exercises') if isinstance(session, dict) else None) or []
             for ex_idx, ex in enumerate(exercises_list):
+                if not isinstance(ex, dict):
+                    continue
                 ex_name_fa = (ex.get('name_fa') or ex.get('name') or '').strip()
                 ex_name_en = (ex.get('name_en') or ex.get('name') or '').strip()
                 if (name_fa and ex_name_fa == name_fa) or (name_en and ex_name_en == name_en):
-                    existing = db.session.query(TrainingActionNote).filter_by(
-                        training_program_id=program.id,
-                        session_index=session_idx,
-                        exercise_index=ex_idx,
-                    ).first()
-                    if existing:
-                        existing.note_fa = note_fa or None
-                        existing.note_en = note_en or None
-                        existing.voice_url = voice_url or None
-                    else:
-                        row = TrainingActionNote(
-                            training_program_id=program.id,
-                            session_index=session_idx,
-                            exercise_index=ex_idx,
-                            note_fa=note_fa or None,
-                            note_en=note_en or None,
-                            voice_url=voice_url or None,
-                            created_by=int(user_id) if user_id else None,
-                        )
-                        db.session.add(row)
-                    updated += 1
+                    targets.add((program.id, session_idx, ex_idx))
+    targets = sorted(targets)
+    existing_notes = {}
+    if targets:
+        program_ids = sorted({t[0] for t in targets})
+        existing_notes = {
+            (n.training_program_id, n.session_index, n.exercise_index): n
+            for n in db.session.query(TrainingActionNote).filter(
+                TrainingActionNote.training_program_id.in_(program_ids)
+            ).all()
+        }
+    updated = 0
+    for program_id, session_idx, ex_idx in targets:
+        existing = existing_notes.get((program_id, session_idx, ex_idx))
+        if existing:
+            existing.note_fa = note_fa or None
+            existing.note_en = note_en or None
+            existing.voice_url = voice_url or None
+        else:
+            row = TrainingActionNote(
+                training_program_id=program_id,
+                session_index=session_idx,
+                exercise_index=ex_idx,
+                note_fa=note_fa or None,
+                note_en=note_en or None,
+                voice_url=voice_url or None,
+                created_by=int(user_id) if user_id else None,
+            )
+            db.session.add(row)
+        updated += 1
     try:
         db.session.commit()
         return jsonify({'message': 'Notes propagated to programs', 'updated_count': updated}), 200
@@ -815,10 +847,35 @@ def delete_assistant(assistant_id):
 
 # ==================== Member Management ====================
 
+ROSTER_FIELDS = ('id', 'username', 'email', 'created_at', 'assigned_to', 'profile')
+ROSTER_PROFILE_FIELDS = ('age', 'weight', 'height', 'gender', 'training_level', 'account_type')
+ROSTER_MAX_LIMIT = 500
+
+
+def _conditional_json(data):
+    """JSON response with an ETag; a request whose If-None-Match matches gets 304 Not Modified."""
+    response = jsonify(data)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.vary.add('Authorization')
+    response.add_etag()
+    return response.make_conditional(request)
+
+
 @admin_bp.route('/members', methods=['GET'])
 @jwt_required()
 def get_members():
-    """Get all members (admin and assistants can see their assigned members)"""
+    """
+    Get members (admin sees all, coaches their assigned members) in one query with profile and coach.
+    Optional query params:
+      role            member (default), coach or assistant - admin only
+      coach           coach id the members are assigned to, or 'none' for unassigned (admin only)
+      training_level  beginner / intermediate / advanced
+      search          substring of username or email
+      fields          comma-separated subset of id,username,email,created_at,assigned_to,profile
+      limit, offset   page (limit up to 500); X-Total-Count and X-Has-More headers are set when limit is given
+    Responses carry an ETag; send If-None-Match to get 304 when the page is unchanged.
+    """
+    from sqlalchemy.orm import aliased
     db = get_db()
     UserProfile = get_userprofile_model()
     user_id = get_jwt_identity()
@@ -828,45 +885,95 @@ def get_members():
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
+    role = 'member'
     if user.role == 'admin':
         # Admin sees all members
-        members = db.session.query(User).filter_by(role='member').all()
+        role = request.args.get('role', 'member')
+        if role not in ('member', 'coach', 'assistant'):
+            return jsonify({'error': 'role must be member, coach or assistant'}), 400
     elif user.role == 'coach':
         if getattr(user, 'coach_approval_status', None) != 'approved':
             return jsonify({'error': 'Coach account pending approval'}), 403
-        user_id_int = int(user_id) if isinstance(user_id, str) else user_id
-        members = db.session.query(User).filter_by(role='member', assigned_to=user_id_int).all()
     else:
         return jsonify({'error': 'Unauthorized'}), 403
     
-    members_data = []
-    for member in members:
-        profile = db.session.query(UserProfile).filter_by(user_id=member.id).first()
-        assigned_to_user = None
-        if member.assigned_to:
-            assigned_to = db.session.get(User, member.assigned_to)
-            assigned_to_user = {
-                'id': assigned_to.id,
-                'username': assigned_to.username,
-                'role': assigned_to.role
-            } if assigned_to else None
-        
-        members_data.append({
-            'id': member.id,
-            'username': member.username,
-            'email': member.email,
-            'assigned_to': assigned_to_user,
-            'profile': {
-                'age': profile.age if profile else None,
-                'weight': profile.weight if profile else None,
-                'height': profile.height if profile else None,
-                'gender': profile.gender if profile else None,
-                'training_level': profile.training_level if profile else None,
-                'account_type': profile.account_type if profile else None
-            } if profile else None
-        })
+    fields = [f.strip() for f in (request.args.get('fields') or '').split(',') if f.strip()] or list(ROSTER_FIELDS)
+    unknown = [f for f in fields if f not in ROSTER_FIELDS]
+    if unknown:
+        return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+    
+    Coach = aliased(User)
+    columns = [User.id.label('id')]
+    if 'username' in fields:
+        columns.append(User.username.label('username'))
+    if 'email' in fields:
+        columns.append(User.email.label('email'))
+    if 'created_at' in fields:
+        columns.append(User.created_at.label('created_at'))
+    if 'assigned_to' in fields:
+        columns += [Coach.id.label('coach_id'), Coach.username.label('coach_username'), Coach.role.label('coach_role')]
+    if 'profile' in fields:
+        columns.append(UserProfile.id.label('profile_id'))
+        columns += [getattr(UserProfile, name).label(f'profile_{name}') for name in ROSTER_PROFILE_FIELDS]
+    
+    q = db.session.query(*columns).outerjoin(UserProfile, UserProfile.user_id == User.id).filter(User.role == role)
+    if 'assigned_to' in fields:
+        q = q.outerjoin(Coach, Coach.id == User.assigned_to)
+    if user.role == 'coach':
+        q = q.filter(User.assigned_to == user.id)
+    else:
+        coach_filter = (request.args.get('coach') or '').strip()
+        if coach_filter == 'none':
+            q = q.filter(User.assigned_to.is_(None))
+        elif coach_filter:
+            try:
+                q = q.filter(User.assigned_to == int(coach_filter))
+            except ValueError:
+                return jsonify({'error': "coach must be a user id or 'none'"}), 400
+    training_level = (request.args.get('training_level') or '').strip()
+    if training_level:
+        q = q.filter(UserProfile.training_level == training_level)
+    search = (request.args.get('search') or '').strip()
+    if search:
+        pattern = '%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        q = q.filter(User.username.ilike(pattern, escape='\\') | User.email.ilike(pattern, escape='\\'))
+    
+    limit = request.args.get('limit', type=int)
+    offset = max(0, request.args.get('offset', 0, type=int) or 0)
+    total = None
+    if limit is not None:
+        limit = max(1, min(limit, ROSTER_MAX_LIMIT))
+        total = q.order_by(None).count()
+        rows = q.order_by(User.id).offset(offset).limit(limit).all()
+    else:
+        rows = q.order_by(User.id).all()
     
-    return jsonify(members_data), 200
+    members_data = []
+    for row in rows:
+        item = {'id': row.id}
+        if 'username' in fields:
+            item['username'] = row.username
+        if 'email' in fields:
+            item['email'] = row.email
+        if 'created_at' in fields:
+            item['created_at'] = row.created_at.isoformat() if row.created_at else None
+        if 'assigned_to' in fields:
+            item['assigned_to'] = {
+                'id': row.coach_id,
+                'username': row.coach_username,
+                'role': row.coach_role
+            } if row.coach_id else None
+        if 'profile' in fields:
+            item['profile'] = {
+                name: getattr(row, f'profile_{name}') for name in ROSTER_PROFILE_FIELDS
+            } if row.profile_id else None
+        members_data.append(item)
+    
+    response = _conditional_json(members_data)
+    if total is not None:
+        response.headers['X-Total-Count'] = str(total)
+        response.headers['X-Has-More'] = 'true' if offset + len(rows) < total else 'false'
+    return response
 
 @admin_bp.route('/members/<int:member_id>/assign', methods=['POST'])
 @jwt_required()
@@ -1022,7 +1129,7 @@ def delete_member(member_id):
 @admin_bp.route('/members/<int:member_id>', methods=['GET'])
 @jwt_required()
 def get_member_details(member_id):
-    """Get detailed member information (admin and assistants can see their assigned members)"""
+    """Get detailed member information (admin and assistants can see their assigned members). Supports If-None-Match."""
     db = get_db()
     UserProfile = get_userprofile_model()
     user_id = get_jwt_identity()
@@ -1032,9 +1139,13 @@ def get_member_details(member_id):
     if not user:
         return jsonify({'error': 'User not found'}), 404
     
-    member = db.session.query(User).filter_by(id=member_id, role='member').first()
-    if not member:
+    # Member and profile in one query
+    row = db.session.query(User, UserProfile).outerjoin(
+        UserProfile, UserProfile.user_id == User.id
+    ).filter(User.id == member_id, User.role == 'member').first()
+    if not row:
         return jsonify({'error': 'Member not found'}), 404
+    member, profile = row
     
     # Check if user has permission to view this member
     if user.role == 'admin':
@@ -1047,8 +1158,6 @@ def get_member_details(member_id):
     else:
         return jsonify({'error': 'Unauthorized'}), 403
     
-    profile = db.session.query(UserProfile).filter_by(user_id=member_id).first()
-    
     member_data = {
         'id': member.id,
         'username': member.username,
@@ -1086,7 +1195,7 @@ def get_member_details(member_id):
             'preferred_intensity': profile.preferred_intensity
         }
     
-    return jsonify(member_data), 200
+    return _conditional_json(member_data)
 
 # ==================== Configuration Management ====================
 
@@ -1682,8 +1791,8 @@ def update_training_plans_products():
     try:
         db.session.commit()
         try:
-            from services.website_kb import trigger_kb_reindex_safe
-            trigger_kb_reindex_safe()
+            from services.website_kb import trigger_kb_reindex_async
+            trigger_kb_reindex_async()
         except Exception:
             pass
         return jsonify({'message': 'Training plans & packages saved'}), 200
@@ -1755,6 +1864,26 @@ def update_ai_settings():
         return jsonify({'error': str(e)}), 500
 
 
+@admin_bp.route('/chat-routing/stats', methods=['GET'])
+@jwt_required()
+def chat_routing_stats():
+    """How chat turns were answered (intent fast path vs LLM planner) in this worker process. Admin only."""
+    if not is_admin(get_jwt_identity()):
+        return jsonify({'error': 'Unauthorized'}), 403
+    from services.action_planner import get_route_stats
+    return jsonify(get_route_stats()), 200
+
+
+@admin_bp.route('/ai-providers/health', methods=['GET'])
+@jwt_required()
+def ai_providers_health():
+    """Chat provider failover order, circuit breaker states and p95 latency in this worker process. Admin only."""
+    if not is_admin(get_jwt_identity()):
+        return jsonify({'error': 'Unauthorized'}), 403
+    from services.ai_provider import get_provider_health
+    return jsonify(get_provider_health()), 200
+
+
 # ---------- Website KB ----------
 @admin_bp.route('/website-kb/status', methods=['GET'])
 @jwt_required()
@@ -1762,10 +1891,14 @@ def kb_status():
     if not is_admin(get_jwt_identity()):
         return jsonify({'error': 'Unauthorized'}), 403
     from services.website_kb import get_kb_status
+    from services.embedding_cache import cache_stats
+    from services.kb_reindex import get_reindex_status
     status = get_kb_status()
     return jsonify({
         'updated_at': status.get('updated_at'),
         'count': status.get('count', 0),
+        'embedding_cache': cache_stats(),
+        'reindex': get_reindex_status(),
     }), 200
 
 
@@ -1774,14 +1907,19 @@ def kb_status():
 def kb_reindex():
     if not is_admin(get_jwt_identity()):
         return jsonify({'error': 'Unauthorized'}), 403
-    from services.website_kb import build_kb_index
+    from services.kb_reindex import run_kb_reindex_now, ReindexBusy
     try:
-        payload = build_kb_index()
+        payload = run_kb_reindex_now()
         return jsonify({
             'message': 'KB reindexed',
             'count': payload.get('count', 0),
             'updated_at': payload.get('updated_at'),
+            'added': payload.get('added'),
+            'removed': payload.get('removed'),
+            'unchanged': payload.get('unchanged'),
         }), 200
+    except ReindexBusy as e:
+        return jsonify({'error': str(e)}), 409
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -1898,8 +2036,12 @@ def list_programs():
     if not is_admin_or_assistant(user_id):
         return jsonify({'error': 'Unauthorized'}), 403
     from models import TrainingProgram
+    from sqlalchemy.orm import selectinload
     language = request.args.get('language', 'fa')
-    programs = db.session.query(TrainingProgram).order_by(TrainingProgram.id).all()
+    # to_dict reads every session and its exercises: load them in two IN queries, not two per program
+    programs = db.session.query(TrainingProgram).options(
+        selectinload(TrainingProgram.session_rows)
+    ).order_by(TrainingProgram.id).all()
     out = [p.to_dict(language) for p in programs]
     return jsonify(out), 200
 
@@ -1975,8 +2117,8 @@ def cleanup_training_programs():
                 duration_weeks=keep_general.duration_weeks,
                 training_level=keep_general.training_level,
                 category=keep_general.category,
-                sessions=keep_general.sessions,
             )
+            copy_program.set_sessions(keep_general.get_sessions())
             db.session.add(copy_program)
         assigned += 1
 
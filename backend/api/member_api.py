@@ -235,7 +235,6 @@ def _assign_program_after_purchase(db, user_id, program_id, language='fa'):
             duration_weeks=template.duration_weeks,
             training_level=template.training_level,
             category=template.category,
-            sessions=None,
         )
         copy_program.set_sessions(sessions)
         db.session.add(copy_program)
@@ -256,8 +255,8 @@ def _assign_program_after_purchase(db, user_id, program_id, language='fa'):
             duration_weeks=template.duration_weeks,
             training_level=template.training_level,
             category=template.category,
-            sessions=json.dumps(template_sessions, ensure_ascii=False) if template_sessions else template.sessions,
         )
+        copy_program.set_sessions(template_sessions if isinstance(template_sessions, list) else [])
         db.session.add(copy_program)
 
     db.session.flush()
@@ -1016,9 +1015,9 @@ def generate_next_sessions(program_id):
         if not program:
             return jsonify({'error': 'Program not found'}), 404
 
-        sessions_list = program.get_sessions() or []
+        session_count = program.session_count()
         if start_session_index is None:
-            start_session_index = len(sessions_list)
+            start_session_index = session_count
 
         if start_session_index < 0:
             return jsonify({'error': 'Invalid start_session_index'}), 400
@@ -1026,11 +1025,11 @@ def generate_next_sessions(program_id):
         # Need previous session for context when not at the beginning
         previous_session = None
         if start_session_index > 0:
-            if start_session_index > len(sessions_list):
+            if start_session_index > session_count:
                 return jsonify({
                     'error': 'Cannot generate: previous sessions missing. Generate in order (e.g. complete session 1 before generating 2-3).',
                 }), 400
-            previous_session = sessions_list[start_session_index - 1]
+            previous_session = program.get_session(start_session_index - 1)
 
         # Get template program_id for AI config (use purchased template if available)
         template_id = program_id
@@ -1062,9 +1061,8 @@ def generate_next_sessions(program_id):
             )
             return jsonify({'error': ai_error or 'AI could not generate sessions'}), 500
 
-        # Append new sessions to program
-        updated_sessions = sessions_list + new_sessions
-        program.set_sessions(updated_sessions)
+        # Append new sessions to program (new rows only; existing sessions are not rewritten)
+        program.append_sessions(new_sessions)
         db.session.commit()
 
         append_ai_program_log(
@@ -1131,10 +1129,9 @@ def adapt_session():
         program = _get_member_program(user_id, int(program_id))
         if not program:
             return jsonify({'error': 'Program not found'}), 404
-        sessions_list = program.get_sessions()
-        if session_index < 0 or session_index >= len(sessions_list):
+        session_obj = program.get_session(session_index) if session_index >= 0 else None
+        if session_obj is None:
             return jsonify({'error': 'Invalid session_index'}), 400
-        session_obj = sessions_list[session_index]
         from services.session_ai_service import adapt_session_by_mood
         result = adapt_session_by_mood(session_obj, mood_or_message, language)
         adapted_exercises = result.get('exercises', session_obj.get('exercises', []))
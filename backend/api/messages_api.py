@@ -9,6 +9,9 @@ from datetime import datetime
 
 messages_bp = Blueprint('messages', __name__, url_prefix='/api/messages')
 
+THREADS_DEFAULT_LIMIT = 100
+THREADS_MAX_LIMIT = 500
+
 
 def _get_db():
     """Get database instance from current app context."""
@@ -43,7 +46,9 @@ def list_threads():
     """
     List conversations.
     - Member: returns their assigned trainer (single thread).
-    - Admin/Assistant: returns list of members they have messages with (thread list with last message and unread count).
+    - Admin/Assistant: returns their members, latest conversation first (last message and unread count).
+      Paging is opt-in: ?limit=N and then ?offset=<next_offset>; has_more says if there are more.
+      Without limit or offset every thread is returned.
     """
     db = _get_db()
     User = _get_user_model()
@@ -88,42 +93,61 @@ def list_threads():
     if current.role not in ('admin', 'coach'):
         return jsonify({'error': 'Forbidden'}), 403
 
-    # Get assigned member IDs (admin: all members; assistant: only assigned)
-    if current.role == 'admin':
-        members = db.session.query(User).filter_by(role='member').all()
+    # One query for the page: each member joined to the latest message of the pair (window over the
+    # current user's messages) and the number of messages from that member not yet read.
+    # Admin: all members; assistant: only assigned. Members without messages come last.
+    from sqlalchemy import and_, case, func, or_
+    paged = 'limit' in request.args or 'offset' in request.args
+    limit = max(1, min(request.args.get('limit', THREADS_DEFAULT_LIMIT, type=int) or THREADS_DEFAULT_LIMIT, THREADS_MAX_LIMIT))
+    offset = max(0, request.args.get('offset', 0, type=int) or 0)
+
+    other_id = case((TrainerMessage.sender_id == current.id, TrainerMessage.recipient_id), else_=TrainerMessage.sender_id)
+    is_unread = case((and_(TrainerMessage.recipient_id == current.id, TrainerMessage.read_at.is_(None)), 1), else_=0)
+    latest = db.session.query(
+        other_id.label('other_id'),
+        func.substr(TrainerMessage.body, 1, 81).label('body'),
+        TrainerMessage.created_at.label('created_at'),
+        func.row_number().over(
+            partition_by=other_id,
+            order_by=(TrainerMessage.created_at.desc(), TrainerMessage.id.desc())
+        ).label('rn'),
+        func.sum(is_unread).over(partition_by=other_id).label('unread'),
+    ).filter(
+        or_(TrainerMessage.sender_id == current.id, TrainerMessage.recipient_id == current.id)
+    ).subquery()
+
+    q = db.session.query(
+        User.id, User.username, latest.c.body, latest.c.created_at, latest.c.unread
+    ).outerjoin(
+        latest, and_(latest.c.other_id == User.id, latest.c.rn == 1)
+    ).filter(User.role == 'member')
+    if current.role != 'admin':
+        q = q.filter(User.assigned_to == current.id)
+    # If ?with=USER_ID, we still return thread list but frontend will open that thread
+    q = q.order_by(latest.c.created_at.is_(None), latest.c.created_at.desc(), User.id)
+    if paged:
+        rows = q.offset(offset).limit(limit + 1).all()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
     else:
-        members = db.session.query(User).filter_by(role='member', assigned_to=current.id).all()
-    member_ids = [u.id for u in members]
-
-    if not member_ids:
-        return jsonify({'threads': []}), 200
+        rows = q.all()
+        has_more = False
 
-    # If ?with=USER_ID, we still return thread list but frontend will open that thread
     threads = []
-    for mid in member_ids:
-        member = db.session.get(User, mid)
-        if not member:
-            continue
-        last_msg = db.session.query(TrainerMessage).filter(
-            ((TrainerMessage.sender_id == current.id) & (TrainerMessage.recipient_id == mid)) |
-            ((TrainerMessage.sender_id == mid) & (TrainerMessage.recipient_id == current.id))
-        ).order_by(TrainerMessage.created_at.desc()).first()
-        unread = db.session.query(TrainerMessage).filter(
-            TrainerMessage.sender_id == mid,
-            TrainerMessage.recipient_id == current.id,
-            TrainerMessage.read_at.is_(None)
-        ).count()
+    for member_id, username, body, last_at, unread in rows:
         threads.append({
-            'user_id': member.id,
-            'username': member.username,
-            'last_message': last_msg.body[:80] + '...' if last_msg and len(last_msg.body) > 80 else (last_msg.body if last_msg else None),
-            'last_at': last_msg.created_at.isoformat() if last_msg else None,
-            'unread_count': unread
+            'user_id': member_id,
+            'username': username,
+            'last_message': body[:80] + '...' if body and len(body) > 80 else body,
+            'last_at': last_at.isoformat() if last_at else None,
+            'unread_count': int(unread or 0)
         })
 
-    # Sort by last_at desc
-    threads.sort(key=lambda t: t['last_at'] or '', reverse=True)
-    return jsonify({'threads': threads}), 200
+    return jsonify({
+        'threads': threads,
+        'has_more': has_more,
+        'next_offset': offset + len(threads) if has_more else None
+    }), 200
 
 
 @messages_bp.route('/thread/<int:other_user_id>', methods=['GET'])
@@ -27,6 +27,12 @@ def _get_openai_key():
 
 
 def generate_embedding(text: str) -> List[float]:
+    """Generate embedding using OpenAI, through the shared query-embedding cache."""
+    from services.embedding_cache import get_or_embed
+    return get_or_embed('openai', 'text-embedding-3-small', 1536, text, _generate_embedding_uncached)
+
+
+def _generate_embedding_uncached(text: str) -> List[float]:
     """Generate embedding using OpenAI (key from AI settings or OPENAI_API_KEY env)."""
     key = _get_openai_key()
     if not key:
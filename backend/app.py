@@ -1,4 +1,4 @@
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify, make_response, send_from_directory, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 from flask_jwt_extended import (
@@ -11,6 +11,7 @@ import os
 import uuid
 import base64
 import json
+import functools
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -62,7 +63,9 @@ os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
 db = SQLAlchemy(app)
 jwt = JWTManager(app)
-CORS(app)
+# Paging headers of /api/chat/conversations and /api/chat/history must be readable cross-origin
+CORS(app, expose_headers=['X-Has-More', 'X-Next-Before-Id', 'X-Next-Before', 'X-Next-Before-Sid',
+                          'X-Total-Count', 'ETag'])
 
 # Import models module early to register all model classes
 # This ensures relationships can resolve class names properly
@@ -206,6 +209,57 @@ def ensure_default_admin():
 def _ensure_admin_on_first_request():
     ensure_default_admin()
 
+
+# ---------- Metrics (GET /api/metrics) ----------
+try:
+    from services import metrics as app_metrics
+    app_metrics.install_sqlalchemy_hooks()
+except Exception as exc:
+    app_metrics = None
+    print(f"[WARN] Metrics disabled: {exc}")
+
+
+@app.before_request
+def _metrics_start_request():
+    if app_metrics is not None:
+        app_metrics.start_request()
+
+
+@app.after_request
+def _metrics_end_request(response):
+    if app_metrics is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        app_metrics.end_request(route, request.method, response.status_code)
+    return response
+
+
+# ---------- SQL query guard (dev/test: SQL_QUERY_GUARD=1) ----------
+from services import query_guard
+
+
+@app.before_request
+def _query_guard_start():
+    if query_guard.ENABLED:
+        g.query_guard = query_guard.begin_request()
+
+
+@app.after_request
+def _query_guard_end(response):
+    state = g.pop('query_guard', None)
+    if state is not None:
+        route = request.url_rule.rule if request.url_rule is not None else request.path
+        query_guard.end_request(state, f"{request.method} {route}", response)
+    return response
+
+
+@app.teardown_request
+def _query_guard_teardown(exc):
+    # after_request is skipped when a before_request hook fails; do not leave the recorder active
+    state = g.pop('query_guard', None)
+    if state is not None:
+        query_guard.stop_recording(state[1])
+
+
 class UserExercise(db.Model):
     """User Exercise History - tracks user's completed exercises"""
     __tablename__ = 'user_exercises'
@@ -227,6 +281,11 @@ class ChatHistory(db.Model):
     response = db.Column(db.Text, nullable=False)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+    __table_args__ = (
+        db.Index('idx_chat_history_user_session_id', 'user_id', 'session_id', 'id'),
+        db.Index('idx_chat_history_user_id', 'user_id', 'id'),
+    )
+
 
 class ChatSession(db.Model):
     """Optional custom title per conversation (session_id)."""
@@ -247,6 +306,11 @@ class TrainerMessage(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     read_at = db.Column(db.DateTime, nullable=True)
 
+    __table_args__ = (
+        db.Index('idx_trainer_messages_recipient_sender_read', 'recipient_id', 'sender_id', 'read_at'),
+        db.Index('idx_trainer_messages_pair_created', 'sender_id', 'recipient_id', 'created_at'),
+    )
+
 
 # NutritionPlan is defined in models.py to avoid duplicate class names
 
@@ -933,13 +997,143 @@ def _build_action_summary(actions, results, errors):
         parts.append(f"Errors: {errors}")
     return "; ".join(parts) if parts else "No actions"
 
+def _save_chat_turn(user_id, session_id, message, assistant_response):
+    """Persist one chat turn (and its ChatSession row on first use). Returns the ChatHistory row."""
+    chat_entry = ChatHistory(
+        user_id=user_id,
+        session_id=session_id,
+        message=message,
+        response=assistant_response
+    )
+    db.session.add(chat_entry)
+    existing = ChatSession.query.filter_by(session_id=session_id, user_id=user_id).first()
+    if not existing:
+        db.session.add(ChatSession(session_id=session_id, user_id=user_id, title=None))
+    db.session.commit()
+    return chat_entry
+
+
+def _log_chat_turn(message, response, action_json, error=""):
+    try:
+        from services.ai_debug_logger import append_log
+        from services import tracing
+        append_log(message=message, response=response, action_json=action_json, error=error,
+                   spans=tracing.current_spans())
+    except Exception:
+        pass
+
+
+def _traced_chat(view):
+    """Trace the chat request (spans go to ai_debug.jsonl) and add Server-Timing when SERVER_TIMING_HEADER is on.
+    Streamed responses trace inside their generator instead, since headers are sent before the turn runs."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        from services import tracing
+        token = tracing.start_trace('chat')
+        try:
+            rv = view(*args, **kwargs)
+        finally:
+            trace = tracing.end_trace(token)
+        response = make_response(rv)
+        if trace is not None and tracing.SERVER_TIMING_ENABLED and not response.is_streamed:
+            response.headers['Server-Timing'] = trace.server_timing()
+        return response
+    return wrapper
+
+
+def _wants_event_stream():
+    """Streaming is opt-in: POST /api/chat/stream, or /api/chat with Accept: text/event-stream."""
+    return request.path.endswith('/stream') or 'text/event-stream' in (request.headers.get('Accept') or '')
+
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+def _chat_event_stream(user, message, session_id, local_time, response_language):
+    """
+    Server-Sent Events for one chat turn. Events: session, delta (assistant text pieces), actions,
+    result (one per executed action), then done with the same payload as the JSON endpoint
+    (done.response is authoritative) or error. ChatHistory is written once, before done.
+    """
+    user_id = user.id
+
+    def generate():
+        from services import tracing
+        token = tracing.start_trace('chat.stream')
+        try:
+            yield from _generate()
+        finally:
+            tracing.end_trace(token)
+
+    def _generate():
+        from services import tracing
+        yield _sse('session', {'session_id': session_id})
+        try:
+            use_action_planner = str(os.getenv('USE_ACTION_PLANNER', 'true')).lower() in ('1', 'true', 'yes')
+            assistant_response = ''
+            actions = []
+            results = []
+            errors = []
+            if use_action_planner:
+                try:
+                    from services.action_planner import plan_and_execute_stream
+                    for event, payload in plan_and_execute_stream(message, user, response_language):
+                        if event == 'done':
+                            assistant_response = payload.get('assistant_response') or ''
+                            actions = payload.get('actions', [])
+                            results = payload.get('results', [])
+                            errors = payload.get('errors', [])
+                        else:
+                            yield _sse(event, payload)
+                except Exception as e:
+                    if os.getenv('AI_CONSOLE_LOG', '').lower() in ('1', 'true', 'yes'):
+                        print(f"Action planner failed, falling back to generate_ai_response: {e}")
+                    use_action_planner = False
+
+            if not use_action_planner or not assistant_response:
+                with tracing.span('chat.fallback_response'):
+                    assistant_response = generate_ai_response(message, user_id, response_language, local_time)
+
+            with tracing.span('chat.save'):
+                chat_entry = _save_chat_turn(user_id, session_id, message, assistant_response)
+            _log_chat_turn(message, assistant_response, {"actions": actions, "results": results, "errors": errors})
+            yield _sse('done', {
+                'response': assistant_response,
+                'assistant_response': assistant_response,
+                'actions': actions,
+                'results': results,
+                'errors': errors,
+                'action_summary': _build_action_summary(actions, results, errors),
+                'timestamp': chat_entry.timestamp.isoformat(),
+                'session_id': session_id,
+            })
+        except Exception as e:
+            import traceback
+            print(f"ERROR in chat stream: {str(e)}")
+            print(traceback.format_exc())
+            db.session.rollback()
+            err_msg = "Sorry, an error occurred. Please try again."
+            _log_chat_turn(message, err_msg, {}, error=str(e))
+            yield _sse('error', {'response': err_msg, 'timestamp': datetime.utcnow().isoformat()})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
+
 @app.route('/api/chat', methods=['POST'])
+@app.route('/api/chat/stream', methods=['POST'])
 @jwt_required()
+@_traced_chat
 def chat():
     """
     Unified AI chat endpoint (Real_State style).
     Uses action planner as primary flow: AI returns action_json, backend executes actions.
     Fallback to generate_ai_response when USE_ACTION_PLANNER=false or action planner fails.
+    POST /api/chat/stream (or Accept: text/event-stream) streams the turn as Server-Sent Events.
     """
     try:
         user_id_str = get_jwt_identity()
@@ -962,6 +1156,11 @@ def chat():
         if not session_id:
             session_id = str(uuid.uuid4())
 
+        if _wants_event_stream():
+            return _chat_event_stream(user, message, session_id, local_time, response_language)
+
+        from services import tracing
+
         use_action_planner = str(os.getenv('USE_ACTION_PLANNER', 'true')).lower() in ('1', 'true', 'yes')
         assistant_response = ''
         actions = []
@@ -971,7 +1170,8 @@ def chat():
         if use_action_planner:
             try:
                 from services.action_planner import plan_and_execute
-                result = plan_and_execute(message, user, response_language)
+                with tracing.span('planner.plan_and_execute'):
+                    result = plan_and_execute(message, user, response_language)
                 assistant_response = result.get('assistant_response') or ''
                 actions = result.get('actions', [])
                 results = result.get('results', [])
@@ -982,30 +1182,12 @@ def chat():
                 use_action_planner = False
 
         if not use_action_planner or not assistant_response:
-            assistant_response = generate_ai_response(message, user_id, response_language, local_time)
-
-        chat_entry = ChatHistory(
-            user_id=user_id,
-            session_id=session_id,
-            message=message,
-            response=assistant_response
-        )
-        db.session.add(chat_entry)
-        existing = ChatSession.query.filter_by(session_id=session_id, user_id=user_id).first()
-        if not existing:
-            db.session.add(ChatSession(session_id=session_id, user_id=user_id, title=None))
-        db.session.commit()
+            with tracing.span('chat.fallback_response'):
+                assistant_response = generate_ai_response(message, user_id, response_language, local_time)
 
-        try:
-            from services.ai_debug_logger import append_log
-            append_log(
-                message=message,
-                response=assistant_response,
-                action_json={"actions": actions, "results": results, "errors": errors},
-                error="",
-            )
-        except Exception:
-            pass
+        with tracing.span('chat.save'):
+            chat_entry = _save_chat_turn(user_id, session_id, message, assistant_response)
+        _log_chat_turn(message, assistant_response, {"actions": actions, "results": results, "errors": errors})
 
         # Build a short human-readable summary of what was done (for debugging/transparency)
         action_summary = _build_action_summary(actions, results, errors)
@@ -1038,61 +1220,113 @@ def chat():
         # Return a simple error response that the frontend can handle
         err_msg = "Sorry, an error occurred. Please try again."
 
-        try:
-            from services.ai_debug_logger import append_log
-            data = request.get_json() or {}
-            append_log(
-                message=data.get('message', ''),
-                response=err_msg,
-                action_json={},
-                error=str(e),
-            )
-        except Exception:
-            pass
+        data = request.get_json(silent=True) or {}
+        _log_chat_turn(data.get('message', ''), err_msg, {}, error=str(e))
 
         return jsonify({
             'response': err_msg,
             'timestamp': datetime.utcnow().isoformat()
         }), 200  # Return 200 so frontend doesn't treat it as an error
 
+# Conversation list / history page sizes (?limit=, capped; used when a page cursor comes without a limit)
+CHAT_CONVERSATIONS_DEFAULT_LIMIT = 100
+CHAT_HISTORY_DEFAULT_LIMIT = 100
+CHAT_PAGE_MAX_LIMIT = 500
+
+
+def _page_limit(default: int, cursor: bool = False):
+    """?limit=N capped at CHAT_PAGE_MAX_LIMIT. None (unpaged) when neither a limit nor a cursor was passed,
+    so callers that do not page keep getting the full list."""
+    if 'limit' not in request.args and not cursor:
+        return None
+    try:
+        limit = int(request.args.get('limit', default))
+    except (TypeError, ValueError):
+        limit = default
+    return max(1, min(limit, CHAT_PAGE_MAX_LIMIT))
+
+
+def _chat_conversation_key():
+    """SQL expression for the conversation a ChatHistory row belongs to: its session_id, or _legacy_<id>
+    for rows without one. Literal SQL (no bind params) so it can be repeated in GROUP BY on PostgreSQL."""
+    from sqlalchemy import String, cast, func, literal_column
+    return func.coalesce(
+        func.nullif(ChatHistory.session_id, literal_column("''")),
+        literal_column("'_legacy_'", String) + cast(ChatHistory.id, String),
+    )
+
+
 @app.route('/api/chat/conversations', methods=['GET'])
 @jwt_required()
 def chat_conversations():
-    """List conversations (sessions) for the user: session_id, preview, last_at, message_count."""
+    """
+    List conversations (sessions) for the user, newest first: session_id, preview, title, last_at,
+    message_count. One GROUP BY query plus preview and title lookups for the page only.
+    Paging is opt-in: ?limit=N returns the newest N; pass ?before=<X-Next-Before>&before_sid=<X-Next-Before-Sid>
+    for the next page. Pages are ordered by (last_at, session_id) so conversations with the same last_at are
+    neither skipped nor reordered between pages. X-Has-More says if there are more. Without limit or before,
+    every conversation is returned.
+    """
     try:
         user_id_str = get_jwt_identity()
         if not user_id_str:
             return jsonify({'error': 'Invalid token'}), 401
         user_id = int(user_id_str)
-        chats = ChatHistory.query.filter_by(user_id=user_id).order_by(ChatHistory.timestamp.asc()).all()
-        # Group by session_id (null/empty = legacy: each row is its own "conversation")
-        by_session = {}
-        for c in chats:
-            sid = c.session_id or f'_legacy_{c.id}'
-            if sid not in by_session:
-                by_session[sid] = {'session_id': c.session_id or sid, 'messages': [], 'last_at': c.timestamp}
-            by_session[sid]['messages'].append({'id': c.id, 'message': c.message, 'response': c.response, 'timestamp': c.timestamp.isoformat()})
-            by_session[sid]['last_at'] = max(by_session[sid]['last_at'], c.timestamp)
-        # Fetch custom titles from ChatSession
-        session_ids = list(by_session.keys())
+        from sqlalchemy import case, func, tuple_
+        before = (request.args.get('before') or '').strip()
+        before_sid = (request.args.get('before_sid') or '').strip()
+        limit = _page_limit(CHAT_CONVERSATIONS_DEFAULT_LIMIT, cursor=bool(before))
+        sid = _chat_conversation_key()
+        last_at = func.max(ChatHistory.timestamp)
+        q = db.session.query(
+            sid.label('sid'),
+            last_at.label('last_at'),
+            func.count(ChatHistory.id).label('turns'),
+            # Preview comes from the first turn with a non-empty message
+            func.min(case((ChatHistory.message != '', ChatHistory.id))).label('first_id'),
+        ).filter(ChatHistory.user_id == user_id).group_by(sid)
+        if before:
+            try:
+                before_at = datetime.fromisoformat(before)
+            except ValueError:
+                return jsonify({'error': 'before must be an ISO timestamp'}), 400
+            if before_sid:
+                q = q.having(tuple_(last_at, sid) < tuple_(before_at, before_sid))
+            else:
+                q = q.having(last_at < before_at)
+        q = q.order_by(last_at.desc(), sid.desc())
+        rows = q.all() if limit is None else q.limit(limit + 1).all()
+        has_more = limit is not None and len(rows) > limit
+        rows = rows[:limit]
+
+        first_ids = [r.first_id for r in rows if r.first_id is not None]
+        previews = {}
+        if first_ids:
+            previews = dict(db.session.query(ChatHistory.id, func.substr(ChatHistory.message, 1, 61)).filter(
+                ChatHistory.id.in_(first_ids)
+            ).all())
+        session_ids = [r.sid for r in rows]
         titles = {s.session_id: (s.title or '').strip() for s in ChatSession.query.filter(
             ChatSession.session_id.in_(session_ids),
             ChatSession.user_id == user_id
-        ).all() if (s.title or '').strip()}
+        ).all() if (s.title or '').strip()} if session_ids else {}
         out = []
-        for sid, data in by_session.items():
-            first_user = next((m['message'] for m in data['messages'] if m.get('message')), '')
+        for r in rows:
+            first_user = previews.get(r.first_id) or ''
             preview = (first_user[:60] + '...') if len(first_user) > 60 else first_user
-            display_title = titles.get(sid) or preview or '(No message)'
             out.append({
-                'session_id': data['session_id'] if data['session_id'] and not str(data['session_id']).startswith('_legacy') else sid,
+                'session_id': r.sid,
                 'preview': preview or '(No message)',
-                'title': display_title,
-                'last_at': data['last_at'].isoformat(),
-                'message_count': len(data['messages']) * 2
+                'title': titles.get(r.sid) or preview or '(No message)',
+                'last_at': r.last_at.isoformat() if r.last_at else None,
+                'message_count': r.turns * 2
             })
-        out.sort(key=lambda x: x['last_at'], reverse=True)
-        return jsonify(out), 200
+        response = jsonify(out)
+        response.headers['X-Has-More'] = 'true' if has_more else 'false'
+        if has_more and rows:
+            response.headers['X-Next-Before'] = rows[-1].last_at.isoformat()
+            response.headers['X-Next-Before-Sid'] = rows[-1].sid
+        return response, 200
     except Exception as e:
         import traceback
         print(f"Error in chat_conversations: {e}")
@@ -1143,13 +1377,20 @@ def chat_conversation_rename(session_id):
 @app.route('/api/chat/history', methods=['GET'])
 @jwt_required()
 def chat_history():
-    """Get chat history. If session_id query param is set, return only that conversation."""
+    """
+    Get chat history (oldest first). If session_id query param is set, return only that conversation.
+    Keyset paging from the newest turn is opt-in: ?limit=N returns the latest N turns; pass
+    ?before_id=<X-Next-Before-Id> for the N turns before those. X-Has-More says if there are older turns.
+    Without limit or before_id, the whole history is returned.
+    """
     try:
         user_id_str = get_jwt_identity()
         if not user_id_str:
             return jsonify({'error': 'Invalid token'}), 401
         user_id = int(user_id_str)
         session_id = request.args.get('session_id', '').strip() or None
+        before_id = request.args.get('before_id', type=int)
+        limit = _page_limit(CHAT_HISTORY_DEFAULT_LIMIT, cursor=bool(before_id))
         q = ChatHistory.query.filter_by(user_id=user_id)
         if session_id:
             if session_id.startswith('_legacy_'):
@@ -1160,20 +1401,33 @@ def chat_history():
                     pass
             else:
                 q = q.filter_by(session_id=session_id)
-        chats = q.order_by(ChatHistory.timestamp.asc()).all()
-        return jsonify([{
+        if before_id:
+            q = q.filter(ChatHistory.id < before_id)
+        if limit is None:
+            chats = q.order_by(ChatHistory.id).all()
+            has_more = False
+        else:
+            chats = q.order_by(ChatHistory.id.desc()).limit(limit + 1).all()
+            has_more = len(chats) > limit
+            chats = chats[:limit][::-1]
+        response = jsonify([{
             'id': chat.id,
             'session_id': chat.session_id,
             'message': chat.message,
             'response': chat.response,
             'timestamp': chat.timestamp.isoformat()
-        } for chat in chats]), 200
+        } for chat in chats])
+        response.headers['X-Has-More'] = 'true' if has_more else 'false'
+        if has_more and chats:
+            response.headers['X-Next-Before-Id'] = str(chats[0].id)
+        return response, 200
     except Exception as e:
         import traceback
         print(f"Error in chat_history: {e}")
         print(traceback.format_exc())
         return jsonify({'error': 'Authentication failed'}), 401
 
+
 @app.route('/api/nutrition/plans', methods=['GET', 'POST'])
 @jwt_required()
 def nutrition_plans():
@@ -1604,6 +1858,17 @@ def health_alias():
     return jsonify({'status': 'healthy'}), 200
 
 
+@app.route('/api/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text exposition for all gunicorn workers. METRICS_TOKEN, when set, is required as a Bearer token."""
+    token = (os.getenv('METRICS_TOKEN') or '').strip()
+    if token and request.headers.get('Authorization', '') != f'Bearer {token}':
+        return jsonify({'error': 'Unauthorized'}), 401
+    if app_metrics is None:
+        return jsonify({'error': 'Metrics unavailable'}), 503
+    return Response(app_metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
 @app.route('/api/public/training-info', methods=['GET'])
 def get_public_training_info():
     """Public endpoint: training levels and corrective movements (no auth). Used by landing page."""
@@ -1815,6 +2080,7 @@ def get_training_programs():
     """Get training programs for the current user. If member on trial with no program, AI creates a 1-week trial program."""
     try:
         from models import TrainingProgram, UserProfile, MemberWeeklyGoal
+        from sqlalchemy.orm import selectinload
         user_id_str = get_jwt_identity()
         if not user_id_str:
             return jsonify({'error': 'Invalid token'}), 401
@@ -1823,8 +2089,10 @@ def get_training_programs():
         user = db.session.query(User).filter_by(id=user_id).first()
         language = 'en'
 
-        user_programs = db.session.query(TrainingProgram).filter_by(user_id=user_id).all()
-        general_programs = db.session.query(TrainingProgram).filter(TrainingProgram.user_id.is_(None)).all()
+        # Sessions (and their exercises) are batch-loaded for all programs
+        with_sessions = selectinload(TrainingProgram.session_rows)
+        user_programs = db.session.query(TrainingProgram).options(with_sessions).filter_by(user_id=user_id).all()
+        general_programs = db.session.query(TrainingProgram).options(with_sessions).filter(TrainingProgram.user_id.is_(None)).all()
 
         # 7-day trial: if member has no program and trial is active, generate AI 1-week program
         trial_ends_at = getattr(user, 'trial_ends_at', None)
@@ -1862,7 +2130,6 @@ def get_training_programs():
                     parts.append(f"gym_access={profile.gym_access}")
             profile_summary = "; ".join(parts) if parts else "No profile yet; use beginner level, 3 days per week."
             from services.session_ai_service import generate_trial_week_program
-            import json as _json
             sessions = generate_trial_week_program(profile_summary, language)
             if sessions:
                 name_fa = "برنامه هفته آزمایشی"
@@ -1876,8 +2143,8 @@ def get_training_programs():
                     duration_weeks=1,
                     training_level=(profile.training_level if profile else None) or "beginner",
                     category="hybrid",
-                    sessions=_json.dumps(sessions, ensure_ascii=False),
                 )
+                trial_program.set_sessions(sessions)
                 db.session.add(trial_program)
                 db.session.flush()
                 goal = MemberWeeklyGoal(
@@ -1889,7 +2156,7 @@ def get_training_programs():
                 )
                 db.session.add(goal)
                 db.session.commit()
-                user_programs = db.session.query(TrainingProgram).filter_by(user_id=user_id).all()
+                user_programs = db.session.query(TrainingProgram).options(with_sessions).filter_by(user_id=user_id).all()
 
         # Members should only see their own programs (general plans are templates)
         if user and getattr(user, 'role', None) == 'member':
@@ -78,8 +78,8 @@ def run():
                 duration_weeks=template.duration_weeks,
                 training_level=template.training_level,
                 category=template.category,
-                sessions=template.sessions,
             )
+            copy_program.set_sessions(template.get_sessions())
             db.session.add(copy_program)
             assigned += 1
             print(f"Assigned program to {user.username} (id={user.id})")
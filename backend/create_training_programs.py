@@ -5,7 +5,6 @@ Script to create a single 4-week training program.
 from app import app, db
 from models import TrainingProgram
 from datetime import datetime
-import json
 
 def create_training_programs():
     with app.app_context():
@@ -127,10 +126,10 @@ def create_training_programs():
             description_en="4-week program for beginners covering all muscle groups. Perfect for starting your fitness journey.",
             duration_weeks=4,
             training_level="beginner",
-            category="bodybuilding",
-            sessions=json.dumps(program1_sessions, ensure_ascii=False)
+            category="bodybuilding"
         )
         
+        program1.set_sessions(program1_sessions)
         db.session.add(program1)
 
         # Program 2: Intermediate Strength
@@ -140,9 +139,9 @@ def create_training_programs():
             name_en="Intermediate Strength Program",
             description_fa="برنامه 4 هفته‌ای برای سطح متوسط. افزایش قدرت و حجم عضلانی.",
             description_en="4-week program for intermediate level. Build strength and muscle.",
-            duration_weeks=4, training_level="intermediate", category="bodybuilding",
-            sessions=json.dumps(program2_sessions, ensure_ascii=False)
+            duration_weeks=4, training_level="intermediate", category="bodybuilding"
         )
+        program2.set_sessions(program2_sessions)
         db.session.add(program2)
 
         # Program 3: Advanced Hypertrophy
@@ -152,9 +151,9 @@ def create_training_programs():
             name_en="Advanced Hypertrophy Program",
             description_fa="برنامه 4 هفته‌ای پیشرفته برای افزایش حجم عضلانی.",
             description_en="4-week advanced program for muscle hypertrophy.",
-            duration_weeks=4, training_level="advanced", category="bodybuilding",
-            sessions=json.dumps(program3_sessions, ensure_ascii=False)
+            duration_weeks=4, training_level="advanced", category="bodybuilding"
         )
+        program3.set_sessions(program3_sessions)
         db.session.add(program3)
 
         # Program 4: Functional Home (no gym)
@@ -164,9 +163,9 @@ def create_training_programs():
             name_en="Functional Home Program",
             description_fa="برنامه 4 هفته‌ای بدون نیاز به باشگاه. مناسب برای تمرین در خانه.",
             description_en="4-week program with no gym required. Perfect for home workouts.",
-            duration_weeks=4, training_level="beginner", category="functional",
-            sessions=json.dumps(program4_sessions, ensure_ascii=False)
+            duration_weeks=4, training_level="beginner", category="functional"
         )
+        program4.set_sessions(program4_sessions)
         db.session.add(program4)
 
         db.session.commit()
@@ -30,13 +30,14 @@ def run():
             # Reset password so login always works (fixes hash/DB mismatch)
             existing.password_hash = generate_password_hash(PASSWORD)
             # Remove any user-specific training programs (and dependents) so trial can generate a fresh one
-            program_ids = [p.id for p in db.session.query(TrainingProgram).filter_by(user_id=existing.id).all()]
+            programs = db.session.query(TrainingProgram).filter_by(user_id=existing.id).all()
             deleted = 0
-            for pid in program_ids:
+            for program in programs:
+                pid = program.id
                 db.session.query(MemberWeeklyGoal).filter_by(training_program_id=pid).delete()
                 db.session.query(MemberTrainingActionCompletion).filter_by(training_program_id=pid).delete()
                 db.session.query(TrainingActionNote).filter_by(training_program_id=pid).delete()
-                db.session.query(TrainingProgram).filter_by(id=pid).delete()
+                db.session.delete(program)  # also deletes its sessions
                 deleted += 1
             if existing.trial_ends_at is None or existing.trial_ends_at < datetime.utcnow():
                 existing.trial_ends_at = datetime.utcnow() + timedelta(days=7)
@@ -0,0 +1,91 @@
+"""
+Migration: composite indexes for the chat, messaging, notification and progress hot queries.
+db.create_all() only creates indexes together with a new table, so databases created before the
+indexes were declared on the models need this once. Works on SQLite and PostgreSQL; an index is
+skipped when the table already has one (or a unique constraint) on the same leading columns.
+
+  chat_history         (user_id, session_id, id)                    /api/chat/history?session_id=, /api/chat/conversations
+                       (user_id, id)                                /api/chat/history (all conversations)
+  trainer_messages     (recipient_id, sender_id, read_at)           unread counts in GET /api/messages
+                       (sender_id, recipient_id, created_at)        last message per thread, /api/messages/thread/<id>
+  notifications        (user_id, created_at)                        /api/member/notifications
+  progress_entries     (user_id, recorded_at)                       progress history by date range
+  daily_steps          (user_id, date)                              only if uq_user_date_steps is missing
+  member_weekly_goals  (user_id, training_program_id, week_number)  only if uq_member_program_week is missing
+                       (training_program_id)                        goal reseeding/deletion per program
+
+To compare query plans and timings before/after on synthetic data: python benchmark_hot_queries.py
+
+Run once: python migrate_hot_query_indexes.py
+"""
+
+from app import app, db
+from sqlalchemy import text, inspect
+
+# (index name, table, columns)
+INDEXES = [
+    ("idx_chat_history_user_session_id", "chat_history", ("user_id", "session_id", "id")),
+    ("idx_chat_history_user_id", "chat_history", ("user_id", "id")),
+    ("idx_trainer_messages_recipient_sender_read", "trainer_messages", ("recipient_id", "sender_id", "read_at")),
+    ("idx_trainer_messages_pair_created", "trainer_messages", ("sender_id", "recipient_id", "created_at")),
+    ("idx_notifications_user_created", "notifications", ("user_id", "created_at")),
+    ("idx_user_recorded_at", "progress_entries", ("user_id", "recorded_at")),
+    ("idx_daily_steps_user_date", "daily_steps", ("user_id", "date")),
+    ("idx_member_weekly_goals_user", "member_weekly_goals", ("user_id", "training_program_id", "week_number")),
+    ("idx_member_weekly_goals_program", "member_weekly_goals", ("training_program_id",)),
+]
+
+
+def _covering_index(insp, table, columns):
+    """Name of an existing index or unique constraint whose leading columns are `columns`, else None."""
+    existing = [(ix["name"], ix["column_names"]) for ix in insp.get_indexes(table)]
+    existing += [(uq["name"], uq["column_names"]) for uq in insp.get_unique_constraints(table)]
+    for name, cols in existing:
+        if tuple(cols[:len(columns)]) == tuple(columns):
+            return name or "unnamed"
+    return None
+
+
+def create_indexes(verbose=True):
+    """Create the missing INDEXES. Returns the names created."""
+    insp = inspect(db.engine)
+    created = []
+    for name, table, columns in INDEXES:
+        if not insp.has_table(table):
+            if verbose:
+                print(f"[OK] {table} does not exist yet; db.create_all() will create it with its indexes")
+            continue
+        covering = _covering_index(insp, table, columns)
+        if covering:
+            if verbose:
+                print(f"[OK] {table} ({', '.join(columns)}) already indexed by {covering}")
+            continue
+        db.session.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({', '.join(columns)})"))
+        created.append(name)
+        if verbose:
+            print(f"[OK] Created {name} on {table} ({', '.join(columns)})")
+    db.session.commit()
+    return created
+
+
+def migrate():
+    with app.app_context():
+        try:
+            create_indexes()
+            if db.engine.dialect.name == "postgresql":
+                # Refresh planner statistics so the new indexes are used right away
+                for table in sorted({t for _, t, _ in INDEXES}):
+                    if inspect(db.engine).has_table(table):
+                        db.session.execute(text(f"ANALYZE {table}"))
+                db.session.commit()
+            print("[OK] Migration done.")
+        except Exception as e:
+            db.session.rollback()
+            print(f"[ERROR] {e}")
+            import traceback
+            traceback.print_exc()
+            raise
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,43 @@
+"""
+Migration: add content_hash to website_kb_chunks (PostgreSQL / SQLAlchemy KB path).
+KB reindex uses it to embed only new or changed chunks. Existing rows have no hash and are
+re-embedded once on the next reindex.
+(The sqlite-vec KB store adds its own content_hash column automatically.)
+
+Run once: python migrate_kb_chunk_hash.py
+"""
+
+from app import app, db
+from sqlalchemy import text, inspect
+
+
+def migrate():
+    with app.app_context():
+        try:
+            insp = inspect(db.engine)
+            table_name = "website_kb_chunks"
+            if not insp.has_table(table_name):
+                print("[OK] website_kb_chunks does not exist yet; db.create_all() will create it with content_hash")
+                return
+            existing_columns = [c["name"] for c in insp.get_columns(table_name)]
+
+            if "content_hash" not in existing_columns:
+                db.session.execute(text(f"ALTER TABLE {table_name} ADD COLUMN content_hash VARCHAR(64)"))
+                print("[OK] Added content_hash")
+            else:
+                print("[OK] content_hash already exists")
+            db.session.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_website_kb_chunks_content_hash ON {table_name} (content_hash)"
+            ))
+            db.session.commit()
+            print("[OK] Migration done.")
+        except Exception as e:
+            db.session.rollback()
+            print(f"[ERROR] {e}")
+            import traceback
+            traceback.print_exc()
+            raise
+
+
+if __name__ == "__main__":
+    migrate()
@@ -61,6 +61,8 @@ TABLE_ORDER = [
     'tips',
     'injuries',
     'training_programs',
+    'training_program_sessions',
+    'training_program_session_exercises',
     'workout_logs',
     'progress_entries',
     'weekly_goals',
@@ -0,0 +1,77 @@
+"""
+Migration: move TrainingProgram sessions out of the training_programs.sessions JSON text column
+into training_program_sessions and training_program_session_exercises (one row per session and per
+session exercise, linked to the exercise library by name). Session and exercise indexes stay the same,
+so TrainingActionNote and MemberTrainingActionCompletion rows keep pointing at the same actions.
+
+Creates the two tables if needed, then converts every program that still has JSON sessions and
+clears its JSON column. Programs with invalid JSON are reported and left as they are.
+Safe to run again. Works on SQLite and PostgreSQL.
+
+Run once: python migrate_training_program_sessions.py
+"""
+
+import json
+
+from app import app, db
+from sqlalchemy import inspect
+
+BATCH = 100
+
+
+def migrate():
+    with app.app_context():
+        try:
+            from models import TrainingProgram, TrainingProgramSession, TrainingProgramSessionExercise
+
+            insp = inspect(db.engine)
+            for model in (TrainingProgramSession, TrainingProgramSessionExercise):
+                if not insp.has_table(model.__tablename__):
+                    model.__table__.create(db.engine)
+                    print(f"[OK] Created table {model.__tablename__}")
+                else:
+                    print(f"[OK] Table {model.__tablename__} already exists")
+
+            pending_ids = [pid for (pid,) in db.session.query(TrainingProgram.id).filter(
+                TrainingProgram.sessions_json.isnot(None)
+            ).order_by(TrainingProgram.id).all()]
+            print(f"[OK] {len(pending_ids)} program(s) with JSON sessions to convert")
+
+            converted = sessions = 0
+            for start in range(0, len(pending_ids), BATCH):
+                for program in db.session.query(TrainingProgram).filter(
+                    TrainingProgram.id.in_(pending_ids[start:start + BATCH])
+                ).all():
+                    try:
+                        sessions_list = json.loads(program.sessions_json.strip() or '[]')
+                    except ValueError as e:
+                        print(f"[ERROR] Program {program.id}: invalid sessions JSON ({e}); left unchanged")
+                        continue
+                    if not isinstance(sessions_list, list):
+                        print(f"[ERROR] Program {program.id}: sessions JSON is not a list; left unchanged")
+                        continue
+                    program.set_sessions(sessions_list)
+                    converted += 1
+                    sessions += len(program.session_rows)
+                db.session.commit()
+                print(f"[OK] Converted {converted}/{len(pending_ids)} programs")
+
+            linked, total = (
+                db.session.query(TrainingProgramSessionExercise).filter(
+                    TrainingProgramSessionExercise.exercise_id.isnot(None)
+                ).count(),
+                db.session.query(TrainingProgramSessionExercise).count(),
+            )
+            print(f"[OK] {converted} program(s), {sessions} session(s) converted; "
+                  f"{linked}/{total} session exercises linked to the exercise library")
+            print("[OK] Migration done.")
+        except Exception as e:
+            db.session.rollback()
+            print(f"[ERROR] {e}")
+            import traceback
+            traceback.print_exc()
+            raise
+
+
+if __name__ == "__main__":
+    migrate()
@@ -5,6 +5,7 @@ Supports Persian (Farsi) and English text with UTF-8 encoding
 
 from app import db
 from datetime import datetime
+from sqlalchemy import or_
 import json
 
 # Exercise Categories
@@ -368,25 +369,79 @@ class TrainingProgram(db.Model):
     training_level = db.Column(db.String(20))  # 'beginner', 'intermediate', 'advanced'
     category = db.Column(db.String(50))  # 'bodybuilding', 'functional', 'hiit', 'hybrid'
     
-    # Sessions (JSON array of session objects)
-    sessions = db.Column(db.Text)  # JSON array with session details
+    # Sessions live in training_program_sessions / training_program_session_exercises.
+    # Legacy JSON array: set only on programs not yet moved by migrate_training_program_sessions.py
+    sessions_json = db.Column('sessions', db.Text)
     
     # Metadata
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
-    def get_sessions(self):
-        """Parse sessions JSON string to list"""
-        if self.sessions:
+    session_rows = db.relationship(
+        'TrainingProgramSession', order_by='TrainingProgramSession.session_index',
+        cascade='all, delete-orphan', lazy=True
+    )
+    
+    def _legacy_sessions(self):
+        if self.sessions_json:
             try:
-                return json.loads(self.sessions)
+                return json.loads(self.sessions_json)
             except:
                 return []
         return []
     
+    def get_sessions(self):
+        """All sessions as a list of dicts (each with its 'exercises' list)"""
+        if self.sessions_json:
+            return self._legacy_sessions()
+        return [row.to_session() for row in self.session_rows]
+    
+    def get_session(self, session_index):
+        """One session by index without loading the others; None when out of range"""
+        if self.sessions_json:
+            legacy = self._legacy_sessions()
+            return legacy[session_index] if 0 <= session_index < len(legacy) else None
+        row = db.session.query(TrainingProgramSession).filter_by(
+            training_program_id=self.id, session_index=session_index
+        ).first() if self.id else None
+        return row.to_session() if row else None
+    
+    def session_count(self):
+        if self.sessions_json:
+            return len(self._legacy_sessions())
+        if not self.id:
+            return len(self.session_rows)
+        return db.session.query(TrainingProgramSession).filter_by(training_program_id=self.id).count()
+    
     def set_sessions(self, sessions_list):
-        """Set sessions from list to JSON string"""
-        self.sessions = json.dumps(sessions_list, ensure_ascii=False)
+        """Replace all sessions. Rows are updated in place by index, extra rows are deleted."""
+        # Non-dict entries become empty sessions so indexes (used by notes and completions) do not shift
+        sessions_list = [s if isinstance(s, dict) else {} for s in (sessions_list or [])]
+        exercise_ids = _exercise_ids_by_name(sessions_list)
+        rows = self.session_rows
+        for index, session in enumerate(sessions_list):
+            if index < len(rows):
+                rows[index].set_session(session, exercise_ids)
+            else:
+                row = TrainingProgramSession(session_index=index)
+                row.set_session(session, exercise_ids)
+                rows.append(row)
+        del rows[len(sessions_list):]
+        self.sessions_json = None
+    
+    def append_sessions(self, sessions_list):
+        """Add sessions after the last one without rewriting existing ones (program must be saved)"""
+        if self.sessions_json:
+            # Not migrated yet: move the legacy JSON sessions to rows first
+            self.set_sessions(self._legacy_sessions())
+            db.session.flush()
+        sessions_list = [s if isinstance(s, dict) else {} for s in (sessions_list or [])]
+        exercise_ids = _exercise_ids_by_name(sessions_list)
+        start = self.session_count()
+        for offset, session in enumerate(sessions_list):
+            row = TrainingProgramSession(training_program_id=self.id, session_index=start + offset)
+            row.set_session(session, exercise_ids)
+            db.session.add(row)
     
     def to_dict(self, language='fa'):
         """Convert program to dictionary based on language"""
@@ -406,6 +461,106 @@ class TrainingProgram(db.Model):
         }
 
 
+def _exercise_name(exercise, lang):
+    return (exercise.get(f'name_{lang}') or exercise.get('name') or '').strip()
+
+
+def _exercise_ids_by_name(sessions_list):
+    """Map exercise names (fa and en) used in the sessions to Exercise library ids, in one query."""
+    names = set()
+    for session in sessions_list:
+        for ex in session.get('exercises') or []:
+            if isinstance(ex, dict):
+                names.update(n for n in (_exercise_name(ex, 'fa'), _exercise_name(ex, 'en')) if n)
+    if not names:
+        return {}
+    with db.session.no_autoflush:
+        rows = db.session.query(Exercise.id, Exercise.name_fa, Exercise.name_en).filter(
+            or_(Exercise.name_fa.in_(names), Exercise.name_en.in_(names))
+        ).all()
+    ids = {}
+    for exercise_id, name_fa, name_en in rows:
+        for name in (name_fa, name_en):
+            if name and name.strip() in names:
+                ids.setdefault(name.strip(), exercise_id)
+    return ids
+
+
+class TrainingProgramSession(db.Model):
+    """One session of a training program. data holds the session object without its exercises."""
+    __tablename__ = 'training_program_sessions'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    training_program_id = db.Column(db.Integer, db.ForeignKey('training_programs.id', ondelete='CASCADE'), nullable=False)
+    session_index = db.Column(db.Integer, nullable=False)  # 0-based, same index as TrainingActionNote.session_index
+    data = db.Column(db.Text, nullable=False)  # JSON object (name_fa, week, day, warming, cooldown, ...)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    exercise_rows = db.relationship(
+        'TrainingProgramSessionExercise', order_by='TrainingProgramSessionExercise.exercise_index',
+        cascade='all, delete-orphan', lazy='selectin'
+    )
+    
+    __table_args__ = (
+        db.UniqueConstraint('training_program_id', 'session_index', name='uq_program_session_index'),
+    )
+    
+    def to_session(self):
+        try:
+            session = json.loads(self.data) if self.data else {}
+        except:
+            session = {}
+        if 'exercises' in session:
+            session['exercises'] = [row.to_exercise() for row in self.exercise_rows]
+        return session
+    
+    def set_session(self, session, exercise_ids=None):
+        """Store a session dict; its 'exercises' go to exercise rows (updated in place by index)."""
+        exercise_ids = exercise_ids if exercise_ids is not None else _exercise_ids_by_name([session])
+        exercises = [ex if isinstance(ex, dict) else {} for ex in (session.get('exercises') or [])]
+        # Keep the key (and its position) so to_session() rebuilds the same object
+        stored = dict(session)
+        if 'exercises' in stored:
+            stored['exercises'] = None
+        self.data = json.dumps(stored, ensure_ascii=False)
+        rows = self.exercise_rows
+        for index, ex in enumerate(exercises):
+            if index >= len(rows):
+                rows.append(TrainingProgramSessionExercise(exercise_index=index))
+            rows[index].set_exercise(ex, exercise_ids)
+        del rows[len(exercises):]
+
+
+class TrainingProgramSessionExercise(db.Model):
+    """One exercise of a program session, linked to the Exercise library by name when it matches."""
+    __tablename__ = 'training_program_session_exercises'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    session_id = db.Column(db.Integer, db.ForeignKey('training_program_sessions.id', ondelete='CASCADE'), nullable=False)
+    exercise_index = db.Column(db.Integer, nullable=False)  # 0-based, same index as TrainingActionNote.exercise_index
+    exercise_id = db.Column(db.Integer, db.ForeignKey('exercises.id', ondelete='SET NULL'), nullable=True, index=True)
+    name_fa = db.Column(db.String(200), index=True)
+    name_en = db.Column(db.String(200), index=True)
+    data = db.Column(db.Text, nullable=False)  # JSON object as in the program (sets, reps, rest, instructions, ...)
+    
+    __table_args__ = (
+        db.UniqueConstraint('session_id', 'exercise_index', name='uq_session_exercise_index'),
+    )
+    
+    def to_exercise(self):
+        try:
+            return json.loads(self.data) if self.data else {}
+        except:
+            return {}
+    
+    def set_exercise(self, exercise, exercise_ids=None):
+        self.name_fa = _exercise_name(exercise, 'fa')[:200] or None
+        self.name_en = _exercise_name(exercise, 'en')[:200] or None
+        ids = exercise_ids or {}
+        self.exercise_id = ids.get(self.name_en or '') or ids.get(self.name_fa or '')
+        self.data = json.dumps(exercise, ensure_ascii=False)
+
+
 class PurchaseOrder(db.Model):
     """Training program purchase order (no payment gateway yet)."""
     __tablename__ = 'purchase_orders'
@@ -475,6 +630,7 @@ class MemberWeeklyGoal(db.Model):
     
     __table_args__ = (
         db.UniqueConstraint('user_id', 'training_program_id', 'week_number', name='uq_member_program_week'),
+        db.Index('idx_member_weekly_goals_program', 'training_program_id'),
     )
 
 
@@ -522,7 +678,7 @@ class MemberTrainingActionCompletion(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     training_program_id = db.Column(db.Integer, db.ForeignKey('training_programs.id'), nullable=False)
-    session_index = db.Column(db.Integer, nullable=False)  # 0-based index in program.sessions
+    session_index = db.Column(db.Integer, nullable=False)  # 0-based index in program.get_sessions()
     exercise_index = db.Column(db.Integer, nullable=False)  # 0-based index in session.exercises
     completed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
     
@@ -550,7 +706,10 @@ class Notification(db.Model):
     read_at = db.Column(db.DateTime, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
-    __table_args__ = (db.Index('idx_notifications_user_read', 'user_id', 'read_at'),)
+    __table_args__ = (
+        db.Index('idx_notifications_user_read', 'user_id', 'read_at'),
+        db.Index('idx_notifications_user_created', 'user_id', 'created_at'),
+    )
 
 
 class TrainingActionNote(db.Model):
@@ -648,6 +807,7 @@ class WebsiteKBChunk(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     chunk_index = db.Column(db.Integer, nullable=False)
     text = db.Column(db.Text, nullable=False)
+    content_hash = db.Column(db.String(64), index=True)  # sha256 of embedding model + text; unchanged chunks are not re-embedded
     embedding_json = db.Column(db.Text, nullable=False)  # JSON array of floats
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
@@ -3,10 +3,18 @@ Action planner service for AI-driven actions with strict JSON output.
 Uses current_app.extensions['sqlalchemy'] for db access to avoid Flask app context issues.
 """
 
+import copy
+import hashlib
 import json
+import logging
+import os
 import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 from flask import current_app
 
@@ -18,10 +26,60 @@ from models_workout_log import ProgressEntry
 def _db():
     """Get SQLAlchemy instance from current Flask app context."""
     return current_app.extensions['sqlalchemy']
-from services.ai_provider import chat_completion
-from services.website_kb import search_kb
+from services.ai_provider import chat_completion, chat_completion_stream
+from services.website_kb import search_kb, get_kb_version
+from services.embedding_cache import normalize_text
+from services import tracing
+from services.prompt_budget import BUDGETS, PromptBuilder, estimate_tokens, static_prompt
 from services.ai_coach_agent import PersianFitnessCoachAI
 
+logger = logging.getLogger(__name__)
+
+# Deterministic intent fast path: short messages that match exactly one keyword intent are answered
+# by running that intent's actions and formatter, without the planner LLM or KB search.
+CHAT_FAST_PATH_ENABLED = (os.getenv("CHAT_FAST_PATH_ENABLED", "1").strip().lower() not in ("0", "false", "no"))
+try:
+    CHAT_FAST_PATH_MAX_WORDS = int(os.getenv("CHAT_FAST_PATH_MAX_WORDS", "12"))
+except ValueError:
+    CHAT_FAST_PATH_MAX_WORDS = 12
+_route_counts: Dict[str, int] = {}
+# Planner stage latencies: stage -> [count, total_ms, max_ms]
+_stage_stats: Dict[str, List[float]] = {}
+_kb_deadline_misses = 0
+_stats_lock = threading.Lock()
+
+# Planner output cache: parsed plan (assistant_response + actions, never executed results) keyed by
+# normalized message, language, role, profile summary hash and KB version (shared by all workers, so a
+# reindex anywhere invalidates plans built on the old snippets). Actions still run live.
+try:
+    PLANNER_CACHE_SIZE = int(os.getenv("PLANNER_CACHE_SIZE", "500"))
+    PLANNER_CACHE_TTL = float(os.getenv("PLANNER_CACHE_TTL", "600"))
+except ValueError:
+    PLANNER_CACHE_SIZE, PLANNER_CACHE_TTL = 500, 600.0
+_plan_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_plan_cache_stats = {'hits': 0, 'misses': 0}
+
+# KB snippets are fetched only on a plan cache miss; the planner waits at most this long for them
+try:
+    PLANNER_KB_DEADLINE_SECONDS = float(os.getenv("PLANNER_KB_DEADLINE_SECONDS", "1.5"))
+except ValueError:
+    PLANNER_KB_DEADLINE_SECONDS = 1.5
+# Planner KB retrieval has its own threads so it never queues behind actions on the action pool
+try:
+    PLANNER_KB_WORKERS = max(1, int(os.getenv("PLANNER_KB_WORKERS", "4")))
+except ValueError:
+    PLANNER_KB_WORKERS = 4
+_kb_pool: Optional[ThreadPoolExecutor] = None
+_kb_pool_lock = threading.Lock()
+
+# Read-only actions of one turn run concurrently on this many shared threads (1 = always serial)
+try:
+    ACTION_PARALLELISM = max(1, int(os.getenv("ACTION_PARALLELISM", "4")))
+except ValueError:
+    ACTION_PARALLELISM = 4
+_action_pool: Optional[ThreadPoolExecutor] = None
+_action_pool_lock = threading.Lock()
+
 
 ALLOWED_ACTIONS = (
     'search_exercises',
@@ -41,64 +99,80 @@ ALLOWED_ACTIONS = (
     'get_member_progress',
 )
 
+# read_only actions do not write to the DB and may run concurrently; the others run one at a time, in order
 ACTION_SPECS = {
     'search_exercises': {
+        'read_only': True,
         'required': [],
         'optional': ['query', 'target_muscle', 'level', 'intensity', 'max_results', 'language'],
     },
     'create_workout_plan': {
+        'read_only': True,
         'required': [],
         'optional': ['month', 'target_muscle', 'language'],
     },
     'suggest_training_plans': {
+        'read_only': True,
         'required': [],
         'optional': ['language', 'max_results'],
     },
     'update_user_profile': {
+        'read_only': False,
         'required': ['fields'],
         'optional': ['user_id'],
     },
     'progress_check': {
+        'read_only': False,
         'required': ['mode'],
         'optional': ['request_id', 'status'],
     },
     'trainer_message': {
+        'read_only': False,
         'required': ['body'],
         'optional': ['recipient_id'],
     },
     'site_settings': {
+        'read_only': False,
         'required': ['fields'],
         'optional': [],
     },
     'schedule_meeting': {
+        'read_only': True,
         'required': [],
         'optional': ['appointment_date', 'appointment_time', 'duration', 'notes', 'property_id'],
     },
     'schedule_appointment': {
+        'read_only': True,
         'required': [],
         'optional': ['appointment_date', 'appointment_time', 'duration', 'notes', 'property_id'],
     },
     'get_dashboard_progress': {
+        'read_only': True,
         'required': [],
         'optional': ['language', 'fields'],
     },
     'add_progress_entry': {
+        'read_only': False,
         'required': [],
         'optional': ['weight_kg', 'chest_cm', 'waist_cm', 'hips_cm', 'arm_left_cm', 'arm_right_cm', 'thigh_left_cm', 'thigh_right_cm', 'form_level', 'body_fat_percentage', 'muscle_mass_kg'],
     },
     'get_todays_training': {
+        'read_only': True,
         'required': [],
         'optional': ['language'],
     },
     'get_dashboard_tab_info': {
+        'read_only': True,
         'required': ['tab'],
         'optional': ['language'],
     },
     'get_trainers_info': {
+        'read_only': True,
         'required': [],
         'optional': ['language'],
     },
     'get_member_progress': {
+        'read_only': True,
         'required': [],
         'optional': ['member_id', 'member_username', 'language'],
     },
@@ -149,16 +223,42 @@ def _build_user_profile_summary(user: User) -> str:
     return "; ".join(parts) if parts else "No profile details; assume beginner, gym_access=true."
 
 
-def _build_prompt(message: str, language: str, role: str, user_profile_summary: str = "") -> Tuple[str, str]:
-    system = (
+# Planner action schemas, in prompt order (schedule_meeting / schedule_appointment share a line)
+_ACTION_SCHEMAS = (
+    ('search_exercises', "- search_exercises: params { query?, target_muscle?, level?, intensity?, max_results?, language? }"),
+    ('create_workout_plan', "- create_workout_plan: params { month?, target_muscle?, language? }"),
+    ('suggest_training_plans', "- suggest_training_plans: params { language?, max_results? } - returns plans matched to user profile"),
+    ('update_user_profile', "- update_user_profile: params { user_id?, fields (object) }"),
+    ('progress_check', "- progress_check: params { mode ('request'|'respond'), request_id?, status? }"),
+    ('trainer_message', "- trainer_message: params { recipient_id?, body }"),
+    ('site_settings', "- site_settings: params { fields (object) }"),
+    ('schedule_meeting', "- schedule_meeting / schedule_appointment: params { appointment_date?, appointment_time?, duration?, notes?, property_id? }"),
+    ('get_dashboard_progress', "- get_dashboard_progress: params { language?, fields? } - use when user asks about BMI, weight, progress, dashboard, روند تغییرات, پیشرفت. Returns profile weight/height, BMI, progress entries. ALWAYS ask if they want to add new weight to Progress Trend."),
+    ('add_progress_entry', "- add_progress_entry: params { weight_kg?, chest_cm?, waist_cm?, hips_cm?, arm_left_cm?, arm_right_cm?, thigh_left_cm?, thigh_right_cm? } - use when user wants to add/record weight or measurements to Progress Trend. Extract numbers from message (e.g. 'add 76 kg' -> weight_kg: 76)."),
+    ('get_todays_training', "- get_todays_training: params { language? } - use when user asks 'what is my training today', 'جلسه امروز', 'برنامه امروز', 'today workout', 'my workout today'. Returns next session to do."),
+    ('get_dashboard_tab_info', "- get_dashboard_tab_info: params { tab: 'psychology-test'|'online-lab', language? } - use when user asks about Psychology Test (تست روانشناسی), Online Laboratory (آزمایشگاه آنلاین), or what info those tabs need. tab='psychology-test' or 'online-lab'."),
+    ('get_trainers_info', "- get_trainers_info: params { language? } - use when admin or assistant asks about trainers, assistants, مربی‌ها, دستیاران, list of trainers, my assigned members. Admin sees all assistants; assistant sees only their own info (their trainees count). Admin/assistant only."),
+    ('get_member_progress', "- get_member_progress: params { member_id?, member_username?, language? } - use when admin or assistant asks about a specific member's progress, weight, BMI, situation, وضعیت عضو, پیشرفت عضو. Assistant can only query their assigned members (assigned_to=assistant). Admin can query any member. Provide member_id or member_username to identify the member."),
+)
+# Staff-only actions are left out of the catalog sent for other roles. The same roles pass the trainers
+# intent rule and the staff-only action executors.
+STAFF_ROLES = ('admin', 'coach')
+STAFF_ONLY_ACTIONS = ('get_trainers_info', 'get_member_progress')
+
+
+@static_prompt
+def _planner_system_prompt(staff: bool) -> str:
+    """Planner instructions plus the action catalog. Request-independent (one text per role group), so
+    providers with prompt caching reuse it across turns."""
+    actions = [a for a in ALLOWED_ACTIONS if staff or a not in STAFF_ONLY_ACTIONS]
+    schemas = [line for action, line in _ACTION_SCHEMAS if action in actions]
+    return (
         "You are an action planner for a fitness platform. "
         "Return ONLY valid JSON with keys: assistant_response (string) and actions (array). "
         "CRITICAL: The assistant_response MUST be written in English only. "
         "Each action must be an object with keys: action (string), params (object). "
         "Allowed actions: "
-        "search_exercises, create_workout_plan, suggest_training_plans, update_user_profile, "
-        "progress_check, trainer_message, site_settings, schedule_meeting, schedule_appointment, "
-        "get_dashboard_progress, add_progress_entry, get_todays_training, get_dashboard_tab_info, get_trainers_info, get_member_progress. "
+        + ", ".join(actions) + ". "
         "Do not include markdown or explanations. "
         "If no action is needed, return an empty actions array. "
         "IMPORTANT: Perform actions directly. Do NOT ask the user to confirm or clarify intent. "
@@ -166,32 +266,32 @@ def _build_prompt(message: str, language: str, role: str, user_profile_summary:
         "create_workout_plan: ONLY when user has ALREADY bought a plan and asks to generate/build it (e.g. 'برنامه‌ام رو بساز', 'برنامه خریدم بساز', 'generate my workout'). Never use for 'میخوام برنامه بخرم' or 'what do you suggest'. "
         "When the user asks for exercises (e.g. 'تمرینات سینه', 'chest exercises'), use search_exercises with query or target_muscle. "
         "Only use respond (empty actions) when a required parameter is genuinely missing (e.g. recipient_id for trainer_message). "
-        "For schedule_meeting/schedule_appointment: use relative date (e.g. tomorrow, in 2 days) and relative time (e.g. morning, afternoon, evening); the system will resolve them. Do NOT ask the user to specify exact date and time."
-    )
-    profile_block = f"\nUser profile (from KB/DB): {user_profile_summary}\n" if user_profile_summary else ""
-    user = (
-        f"UserRole: {role}\n"
-        f"Language: {language}\n"
-        f"Message: {message}\n"
-        f"{profile_block}"
+        "For schedule_meeting/schedule_appointment: use relative date (e.g. tomorrow, in 2 days) and relative time (e.g. morning, afternoon, evening); the system will resolve them. Do NOT ask the user to specify exact date and time.\n"
         "Action schemas:\n"
-        "- search_exercises: params { query?, target_muscle?, level?, intensity?, max_results?, language? }\n"
-        "- create_workout_plan: params { month?, target_muscle?, language? }\n"
-        "- suggest_training_plans: params { language?, max_results? } - returns plans matched to user profile\n"
-        "- update_user_profile: params { user_id?, fields (object) }\n"
-        "- progress_check: params { mode ('request'|'respond'), request_id?, status? }\n"
-        "- trainer_message: params { recipient_id?, body }\n"
-        "- site_settings: params { fields (object) }\n"
-        "- schedule_meeting / schedule_appointment: params { appointment_date?, appointment_time?, duration?, notes?, property_id? }\n"
-        "- get_dashboard_progress: params { language?, fields? } - use when user asks about BMI, weight, progress, dashboard, روند تغییرات, پیشرفت. Returns profile weight/height, BMI, progress entries. ALWAYS ask if they want to add new weight to Progress Trend.\n"
-        "- add_progress_entry: params { weight_kg?, chest_cm?, waist_cm?, hips_cm?, arm_left_cm?, arm_right_cm?, thigh_left_cm?, thigh_right_cm? } - use when user wants to add/record weight or measurements to Progress Trend. Extract numbers from message (e.g. 'add 76 kg' -> weight_kg: 76).\n"
-        "- get_todays_training: params { language? } - use when user asks 'what is my training today', 'جلسه امروز', 'برنامه امروز', 'today workout', 'my workout today'. Returns next session to do.\n"
-        "- get_dashboard_tab_info: params { tab: 'psychology-test'|'online-lab', language? } - use when user asks about Psychology Test (تست روانشناسی), Online Laboratory (آزمایشگاه آنلاین), or what info those tabs need. tab='psychology-test' or 'online-lab'.\n"
-        "- get_trainers_info: params { language? } - use when admin or assistant asks about trainers, assistants, مربی‌ها, دستیاران, list of trainers, my assigned members. Admin sees all assistants; assistant sees only their own info (their trainees count). Admin/assistant only.\n"
-        "- get_member_progress: params { member_id?, member_username?, language? } - use when admin or assistant asks about a specific member's progress, weight, BMI, situation, وضعیت عضو, پیشرفت عضو. Assistant can only query their assigned members (assigned_to=assistant). Admin can query any member. Provide member_id or member_username to identify the member.\n"
-        "Return JSON now."
+        + "\n".join(schemas)
+    )
+
+
+def _build_prompt(
+    message: str,
+    language: str,
+    role: str,
+    user_profile_summary: str = "",
+    kb_snippets: Optional[List[Dict[str, Any]]] = None,
+) -> Tuple[str, str]:
+    """(system, user) planner prompts. The system prompt is static per role group; the user prompt holds
+    the request, the profile summary and the KB snippets (best first) within their token budgets."""
+    system = _planner_system_prompt(role in STAFF_ROLES)
+    builder = PromptBuilder(separator="\n")
+    builder.add('request', f"UserRole: {role}\nLanguage: {language}\nMessage: {message}")
+    builder.add('profile', user_profile_summary, BUDGETS['profile'], header="User profile (from KB/DB): ")
+    builder.add_items(
+        'kb', [s.get('text') or '' for s in (kb_snippets or [])], BUDGETS['kb'],
+        item_max_tokens=BUDGETS['kb_item'], header="KB Snippets:\n", prefix="- ",
     )
-    return system, user
+    builder.add('instruction', "Return JSON now.")
+    logger.debug("[Planner] prompt tokens ~%s + system ~%s", builder.report(), estimate_tokens(system))
+    return system, builder.build()
 
 
 def _extract_json(text: str) -> Optional[str]:
@@ -243,17 +343,124 @@ def _normalize_actions(payload: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], L
     return actions, errors
 
 
-def plan_actions(message: str, user: User, language: str) -> Dict[str, Any]:
+def _record_stage(stage: str, started: float) -> float:
+    """
+    Add one planner stage timing (since started, a time.perf_counter() value) to the process stats and,
+    as a planner.<stage> span, to the request trace. Returns the elapsed ms.
+    """
+    tracing.add_span('planner.' + stage, started)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    with _stats_lock:
+        entry = _stage_stats.setdefault(stage, [0, 0.0, 0.0])
+        entry[0] += 1
+        entry[1] += elapsed_ms
+        entry[2] = max(entry[2], elapsed_ms)
+    return elapsed_ms
+
+
+def _search_kb_in_app(app, trace, message: str) -> List[Dict[str, Any]]:
+    with app.app_context(), tracing.use_trace(trace):
+        started = time.perf_counter()
+        try:
+            return search_kb(message, top_k=3)
+        finally:
+            _record_stage('kb_search', started)
+
+
+def _planner_cache_key(message: str, language: str, role: str, profile_summary: str) -> str:
+    raw = "\x1f".join([
+        normalize_text(message), language or '', role, profile_summary, get_kb_version(),
+    ])
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def _plan_cache_get(key: str) -> Optional[Dict[str, Any]]:
+    if PLANNER_CACHE_SIZE <= 0:
+        return None
+    now = time.time()
+    with _stats_lock:
+        entry = _plan_cache.get(key)
+        if entry is not None and entry[0] >= now:
+            _plan_cache.move_to_end(key)
+            _plan_cache_stats['hits'] += 1
+            return copy.deepcopy(entry[1])
+        if entry is not None:
+            del _plan_cache[key]
+        _plan_cache_stats['misses'] += 1
+    return None
+
+
+def _plan_cache_put(key: str, plan: Dict[str, Any]) -> None:
+    # Only clean parses are cached; fallbacks (provider down, invalid JSON) must be retried next time
+    if PLANNER_CACHE_SIZE <= 0 or plan.get('errors'):
+        return
+    with _stats_lock:
+        _plan_cache[key] = (time.time() + PLANNER_CACHE_TTL, copy.deepcopy(plan))
+        _plan_cache.move_to_end(key)
+        while len(_plan_cache) > PLANNER_CACHE_SIZE:
+            _plan_cache.popitem(last=False)
+
+
+def _get_kb_pool() -> ThreadPoolExecutor:
+    global _kb_pool
+    if _kb_pool is None:
+        with _kb_pool_lock:
+            if _kb_pool is None:
+                _kb_pool = ThreadPoolExecutor(max_workers=PLANNER_KB_WORKERS, thread_name_prefix='planner-kb')
+    return _kb_pool
+
+
+def _begin_planner(message: str, user: User, language: str) -> Dict[str, Any]:
+    """
+    First half of planner prompt building: load the profile and compute the plan cache key. Nothing is
+    retrieved from the KB yet, so a cache hit costs no query embedding or KB search.
+    Returns the state _finish_planner_messages needs.
+    """
+    started = stage_started = time.perf_counter()
     profile_summary = _build_user_profile_summary(user)
-    system, user_msg = _build_prompt(
-        message, language, getattr(user, 'role', 'member') or 'member', profile_summary
+    role = getattr(user, 'role', 'member') or 'member'
+    return {
+        'started': started,
+        'profile_summary': profile_summary,
+        'profile_ms': _record_stage('profile', stage_started),
+        'role': role,
+        'cache_key': _planner_cache_key(message, language, role, profile_summary),
+    }
+
+
+def _finish_planner_messages(message: str, language: str, prep: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    Build (system, user) planner prompts after a plan cache miss: action catalog, profile summary and KB
+    snippets. KB retrieval starts here, on the KB pool, and is waited for only PLANNER_KB_DEADLINE_SECONDS;
+    a miss sends the prompt without snippets (counted in kb_deadline_misses).
+    """
+    global _kb_deadline_misses
+    started = prep['started']
+
+    stage_started = time.perf_counter()
+    kb_future = _get_kb_pool().submit(
+        _search_kb_in_app, current_app._get_current_object(), tracing.current_trace(), message
     )
-    kb_snippets = search_kb(message, top_k=3)
-    if kb_snippets:
-        snippet_texts = [f"- {s.get('text', '')}" for s in kb_snippets if s.get('text')]
-        if snippet_texts:
-            user_msg = user_msg + "\n\nKB Snippets:\n" + "\n".join(snippet_texts)
-    raw = chat_completion(system, user_msg, max_tokens=700)
+    remaining = max(0.0, PLANNER_KB_DEADLINE_SECONDS - (time.perf_counter() - stage_started))
+    try:
+        kb_snippets = kb_future.result(timeout=remaining)
+    except FutureTimeout:
+        kb_snippets = []
+        with _stats_lock:
+            _kb_deadline_misses += 1
+        logger.warning("[Planner] KB retrieval missed %ss deadline, planning without snippets", PLANNER_KB_DEADLINE_SECONDS)
+    except Exception as e:
+        kb_snippets = []
+        logger.warning("[Planner] KB retrieval failed: %s", e)
+    kb_wait_ms = _record_stage('kb_wait', stage_started)
+    system, user_msg = _build_prompt(message, language, prep['role'], prep['profile_summary'], kb_snippets)
+    total_ms = _record_stage('prepare', started)
+    logger.info("[Planner] prepare %.0fms (profile %.0fms, kb wait %.0fms)", total_ms, prep['profile_ms'], kb_wait_ms)
+    return system, user_msg
+
+
+def _parse_plan(raw: Optional[str], language: str) -> Dict[str, Any]:
+    """Turn raw planner LLM output into {assistant_response, actions, errors}."""
     if not raw:
         return {
             'assistant_response': _fallback_response(language),
@@ -286,6 +493,68 @@ def plan_actions(message: str, user: User, language: str) -> Dict[str, Any]:
     }
 
 
+def plan_actions(message: str, user: User, language: str) -> Dict[str, Any]:
+    prep = _begin_planner(message, user, language)
+    cached = _plan_cache_get(prep['cache_key'])
+    if cached is not None:
+        return cached
+    system, user_msg = _finish_planner_messages(message, language, prep)
+    started = time.perf_counter()
+    raw = chat_completion(system, user_msg, max_tokens=700)
+    _record_stage('llm', started)
+    plan = _parse_plan(raw, language)
+    _plan_cache_put(prep['cache_key'], plan)
+    return plan
+
+
+class _AssistantTextExtractor:
+    """Incrementally decode the assistant_response string value from streamed planner JSON,
+    so its text can be forwarded before the whole JSON object has arrived."""
+
+    _KEY_RE = re.compile(r'"assistant_response"\s*:\s*"')
+
+    def __init__(self):
+        self._raw = ''
+        self._pos = -1  # index of next undecoded char inside the string value; -1 until key is seen
+        self._done = False
+
+    def feed(self, piece: str) -> str:
+        """Add a piece of raw output; return newly decoded assistant text (may be empty)."""
+        self._raw += piece
+        if self._done:
+            return ''
+        if self._pos < 0:
+            m = self._KEY_RE.search(self._raw)
+            if not m:
+                return ''
+            self._pos = m.end()
+        out = []
+        raw = self._raw
+        i = self._pos
+        while i < len(raw):
+            ch = raw[i]
+            if ch == '"':
+                self._done = True
+                i += 1
+                break
+            if ch == '\\':
+                if i + 1 >= len(raw):
+                    break
+                seq_len = 6 if raw[i + 1] == 'u' else 2
+                if i + seq_len > len(raw):
+                    break
+                try:
+                    out.append(json.loads('"' + raw[i:i + seq_len] + '"'))
+                except ValueError:
+                    pass
+                i += seq_len
+                continue
+            out.append(ch)
+            i += 1
+        self._pos = i
+        return ''.join(out)
+
+
 def _format_dashboard_progress_response(results: List[Dict[str, Any]], language: str) -> Optional[str]:
     """Build user-facing response when get_dashboard_progress succeeded. English only."""
     for r in results:
@@ -534,9 +803,8 @@ def _extract_goal_from_message(message: str) -> Optional[str]:
     return None
 
 
-def plan_and_execute(message: str, user: User, language: str) -> Dict[str, Any]:
-    plan = plan_actions(message, user, language)
-    actions = plan.get('actions', [])
+def _apply_intent_rules(message: str, user: User, language: str, actions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Correct the planner's actions with keyword rules (inject/replace actions the LLM missed)."""
     # If user clearly wants to buy/suggest a program but planner returned wrong action, ensure suggest_training_plans runs
     if _is_buy_or_suggest_program_message(message):
         has_suggest = any(a.get('action') == 'suggest_training_plans' for a in actions)
@@ -559,7 +827,7 @@ def plan_and_execute(message: str, user: User, language: str) -> Dict[str, Any]:
         if not has_training:
             actions = actions + [{'action': 'get_todays_training', 'params': {'language': language}}]
     # If admin/assistant asks about trainers but planner didn't return get_trainers_info, inject it
-    if getattr(user, 'role', None) in ('admin', 'coach') and _is_trainers_info_message(message):
+    if getattr(user, 'role', None) in STAFF_ROLES and _is_trainers_info_message(message):
         has_trainers = any(a.get('action') == 'get_trainers_info' for a in actions)
         if not has_trainers:
             actions = actions + [{'action': 'get_trainers_info', 'params': {'language': language}}]
@@ -585,7 +853,104 @@ def plan_and_execute(message: str, user: User, language: str) -> Dict[str, Any]:
                     actions_list.insert(i, update_action)
                     break
             actions = actions_list
+    return actions
+
+
+def _is_trainers_info_request(message: str, user: User) -> bool:
+    return getattr(user, 'role', None) in STAFF_ROLES and _is_trainers_info_message(message)
+
+
+# (intent name, detector(message, user)). Actions come from _apply_intent_rules so both paths agree.
+_FAST_PATH_INTENTS = (
+    ('todays_training', lambda m, u: _is_todays_training_message(m)),
+    ('dashboard_progress', lambda m, u: _is_dashboard_progress_message(m)),
+    ('suggest_plans', lambda m, u: _is_buy_or_suggest_program_message(m)),
+    ('trainers_info', _is_trainers_info_request),
+    ('dashboard_tab', lambda m, u: _is_dashboard_tab_message(m)),
+)
+_DIGITS_RE = re.compile(r'[0-9\u06f0-\u06f9\u0660-\u0669]')
+
+
+def _route_intent(message: str, user: User, language: str) -> Optional[Tuple[str, List[Dict[str, Any]]]]:
+    """
+    Return (intent, actions) when the message is a high-confidence match for one keyword intent, else None.
+    Long messages, messages with numbers (likely data entry: "my weight is 80"), member lookups and
+    messages matching several intents go to the LLM planner.
+    """
+    if not CHAT_FAST_PATH_ENABLED or not message or not isinstance(message, str):
+        return None
+    m = message.strip()
+    if not m or len(m.split()) > CHAT_FAST_PATH_MAX_WORDS or _DIGITS_RE.search(m):
+        return None
+    if _is_member_progress_message(m):
+        return None
+    matched = [name for name, detect in _FAST_PATH_INTENTS if detect(m, user)]
+    if len(matched) != 1:
+        return None
+    actions = _apply_intent_rules(m, user, language, [])
+    if not actions:
+        return None
+    return matched[0], actions
+
+
+def _count_route(route: str) -> None:
+    with _stats_lock:
+        _route_counts[route] = _route_counts.get(route, 0) + 1
+
+
+def get_route_stats() -> Dict[str, Any]:
+    """
+    How chat turns were answered in this process (fast:<intent>, fast_fallback:<intent>, llm), KB deadline
+    misses, planner cache hits and per-stage planner latency (profile, kb_search, kb_wait, prepare, llm, actions).
+    """
+    with _stats_lock:
+        counts = dict(_route_counts)
+        stages = {
+            stage: {'count': n, 'avg_ms': round(total / n, 1) if n else None, 'max_ms': round(peak, 1)}
+            for stage, (n, total, peak) in _stage_stats.items()
+        }
+        kb_misses = _kb_deadline_misses
+        cache = dict(_plan_cache_stats, size=len(_plan_cache))
+    total = sum(counts.values())
+    fast = sum(v for k, v in counts.items() if k.startswith('fast:'))
+    return {
+        'counts': counts,
+        'total': total,
+        'fast_path_ratio': round(fast / total, 3) if total else None,
+        'enabled': CHAT_FAST_PATH_ENABLED,
+        'kb_deadline_misses': kb_misses,
+        'kb_deadline_seconds': PLANNER_KB_DEADLINE_SECONDS,
+        'stages': stages,
+        'plan_cache': dict(cache, max_entries=PLANNER_CACHE_SIZE, ttl_seconds=PLANNER_CACHE_TTL),
+    }
+
+
+def _try_fast_path(message: str, user: User, language: str):
+    """
+    Run a routed intent. Returns (actions, results, response), None when no intent was routed.
+    response is None when the actions ran but the LLM planner must answer; pass the tuple on to
+    _iter_remaining_results so those actions are not run a second time.
+    """
+    routed = _route_intent(message, user, language)
+    if not routed:
+        return None
+    intent, actions = routed
+    started = time.perf_counter()
     results = execute_actions(actions, user, language, message)
+    _record_stage('fast_path', started)
+    response = _finalize_response({'assistant_response': None, 'actions': actions, 'errors': []}, results, language)
+    if not response.get('assistant_response'):
+        # Action failed or returned nothing a formatter could use: let the planner handle the turn
+        _count_route('fast_fallback:' + intent)
+        logger.info("[Chat Route] fast path %s produced no response, falling back to planner", intent)
+        return actions, results, None
+    _count_route('fast:' + intent)
+    return actions, results, response
+
+
+@tracing.traced('planner.format')
+def _finalize_response(plan: Dict[str, Any], results: List[Dict[str, Any]], language: str) -> Dict[str, Any]:
+    """Pick the final assistant text (formatted action responses override the planner text)."""
     assistant_response = plan.get('assistant_response')
     # Override with formatted response when suggest_training_plans succeeded
     formatted = _format_suggest_plans_response(results, language)
@@ -624,6 +989,87 @@ def plan_and_execute(message: str, user: User, language: str) -> Dict[str, Any]:
     }
 
 
+def _iter_remaining_results(
+    actions: List[Dict[str, Any]], fast, user: User, language: str, message: str
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    iter_action_results for the planner's actions after a fast-path fallback: an action identical to one
+    the fast path already ran (same name and params) reuses its result instead of running again.
+    Reused results are yielded first, then the rest as they execute.
+    """
+    done = list(zip(fast[0], fast[1])) if fast else []
+    pending: List[int] = []
+    for idx, action_item in enumerate(actions):
+        match = next((i for i, (ran, _) in enumerate(done) if ran == action_item), None)
+        if match is None:
+            pending.append(idx)
+        else:
+            yield idx, done.pop(match)[1]
+    for pos, result in iter_action_results([actions[idx] for idx in pending], user, language, message):
+        yield pending[pos], result
+
+
+def plan_and_execute(message: str, user: User, language: str) -> Dict[str, Any]:
+    fast = _try_fast_path(message, user, language)
+    if fast and fast[2]:
+        return fast[2]
+    _count_route('llm')
+    plan = plan_actions(message, user, language)
+    actions = _apply_intent_rules(message, user, language, plan.get('actions', []))
+    started = time.perf_counter()
+    results: List[Optional[Dict[str, Any]]] = [None] * len(actions)
+    for idx, result in _iter_remaining_results(actions, fast, user, language, message):
+        results[idx] = result
+    _record_stage('actions', started)
+    return _finalize_response(plan, results, language)
+
+
+def plan_and_execute_stream(message: str, user: User, language: str) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Streaming variant of plan_and_execute. Yields (event, data) tuples:
+    'delta' {text} - assistant text as the planner LLM produces it (none on the intent fast path),
+    'actions' {actions} - the actions about to run,
+    'result' {index, result} - one per executed action,
+    'done' - the same payload plan_and_execute returns. Its assistant_response is authoritative:
+    a formatted action response may replace the streamed planner text.
+    """
+    fast = _try_fast_path(message, user, language)
+    if fast and fast[2]:
+        actions, results, response = fast
+        yield 'actions', {'actions': actions}
+        for idx, result in enumerate(results):
+            yield 'result', {'index': idx, 'result': result}
+        yield 'done', response
+        return
+    _count_route('llm')
+    prep = _begin_planner(message, user, language)
+    plan = _plan_cache_get(prep['cache_key'])
+    if plan is not None:
+        yield 'delta', {'text': plan.get('assistant_response') or ''}
+    else:
+        system, user_msg = _finish_planner_messages(message, language, prep)
+        extractor = _AssistantTextExtractor()
+        raw_parts: List[str] = []
+        started = time.perf_counter()
+        for piece in chat_completion_stream(system, user_msg, max_tokens=700):
+            raw_parts.append(piece)
+            text = extractor.feed(piece)
+            if text:
+                yield 'delta', {'text': text}
+        _record_stage('llm', started)
+        plan = _parse_plan(''.join(raw_parts), language)
+        _plan_cache_put(prep['cache_key'], plan)
+    actions = _apply_intent_rules(message, user, language, plan.get('actions', []))
+    yield 'actions', {'actions': actions}
+    results: List[Optional[Dict[str, Any]]] = [None] * len(actions)
+    started = time.perf_counter()
+    for idx, result in _iter_remaining_results(actions, fast, user, language, message):
+        results[idx] = result
+        yield 'result', {'index': idx, 'result': result}
+    _record_stage('actions', started)
+    yield 'done', _finalize_response(plan, results, language)
+
+
 def _fallback_response(language: str) -> str:
     return 'I cannot perform automated actions right now. Please try again.'
 
@@ -693,46 +1139,120 @@ def _resolve_relative_time(value: str) -> Optional[str]:
 
 
 def execute_actions(actions: List[Dict[str, Any]], user: User, language: str, message: str = '') -> List[Dict[str, Any]]:
-    results: List[Dict[str, Any]] = []
-    for action_item in actions:
-        action = action_item.get('action')
-        params = action_item.get('params') or {}
-        try:
-            if action == 'search_exercises':
-                results.append(_exec_search_exercises(params, user, language))
-            elif action == 'create_workout_plan':
-                results.append(_exec_create_workout_plan(params, user, language))
-            elif action == 'suggest_training_plans':
-                results.append(_exec_suggest_training_plans(params, user, language, message))
-            elif action == 'update_user_profile':
-                results.append(_exec_update_user_profile(params, user, language))
-            elif action == 'progress_check':
-                results.append(_exec_progress_check(params, user, language))
-            elif action == 'trainer_message':
-                results.append(_exec_trainer_message(params, user, language))
-            elif action == 'site_settings':
-                results.append(_exec_site_settings(params, user, language))
-            elif action in ('schedule_meeting', 'schedule_appointment'):
-                results.append(_exec_schedule_meeting(params, user, language))
-            elif action == 'get_dashboard_progress':
-                results.append(_exec_get_dashboard_progress(params, user, language))
-            elif action == 'add_progress_entry':
-                results.append(_exec_add_progress_entry(params, user, language))
-            elif action == 'get_todays_training':
-                results.append(_exec_get_todays_training(params, user, language))
-            elif action == 'get_dashboard_tab_info':
-                results.append(_exec_get_dashboard_tab_info(params, user, language))
-            elif action == 'get_trainers_info':
-                results.append(_exec_get_trainers_info(params, user, language))
-            elif action == 'get_member_progress':
-                results.append(_exec_get_member_progress(params, user, language))
-            else:
-                results.append({'action': action, 'status': 'error', 'error': 'unsupported_action'})
-        except Exception as e:
-            results.append({'action': action, 'status': 'error', 'error': str(e)})
+    results: List[Optional[Dict[str, Any]]] = [None] * len(actions)
+    for idx, result in iter_action_results(actions, user, language, message):
+        results[idx] = result
     return results
 
 
+def _is_read_only(action_item: Dict[str, Any]) -> bool:
+    return bool((ACTION_SPECS.get(action_item.get('action')) or {}).get('read_only'))
+
+
+def _action_batches(actions: List[Dict[str, Any]]) -> List[List[int]]:
+    """
+    Split actions into ordered batches of indexes. A run of consecutive read-only actions is one batch;
+    each mutating action is its own batch, so it sees everything before it and everything after sees it.
+    """
+    batches: List[List[int]] = []
+    for idx, action_item in enumerate(actions):
+        if _is_read_only(action_item) and batches and _is_read_only(actions[batches[-1][0]]):
+            batches[-1].append(idx)
+        else:
+            batches.append([idx])
+    return batches
+
+
+def _get_action_pool() -> ThreadPoolExecutor:
+    global _action_pool
+    if _action_pool is None:
+        with _action_pool_lock:
+            if _action_pool is None:
+                _action_pool = ThreadPoolExecutor(max_workers=ACTION_PARALLELISM, thread_name_prefix='chat-action')
+    return _action_pool
+
+
+def _execute_action_in_app(
+    app, trace, user_id: int, action_item: Dict[str, Any], language: str, message: str
+) -> Dict[str, Any]:
+    """Run one action on a worker thread: own app context, so its own DB session and its own User row."""
+    with app.app_context(), tracing.use_trace(trace):
+        worker_user = _db().session.get(User, user_id)
+        if worker_user is None:
+            return {'action': action_item.get('action'), 'status': 'error', 'error': 'user_not_found'}
+        return _execute_action(action_item, worker_user, language, message)
+
+
+def iter_action_results(
+    actions: List[Dict[str, Any]], user: User, language: str, message: str = ''
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Execute actions, yielding (index, result) batch by batch in index order. Read-only actions in the same
+    batch run concurrently on the action pool; mutating actions run alone, on the calling thread, in order.
+    """
+    app = current_app._get_current_object()
+    trace = tracing.current_trace()
+    for batch in _action_batches(actions):
+        if len(batch) == 1 or ACTION_PARALLELISM == 1:
+            for idx in batch:
+                yield idx, _execute_action(actions[idx], user, language, message)
+            continue
+        pool = _get_action_pool()
+        futures = [
+            (idx, pool.submit(_execute_action_in_app, app, trace, user.id, actions[idx], language, message))
+            for idx in batch
+        ]
+        for idx, future in futures:
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'action': actions[idx].get('action'), 'status': 'error', 'error': str(e)}
+            yield idx, result
+
+
+def _execute_action(action_item: Dict[str, Any], user: User, language: str, message: str = '') -> Dict[str, Any]:
+    with tracing.span('action.' + str(action_item.get('action'))):
+        return _dispatch_action(action_item, user, language, message)
+
+
+def _dispatch_action(action_item: Dict[str, Any], user: User, language: str, message: str = '') -> Dict[str, Any]:
+    action = action_item.get('action')
+    params = action_item.get('params') or {}
+    try:
+        if action == 'search_exercises':
+            return _exec_search_exercises(params, user, language)
+        elif action == 'create_workout_plan':
+            return _exec_create_workout_plan(params, user, language)
+        elif action == 'suggest_training_plans':
+            return _exec_suggest_training_plans(params, user, language, message)
+        elif action == 'update_user_profile':
+            return _exec_update_user_profile(params, user, language)
+        elif action == 'progress_check':
+            return _exec_progress_check(params, user, language)
+        elif action == 'trainer_message':
+            return _exec_trainer_message(params, user, language)
+        elif action == 'site_settings':
+            return _exec_site_settings(params, user, language)
+        elif action in ('schedule_meeting', 'schedule_appointment'):
+            return _exec_schedule_meeting(params, user, language)
+        elif action == 'get_dashboard_progress':
+            return _exec_get_dashboard_progress(params, user, language)
+        elif action == 'add_progress_entry':
+            return _exec_add_progress_entry(params, user, language)
+        elif action == 'get_todays_training':
+            return _exec_get_todays_training(params, user, language)
+        elif action == 'get_dashboard_tab_info':
+            return _exec_get_dashboard_tab_info(params, user, language)
+        elif action == 'get_trainers_info':
+            return _exec_get_trainers_info(params, user, language)
+        elif action == 'get_member_progress':
+            return _exec_get_member_progress(params, user, language)
+        else:
+            return {'action': action, 'status': 'error', 'error': 'unsupported_action'}
+    except Exception as e:
+        return {'action': action, 'status': 'error', 'error': str(e)}
+
+
 def _exec_search_exercises(params: Dict[str, Any], user: User, language: str) -> Dict[str, Any]:
     query_text = (params.get('query') or '').strip()
     target_muscle = (params.get('target_muscle') or '').strip()
@@ -1202,7 +1722,7 @@ def _exec_get_todays_training(params: Dict[str, Any], user: User, language: str)
 
 def _exec_get_trainers_info(params: Dict[str, Any], user: User, language: str) -> Dict[str, Any]:
     """Return list of trainers (assistants). Admin sees all; assistant sees only their own trainees info."""
-    if getattr(user, 'role', None) not in ('admin', 'coach'):
+    if getattr(user, 'role', None) not in STAFF_ROLES:
         return {
             'action': 'get_trainers_info',
             'status': 'error',
@@ -1244,7 +1764,7 @@ def _exec_get_trainers_info(params: Dict[str, Any], user: User, language: str) -
 
 def _exec_get_member_progress(params: Dict[str, Any], user: User, language: str) -> Dict[str, Any]:
     """Return a specific member's progress (weight, BMI, progress entries). Assistant: only their assigned members. Admin: any member."""
-    if getattr(user, 'role', None) not in ('admin', 'coach'):
+    if getattr(user, 'role', None) not in STAFF_ROLES:
         return {
             'action': 'get_member_progress',
             'status': 'error',
@@ -1,12 +1,74 @@
 """
 AI debug CSV logger for testing. Logs each chat request to backend/logs/ai_debug.csv.
 Enabled by default. Set AI_DEBUG_CSV=false to disable. Path configurable via AI_DEBUG_CSV_PATH.
+
+append_log only queues the record: a background thread per worker writes batches to the CSV and to
+ai_debug.jsonl, so requests never wait on disk. Files are rotated by size and by day (optionally
+gzipped). When the queue is full, records are dropped and counted rather than blocking the request.
+
+Env:
+  AI_DEBUG_QUEUE_SIZE      max queued records per worker (default 10000)
+  AI_DEBUG_BATCH_SIZE      records per write (default 200)
+  AI_DEBUG_FLUSH_SECONDS   max delay before queued records are written (default 1)
+  AI_DEBUG_MAX_BYTES       rotate a file when it reaches this size (default 50 MB, 0 = no size limit)
+  AI_DEBUG_ROTATE_DAILY    also rotate when the day changes (UTC, default on)
+  AI_DEBUG_GZIP            gzip rotated files (default on)
+  AI_DEBUG_BACKUPS         rotated files kept per log (default 14)
 """
 
+import atexit
 import csv
+import glob
+import gzip
+import io
 import json
 import os
+import queue
+import shutil
+import threading
+import time
 from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+try:
+    from services import metrics
+except ImportError:
+    from backend.services import metrics
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return str(os.getenv(name, default)).strip().lower() in ("1", "true", "yes")
+
+
+QUEUE_SIZE = max(1, _env_int("AI_DEBUG_QUEUE_SIZE", 10000))
+BATCH_SIZE = max(1, _env_int("AI_DEBUG_BATCH_SIZE", 200))
+FLUSH_SECONDS = max(0.05, _env_float("AI_DEBUG_FLUSH_SECONDS", 1.0))
+MAX_BYTES = max(0, _env_int("AI_DEBUG_MAX_BYTES", 50 * 1024 * 1024))
+ROTATE_DAILY = _env_flag("AI_DEBUG_ROTATE_DAILY", "1")
+GZIP_ROTATED = _env_flag("AI_DEBUG_GZIP", "1")
+BACKUP_COUNT = max(0, _env_int("AI_DEBUG_BACKUPS", 14))
+
+CSV_HEADER = ["timestamp", "message", "response", "action_json", "error"]
+
+_queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=QUEUE_SIZE)
+_writer_lock = threading.Lock()
+_writer_pid: Optional[int] = None
+_stats_lock = threading.Lock()
+_stats = {"queued": 0, "written": 0, "dropped": 0, "write_errors": 0, "rotations": 0}
 
 
 def _get_log_dir():
@@ -19,12 +81,181 @@ def _get_csv_path():
     return os.getenv("AI_DEBUG_CSV_PATH") or os.path.join(_get_log_dir(), "ai_debug.csv")
 
 
-def _ensure_header(path):
-    """Ensure file exists with header. If file is new, write header."""
-    if not os.path.exists(path):
-        with open(path, "w", newline="", encoding="utf-8-sig") as f:
-            writer = csv.writer(f)
-            writer.writerow(["timestamp", "message", "response", "action_json", "error"])
+def _count(name: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[name] += n
+
+
+def _enabled() -> bool:
+    return str(os.getenv("AI_DEBUG_CSV", "true")).lower() not in ("0", "false", "no")
+
+
+# ---------- Rotation ----------
+def _prune_backups(path: str) -> None:
+    backups = sorted(glob.glob(glob.escape(path) + ".*"), key=os.path.getmtime)
+    backups = [b for b in backups if not b.endswith(".tmp")]
+    for old in backups[:max(0, len(backups) - BACKUP_COUNT)]:
+        try:
+            os.remove(old)
+        except OSError:
+            pass
+
+
+def _rotate_if_needed(path: str) -> None:
+    """Move path aside when it is too big or from an earlier day. Safe when several workers race."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return
+    file_day = datetime.utcfromtimestamp(st.st_mtime).strftime("%Y%m%d")
+    too_big = MAX_BYTES and st.st_size >= MAX_BYTES
+    new_day = ROTATE_DAILY and st.st_size > 0 and file_day != datetime.utcnow().strftime("%Y%m%d")
+    if not (too_big or new_day):
+        return
+    rotated = f"{path}.{file_day}-{datetime.utcnow().strftime('%H%M%S')}-{os.getpid()}"
+    try:
+        os.rename(path, rotated)
+    except FileNotFoundError:
+        return  # another worker rotated it first
+    _count("rotations")
+    if GZIP_ROTATED:
+        try:
+            with open(rotated, "rb") as src, gzip.open(rotated + ".gz.tmp", "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            os.replace(rotated + ".gz.tmp", rotated + ".gz")
+            os.remove(rotated)
+        except OSError as e:
+            print(f"[ai_debug_logger] Failed to gzip {rotated}: {e}", flush=True)
+    _prune_backups(path)
+
+
+# ---------- Writer ----------
+def _write_csv(path: str, records: List[Dict[str, Any]]) -> None:
+    _rotate_if_needed(path)
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for r in records:
+        writer.writerow([
+            r["timestamp"],
+            r["message"],
+            r["response"],
+            json.dumps(r["action_json"], ensure_ascii=False),
+            r["error"],
+        ])
+    try:
+        # "x" creates the file with its header exactly once, even with several workers
+        with open(path, "x", newline="", encoding="utf-8-sig") as f:
+            csv.writer(f).writerow(CSV_HEADER)
+    except FileExistsError:
+        pass
+    with open(path, "a", newline="", encoding="utf-8-sig") as f:
+        f.write(buf.getvalue())
+
+
+def _write_jsonl(path: str, records: List[Dict[str, Any]]) -> None:
+    _rotate_if_needed(path)
+    lines = []
+    for r in records:
+        entry = {
+            "timestamp": r["timestamp_iso"],
+            "message": r["message"],
+            "response": r["response"],
+            "action_json": r["action_json"],
+            "error": r["error"],
+        }
+        if r.get("spans"):
+            entry["spans"] = r["spans"]
+        lines.append(json.dumps(entry, ensure_ascii=False) + "\n")
+    with open(path, "a", encoding="utf-8") as f:
+        f.write("".join(lines))
+
+
+def _write_batch(records: List[Dict[str, Any]]) -> None:
+    try:
+        _write_csv(_get_csv_path(), records)
+    except Exception as e:
+        _count("write_errors")
+        print(f"[ai_debug_logger] Failed to write CSV log: {e}", flush=True)
+    try:
+        _write_jsonl(os.path.join(_get_log_dir(), "ai_debug.jsonl"), records)
+    except Exception as e:
+        _count("write_errors")
+        print(f"[ai_debug_logger] Failed to write JSONL log: {e}", flush=True)
+    _count("written", len(records))
+
+
+def _drain() -> List[Dict[str, Any]]:
+    batch: List[Dict[str, Any]] = []
+    while len(batch) < BATCH_SIZE:
+        try:
+            batch.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+def _writer_loop() -> None:
+    while True:
+        first = _queue.get()
+        # Collect up to BATCH_SIZE records, waiting at most FLUSH_SECONDS after the first one
+        deadline = time.monotonic() + FLUSH_SECONDS
+        batch = [first]
+        while len(batch) < BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        with _writer_lock:
+            _write_batch(batch)
+
+
+def _ensure_writer() -> None:
+    # Started lazily so each gunicorn worker gets its own thread (threads do not survive the fork)
+    global _writer_pid
+    if _writer_pid == os.getpid():
+        return
+    with _stats_lock:
+        if _writer_pid == os.getpid():
+            return
+        _writer_pid = os.getpid()
+    threading.Thread(target=_writer_loop, name="ai-debug-log", daemon=True).start()
+
+
+def flush(timeout: float = 5.0) -> None:
+    """Write everything queued so far from the calling thread (used at exit)."""
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        batch = _drain()
+        if not batch:
+            return
+        with _writer_lock:
+            _write_batch(batch)
+
+
+atexit.register(flush)
+
+
+def get_log_stats() -> Dict[str, Any]:
+    """Queue depth and writer counters for this worker."""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["pending"] = _queue.qsize()
+    stats["queue_size"] = QUEUE_SIZE
+    return stats
+
+
+def _enqueue(record: Dict[str, Any]) -> None:
+    _ensure_writer()
+    try:
+        _queue.put_nowait(record)
+    except queue.Full:
+        _count("dropped")
+        metrics.inc("ai_debug_log_dropped_total")
+        return
+    _count("queued")
 
 
 def _compact_action_json(obj: dict) -> dict:
@@ -58,42 +289,23 @@ def _compact_action_json(obj: dict) -> dict:
     return out
 
 
-def append_log(message: str, response: str, action_json: dict, error: str = ""):
-    """Append one row to ai_debug.csv. Set AI_DEBUG_CSV=false to disable (default: enabled for testing).
+def append_log(message: str, response: str, action_json: dict, error: str = "", spans: list = None):
+    """Queue one row for ai_debug.csv. Set AI_DEBUG_CSV=false to disable (default: enabled for testing).
     Plans data is compacted (sessions stripped) to keep logs readable.
-    Also writes to ai_debug.jsonl (one JSON per line) for easier viewing."""
-    if str(os.getenv("AI_DEBUG_CSV", "true")).lower() in ("0", "false", "no"):
+    Also written to ai_debug.jsonl (one JSON per line) for easier viewing; spans (request trace timings)
+    go to the JSONL entry only. Returns immediately; see the module docstring for the writer."""
+    if not _enabled():
         return
-    compact = _compact_action_json(action_json or {})
-    timestamp = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S")
-    timestamp_iso = datetime.utcnow().isoformat() + "Z"
-    try:
-        path = _get_csv_path()
-        _ensure_header(path)
-        with open(path, "a", newline="", encoding="utf-8-sig") as f:
-            writer = csv.writer(f)
-            writer.writerow([
-                timestamp,
-                (message or "")[:500],
-                (response or "")[:1000],
-                json.dumps(compact, ensure_ascii=False),
-                (error or "")[:500],
-            ])
-    except Exception as e:
-        print(f"[ai_debug_logger] Failed to write CSV log: {e}", flush=True)
-    try:
-        jsonl_path = os.path.join(_get_log_dir(), "ai_debug.jsonl")
-        entry = {
-            "timestamp": timestamp_iso,
-            "message": (message or "")[:500],
-            "response": (response or "")[:1000],
-            "action_json": compact,
-            "error": (error or "")[:500],
-        }
-        with open(jsonl_path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
-    except Exception as e:
-        print(f"[ai_debug_logger] Failed to write JSONL log: {e}", flush=True)
+    now = datetime.utcnow()
+    _enqueue({
+        "timestamp": now.strftime("%Y-%m-%d %H:%M:%S"),
+        "timestamp_iso": now.isoformat() + "Z",
+        "message": (message or "")[:500],
+        "response": (response or "")[:1000],
+        "action_json": _compact_action_json(action_json or {}),
+        "error": (error or "")[:500],
+        "spans": spans,
+    })
 
 
 def append_ai_program_log(
@@ -113,7 +325,7 @@ def append_ai_program_log(
     action: 'ai_generated' | 'template_copy' | 'generate_next_sessions' | 'generate_next_sessions_failed'
     Extra kwargs (e.g. start_session_index) are merged into action_json.
     """
-    if str(os.getenv("AI_DEBUG_CSV", "true")).lower() in ("0", "false", "no"):
+    if not _enabled():
         return
     message = f"AI-designed program | user_id={user_id} program_id={program_id}"
     response = "AI-generated" if action == "ai_generated" else (
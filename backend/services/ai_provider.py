@@ -2,26 +2,109 @@
 Unified AI provider service: OpenAI, Anthropic, Gemini, Vertex AI.
 Uses admin-configured API keys and selected provider from SiteSettings.ai_settings_json.
 Vertex AI uses the REST API only (aiplatform.googleapis.com), no SDK.
+Chat calls go through provider_router: the selected provider first, then the other configured
+providers (AI_PROVIDER_ORDER) when it fails, with per-provider circuit breakers and optional hedging.
 """
 
 import os
+import copy
 import time
-import urllib.request
-import urllib.parse
 import json
-from typing import Optional, Dict, Any, Tuple
+import threading
+from typing import Optional, Dict, Any, Iterator, List, Tuple
 from datetime import datetime
 
+try:
+    from services import metrics, tracing
+    from services.prompt_budget import estimate_tokens
+    from services.provider_router import CircuitOpen, ProviderRouter
+except ImportError:
+    from backend.services import metrics, tracing
+    from backend.services.prompt_budget import estimate_tokens
+    from backend.services.provider_router import CircuitOpen, ProviderRouter
+
 PROVIDERS = ('openai', 'anthropic', 'gemini', 'vertex')
 SELECTED_DEFAULT = 'auto'  # Use first available valid provider when not chosen by admin
 
+# Failover order after the selected provider (comma-separated); AI_FAILOVER=0 uses the selected one only
+PROVIDER_ORDER = [
+    p.strip().lower() for p in (os.getenv('AI_PROVIDER_ORDER') or ','.join(PROVIDERS)).split(',')
+    if p.strip().lower() in PROVIDERS
+]
+FAILOVER_ENABLED = str(os.getenv('AI_FAILOVER', '1')).strip().lower() in ('1', 'true', 'yes')
+
+_router = ProviderRouter()
+
+# Anthropic prompt caching for long system prompts (minimum cacheable length is model dependent)
+ANTHROPIC_PROMPT_CACHE = str(os.getenv('ANTHROPIC_PROMPT_CACHE', '1')).strip().lower() in ('1', 'true', 'yes')
+try:
+    ANTHROPIC_CACHE_MIN_TOKENS = int(os.getenv('ANTHROPIC_CACHE_MIN_TOKENS', '2048'))
+except ValueError:
+    ANTHROPIC_CACHE_MIN_TOKENS = 2048
+
 # Last error from chat_completion (for callers to get details when None is returned)
 _last_chat_error: Optional[str] = None
 
-# Lazy app/settings access to avoid circular import
+# Per-provider HTTP defaults; override with AI_<PROVIDER>_TIMEOUT / AI_<PROVIDER>_MAX_CONNECTIONS
+DEFAULT_TIMEOUTS = {'openai': 60.0, 'anthropic': 60.0, 'gemini': 60.0, 'vertex': 90.0}
+DEFAULT_MAX_CONNECTIONS = 10
+
+# Process-wide provider clients keyed by (provider, api_key). Reusing them keeps TLS/TCP
+# connections alive between chat turns instead of reconnecting on every call.
+_clients: Dict[Tuple[str, str], Any] = {}
+_clients_lock = threading.Lock()
+# google.generativeai keeps its API key in process-global state (genai.configure), so a per-key model
+# would not keep keys apart: one (api_key, model) pair for the configured key, replaced under the lock.
+_gemini_model_state: Optional[Tuple[str, Any]] = None
+_gemini_lock = threading.Lock()
+
+# In-process settings cache: (version, loaded_at, data). _settings_version is bumped by _save_settings;
+# AI_SETTINGS_CACHE_TTL (seconds, 0 disables) bounds staleness for changes saved by other gunicorn workers.
+try:
+    SETTINGS_CACHE_TTL = float(os.getenv('AI_SETTINGS_CACHE_TTL', '30'))
+except ValueError:
+    SETTINGS_CACHE_TTL = 30.0
+_settings_version = 0
+_settings_cache: Tuple[int, float, Optional[Dict[str, Any]]] = (-1, 0.0, None)
+_settings_lock = threading.Lock()
+
+# Memoized SDK availability per provider (import attempted once per process)
+_sdk_available: Dict[str, bool] = {}
+
+
+def bump_settings_version() -> int:
+    """Invalidate the cached AI settings in this process. Returns the new version."""
+    global _settings_version, _settings_cache
+    with _settings_lock:
+        _settings_version += 1
+        _settings_cache = (-1, 0.0, None)
+        return _settings_version
+
+
+def _cached_settings(db=None) -> Dict[str, Any]:
+    """Shared cached settings dict. Callers must not modify it; use _get_settings for a copy."""
+    global _settings_cache
+    version, loaded_at, data = _settings_cache
+    if data is not None and version == _settings_version and time.time() - loaded_at < SETTINGS_CACHE_TTL:
+        return data
+    current_version = _settings_version
+    data, ok = _load_settings(db)
+    if ok:
+        _settings_cache = (current_version, time.time(), data)
+    return data
+
+
 def _get_settings(db=None) -> Dict[str, Any]:
-    """Load ai_settings_json from SiteSettings. Returns dict with selected_provider and per-provider keys.
+    """Load AI settings (cached). Returns dict with selected_provider and per-provider keys.
+    Returns a copy, so callers may modify it and pass it to _save_settings.
     If db is provided, use it directly (avoids current_app in purchase flow)."""
+    return copy.deepcopy(_cached_settings(db))
+
+
+# Lazy app/settings access to avoid circular import
+def _load_settings(db=None) -> Tuple[Dict[str, Any], bool]:
+    """Load ai_settings_json from SiteSettings. Returns (settings, loaded_ok); loaded_ok is False
+    when the defaults were returned because the database could not be read."""
     try:
         if db is None:
             from flask import current_app
@@ -34,21 +117,21 @@ def _get_settings(db=None) -> Dict[str, Any]:
                         break
         if db is None:
             print("ai_provider: no db available for settings")
-            return {'selected_provider': SELECTED_DEFAULT}
+            return {'selected_provider': SELECTED_DEFAULT}, False
         from models import SiteSettings
         row = db.session.query(SiteSettings).first()
         raw = getattr(row, 'ai_settings_json', None) or ''
         if not raw or not raw.strip():
-            return {'selected_provider': SELECTED_DEFAULT}
+            return {'selected_provider': SELECTED_DEFAULT}, True
         data = json.loads(raw)
         if not data.get('selected_provider'):
             data['selected_provider'] = SELECTED_DEFAULT
-        return data
+        return data, True
     except Exception as e:
         print(f"ai_provider: could not load settings: {e}")
         import traceback
         traceback.print_exc()
-        return {'selected_provider': SELECTED_DEFAULT}
+        return {'selected_provider': SELECTED_DEFAULT}, False
 
 
 def _save_settings(settings: Dict[str, Any]) -> bool:
@@ -62,6 +145,8 @@ def _save_settings(settings: Dict[str, Any]) -> bool:
             db.session.add(row)
         row.ai_settings_json = json.dumps(settings, ensure_ascii=False)
         db.session.commit()
+        bump_settings_version()
+        invalidate_provider_clients(settings)
         return True
     except Exception as e:
         print(f"ai_provider: could not save settings: {e}")
@@ -81,7 +166,7 @@ def get_provider_api_key(provider: str, settings: Optional[Dict] = None) -> Tupl
     source: 'database' | 'environment' | ''
     """
     if settings is None:
-        settings = _get_settings()
+        settings = _cached_settings()
     key = None
     source = ''
     if provider == 'openai':
@@ -99,7 +184,7 @@ def get_provider_api_key(provider: str, settings: Optional[Dict] = None) -> Tupl
     return (key.strip() if key and isinstance(key, str) else None, source)
 
 
-def is_sdk_installed(provider: str) -> bool:
+def _import_sdk(provider: str) -> bool:
     if provider == 'openai':
         try:
             import openai
@@ -123,6 +208,15 @@ def is_sdk_installed(provider: str) -> bool:
     return False
 
 
+def is_sdk_installed(provider: str) -> bool:
+    """True if the provider SDK can be imported. Computed once per provider per process."""
+    available = _sdk_available.get(provider)
+    if available is None:
+        available = _import_sdk(provider)
+        _sdk_available[provider] = available
+    return available
+
+
 def _resolve_provider(settings: Dict[str, Any]) -> Optional[str]:
     """Resolve selected_provider to a concrete provider. Returns first available when 'auto'."""
     chosen = (settings.get('selected_provider') or SELECTED_DEFAULT).lower()
@@ -137,13 +231,106 @@ def _resolve_provider(settings: Dict[str, Any]) -> Optional[str]:
     return None
 
 
-def chat_completion(system: str, user_message: str, max_tokens: int = 800, db=None) -> Optional[str]:
-    """
-    Call the selected AI provider (from settings). Returns response text or None on failure.
-    When selected_provider is 'auto', uses the first available valid provider.
-    Pass db to load settings from the given db instance (avoids current_app in purchase flow).
-    """
-    settings = _get_settings(db)
+def _provider_http_config(provider: str) -> Tuple[float, int]:
+    """Return (timeout_seconds, max_connections) for provider from env or defaults."""
+    prefix = f"AI_{provider.upper()}"
+    default_timeout = DEFAULT_TIMEOUTS.get(provider, 60.0)
+    try:
+        timeout = float(os.getenv(f"{prefix}_TIMEOUT") or default_timeout)
+    except ValueError:
+        timeout = default_timeout
+    try:
+        max_connections = int(os.getenv(f"{prefix}_MAX_CONNECTIONS") or DEFAULT_MAX_CONNECTIONS)
+    except ValueError:
+        max_connections = DEFAULT_MAX_CONNECTIONS
+    return timeout, max(1, max_connections)
+
+
+def _httpx_client(timeout: float, max_connections: int):
+    """Keep-alive httpx pool for the OpenAI/Anthropic SDKs. None when httpx is unavailable."""
+    try:
+        import httpx
+    except ImportError:
+        return None
+    return httpx.Client(
+        timeout=timeout,
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+    )
+
+
+def _build_client(provider: str, api_key: str):
+    """Create a new client for provider. Returns None when the SDK has no client object to pool."""
+    timeout, max_connections = _provider_http_config(provider)
+    if provider in ('openai', 'anthropic'):
+        if provider == 'openai':
+            import openai
+            client_cls = getattr(openai, 'OpenAI', None)
+        else:
+            import anthropic
+            client_cls = getattr(anthropic, 'Anthropic', None)
+        if client_cls is None:
+            return None
+        kwargs = {'api_key': api_key, 'timeout': timeout}
+        http_client = _httpx_client(timeout, max_connections)
+        if http_client is not None:
+            kwargs['http_client'] = http_client
+        return client_cls(**kwargs)
+    if provider == 'vertex':
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=max_connections))
+        return session
+    return None
+
+
+def get_provider_client(provider: str, api_key: str):
+    """Return the pooled client for (provider, api_key), creating it on first use."""
+    key = (provider, api_key)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _build_client(provider, api_key)
+            if client is not None:
+                _clients[key] = client
+    return client
+
+
+def _gemini_model(api_key: str):
+    """GenerativeModel for the configured Gemini key. A different key reconfigures the SDK (global) and
+    replaces the model; the new model binds the SDK client for that key on its first call."""
+    global _gemini_model_state
+    state = _gemini_model_state
+    if state is not None and state[0] == api_key:
+        return state[1]
+    with _gemini_lock:
+        state = _gemini_model_state
+        if state is None or state[0] != api_key:
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            state = _gemini_model_state = (api_key, genai.GenerativeModel('gemini-1.5-flash'))
+        return state[1]
+
+
+def invalidate_provider_clients(settings: Optional[Dict[str, Any]] = None) -> None:
+    """Drop pooled clients whose API key no longer matches settings (all clients when settings is None).
+    Dropped clients are not closed: a request on another thread may still be using one."""
+    with _clients_lock:
+        if settings is None:
+            _clients.clear()
+            return
+        current = {p: get_provider_api_key(p, settings)[0] for p in PROVIDERS}
+        for key in list(_clients.keys()):
+            if current.get(key[0]) != key[1]:
+                _clients.pop(key, None)
+
+
+def _select_provider(db=None) -> Optional[Tuple[str, str]]:
+    """Resolve (provider, api_key) from settings, or None (with a log line) when nothing is usable."""
+    settings = _cached_settings(db)
     provider = _resolve_provider(settings)
     if not provider:
         print("ai_provider: no provider available (auto: none configured, or selected has no key/SDK)")
@@ -155,25 +342,154 @@ def chat_completion(system: str, user_message: str, max_tokens: int = 800, db=No
     if not is_sdk_installed(provider):
         print("ai_provider: SDK not installed for", provider)
         return None
+    return provider, api_key
+
+
+def _select_providers(db=None) -> List[Tuple[str, str]]:
+    """(provider, api_key) pairs to try, best first: the resolved provider, then the other usable
+    providers in PROVIDER_ORDER when failover is enabled."""
+    selected = _select_provider(db)
+    if not selected:
+        return []
+    candidates = [selected]
+    if FAILOVER_ENABLED:
+        settings = _cached_settings(db)
+        for p in PROVIDER_ORDER:
+            if p == selected[0]:
+                continue
+            key, _ = get_provider_api_key(p, settings)
+            if key and is_sdk_installed(p):
+                candidates.append((p, key))
+    return candidates
+
+
+def chat_completion(system: str, user_message: str, max_tokens: int = 800, db=None) -> Optional[str]:
+    """
+    Call the selected AI provider (from settings). Returns response text or None on failure.
+    When selected_provider is 'auto', uses the first available valid provider. If it fails (or its
+    circuit breaker is open) the next configured provider is tried; see provider_router.
+    Pass db to load settings from the given db instance (avoids current_app in purchase flow).
+    """
+    candidates = _select_providers(db)
+    if not candidates:
+        return None
+    api_keys = dict(candidates)
+
+    def attempt(provider: str, last: bool) -> Optional[str]:
+        started = time.perf_counter()
+        try:
+            with tracing.span('llm.chat_completion', provider=provider):
+                out = _dispatch_chat(provider, api_keys[provider], system, user_message, max_tokens,
+                                     retry_rate_limit=last)
+        except Exception:
+            _record_call(provider, 'sync', 'error', started)
+            raise
+        _record_call(provider, 'sync', 'ok' if out else 'empty', started)
+        return out
 
     global _last_chat_error
     _last_chat_error = None
     try:
-        if provider == 'openai':
-            out = _openai_chat(api_key, system, user_message, max_tokens)
-        elif provider == 'anthropic':
-            out = _anthropic_chat(api_key, system, user_message, max_tokens)
-        elif provider == 'gemini':
-            out = _gemini_chat(api_key, system, user_message, max_tokens)
-        elif provider == 'vertex':
-            out = _vertex_chat(api_key, system, user_message, max_tokens)
-        else:
-            out = None
-        return out
-    except Exception as e:
+        out, _, errors = _router.call([p for p, _ in candidates], attempt)
+    except CircuitOpen as e:
         _last_chat_error = str(e)
-        print(f"ai_provider chat error ({provider}): {e}")
+        print(f"ai_provider chat error: {e}")
         return None
+    if errors:
+        print(f"ai_provider chat errors: {'; '.join(errors)}")
+        if out is None:
+            _last_chat_error = '; '.join(errors)
+    return out
+
+
+def _record_call(provider: str, mode: str, outcome: str, started: float) -> None:
+    metrics.inc('ai_provider_calls_total', {'provider': provider, 'mode': mode, 'outcome': outcome})
+    metrics.observe('ai_provider_call_duration_seconds', time.perf_counter() - started, {'provider': provider, 'mode': mode})
+
+
+def _dispatch_chat(provider: str, api_key: str, system: str, user_message: str, max_tokens: int,
+                   retry_rate_limit: bool = True) -> Optional[str]:
+    if provider == 'openai':
+        return _openai_chat(api_key, system, user_message, max_tokens)
+    if provider == 'anthropic':
+        return _anthropic_chat(api_key, system, user_message, max_tokens)
+    if provider == 'gemini':
+        return _gemini_chat(api_key, system, user_message, max_tokens)
+    if provider == 'vertex':
+        return _vertex_chat(api_key, system, user_message, max_tokens, retry_rate_limit)
+    return None
+
+
+def _dispatch_chat_stream(provider: str, api_key: str, system: str, user_message: str, max_tokens: int,
+                          retry_rate_limit: bool = True) -> Iterator[str]:
+    if provider == 'openai':
+        return _openai_chat_stream(api_key, system, user_message, max_tokens)
+    if provider == 'anthropic':
+        return _anthropic_chat_stream(api_key, system, user_message, max_tokens)
+    if provider == 'gemini':
+        return _gemini_chat_stream(api_key, system, user_message, max_tokens)
+    if provider == 'vertex':
+        return _vertex_chat_stream(api_key, system, user_message, max_tokens, retry_rate_limit)
+    return iter(())
+
+
+def chat_completion_stream(system: str, user_message: str, max_tokens: int = 800, db=None) -> Iterator[str]:
+    """
+    Streaming variant of chat_completion: yields text pieces as the provider produces them.
+    Yields nothing when no provider is available. A provider that fails before its first piece is
+    replaced by the next one (no hedging for streams); after text has been sent an error stops the
+    stream early and get_last_chat_error() returns the error.
+    """
+    candidates = _select_providers(db)
+    providers = [p for p, _ in candidates]
+    api_keys = dict(candidates)
+
+    global _last_chat_error
+    _last_chat_error = None
+    errors = []
+    idx, last = _router.next_allowed(providers)
+    if providers and idx is None:
+        _last_chat_error = "All AI providers are temporarily disabled after repeated failures"
+    while idx is not None:
+        provider = providers[idx]
+        started = time.perf_counter()
+        outcome = 'empty'
+        try:
+            stream = _dispatch_chat_stream(provider, api_keys[provider], system, user_message, max_tokens,
+                                           retry_rate_limit=last)
+            for piece in stream:
+                if piece:
+                    outcome = 'ok'
+                    yield piece
+        except GeneratorExit:
+            # Client went away mid-stream: not the provider's fault
+            _router.breaker(provider).record(True, time.perf_counter() - started)
+            raise
+        except Exception as e:
+            errors.append(f"{provider}: {e}")
+            print(f"ai_provider stream error ({provider}): {e}")
+            _router.breaker(provider).record(False, time.perf_counter() - started)
+            if outcome == 'ok':
+                outcome = 'error'
+                break
+            outcome = 'error'
+        else:
+            _router.breaker(provider).record(True, time.perf_counter() - started)
+            if outcome == 'ok':
+                break
+        finally:
+            _record_call(provider, 'stream', outcome, started)
+        idx, last = _router.next_allowed(providers, idx + 1)
+    if errors:
+        _last_chat_error = '; '.join(errors)
+
+
+def get_provider_health() -> Dict[str, Any]:
+    """Failover order and per-provider circuit breaker state / p95 latency for this worker."""
+    stats = _router.stats()
+    stats['failover_enabled'] = FAILOVER_ENABLED
+    stats['order'] = PROVIDER_ORDER
+    return stats
 
 
 def get_last_chat_error() -> Optional[str]:
@@ -184,9 +500,8 @@ def get_last_chat_error() -> Optional[str]:
 def _openai_chat(api_key: str, system: str, user_message: str, max_tokens: int) -> Optional[str]:
     try:
         import openai
-        client = getattr(openai, 'OpenAI', None)
-        if client:
-            c = client(api_key=api_key)
+        c = get_provider_client('openai', api_key)
+        if c is not None:
             r = c.chat.completions.create(
                 model='gpt-4o-mini',
                 messages=[
@@ -217,13 +532,46 @@ def _openai_chat(api_key: str, system: str, user_message: str, max_tokens: int)
     return None
 
 
+def _openai_chat_stream(api_key: str, system: str, user_message: str, max_tokens: int) -> Iterator[str]:
+    c = get_provider_client('openai', api_key)
+    if c is None:
+        # Legacy SDK without a client object: no streaming, return the whole reply at once
+        out = _openai_chat(api_key, system, user_message, max_tokens)
+        if out:
+            yield out
+        return
+    stream = c.chat.completions.create(
+        model='gpt-4o-mini',
+        messages=[
+            {'role': 'system', 'content': system},
+            {'role': 'user', 'content': user_message},
+        ],
+        max_tokens=max_tokens,
+        stream=True,
+    )
+    for chunk in stream:
+        if not chunk.choices:
+            continue
+        delta = getattr(chunk.choices[0], 'delta', None)
+        text = getattr(delta, 'content', None) if delta else None
+        if text:
+            yield text
+
+
+def _anthropic_system(system: str):
+    """System prompt for the Messages API. Long (static) prompts are marked cacheable so repeated calls
+    reuse the provider's prompt cache; shorter ones are below Anthropic's cacheable minimum anyway."""
+    if not ANTHROPIC_PROMPT_CACHE or estimate_tokens(system) < ANTHROPIC_CACHE_MIN_TOKENS:
+        return system
+    return [{'type': 'text', 'text': system, 'cache_control': {'type': 'ephemeral'}}]
+
+
 def _anthropic_chat(api_key: str, system: str, user_message: str, max_tokens: int) -> Optional[str]:
-    import anthropic
-    client = anthropic.Anthropic(api_key=api_key)
+    client = get_provider_client('anthropic', api_key)
     m = client.messages.create(
         model='claude-3-haiku-20240307',
         max_tokens=max_tokens,
-        system=system,
+        system=_anthropic_system(system),
         messages=[{'role': 'user', 'content': user_message}],
     )
     if m.content and len(m.content) > 0:
@@ -233,32 +581,62 @@ def _anthropic_chat(api_key: str, system: str, user_message: str, max_tokens: in
     return None
 
 
+def _anthropic_chat_stream(api_key: str, system: str, user_message: str, max_tokens: int) -> Iterator[str]:
+    client = get_provider_client('anthropic', api_key)
+    with client.messages.stream(
+        model='claude-3-haiku-20240307',
+        max_tokens=max_tokens,
+        system=_anthropic_system(system),
+        messages=[{'role': 'user', 'content': user_message}],
+    ) as stream:
+        for text in stream.text_stream:
+            if text:
+                yield text
+
+
 def _gemini_chat(api_key: str, system: str, user_message: str, max_tokens: int) -> Optional[str]:
     import google.generativeai as genai
-    genai.configure(api_key=api_key)
-    model = genai.GenerativeModel('gemini-1.5-flash')
+    model = _gemini_model(api_key)
+    timeout, _ = _provider_http_config('gemini')
     prompt = f"{system}\n\nUser: {user_message}"
-    r = model.generate_content(prompt, generation_config=genai.types.GenerationConfig(max_output_tokens=max_tokens))
+    r = model.generate_content(
+        prompt,
+        generation_config=genai.types.GenerationConfig(max_output_tokens=max_tokens),
+        request_options={'timeout': timeout},
+    )
     if r and r.text:
         return r.text.strip()
     return None
 
 
+def _gemini_chat_stream(api_key: str, system: str, user_message: str, max_tokens: int) -> Iterator[str]:
+    import google.generativeai as genai
+    model = _gemini_model(api_key)
+    timeout, _ = _provider_http_config('gemini')
+    prompt = f"{system}\n\nUser: {user_message}"
+    response = model.generate_content(
+        prompt,
+        generation_config=genai.types.GenerationConfig(max_output_tokens=max_tokens),
+        request_options={'timeout': timeout},
+        stream=True,
+    )
+    for chunk in response:
+        try:
+            text = chunk.text
+        except ValueError:
+            # Chunk without text parts (e.g. safety block)
+            continue
+        if text:
+            yield text
+
+
 # Vertex AI REST API (API key only); model name configurable via env
 VERTEX_MODEL = os.getenv('VERTEX_AI_MODEL', 'gemini-2.5-flash-lite')
 VERTEX_BASE = 'https://aiplatform.googleapis.com/v1/publishers/google/models'
 
 
-def _vertex_chat(api_key: str, system: str, user_message: str, max_tokens: int) -> Optional[str]:
-    """
-    Vertex AI via REST API only (aiplatform.googleapis.com).
-    Uses API key in query param; model: gemini-2.5-flash-lite (or VERTEX_AI_MODEL).
-    Retries up to 2 times on 429 (Resource exhausted).
-    """
-    import urllib.error
-    qs = urllib.parse.urlencode({"key": api_key})
-    url = f"{VERTEX_BASE}/{VERTEX_MODEL}:generateContent?{qs}"
-    body = {
+def _vertex_body(system: str, user_message: str, max_tokens: int) -> Dict[str, Any]:
+    return {
         "contents": [
             {
                 "role": "user",
@@ -269,33 +647,48 @@ def _vertex_chat(api_key: str, system: str, user_message: str, max_tokens: int)
             "maxOutputTokens": max_tokens,
         },
     }
-    last_err = None
-    max_attempts = 4
+
+
+def _vertex_request(api_key: str, method: str, body: Dict[str, Any], stream: bool = False,
+                    retry_rate_limit: bool = True):
+    """
+    POST body to a Vertex model method (generateContent, streamGenerateContent) using the pooled
+    keep-alive session. Retries up to 3 times on 429 (Resource exhausted) when retry_rate_limit is set;
+    otherwise a 429 raises at once so the router can fail over. Returns the 200 response.
+    """
+    import requests
+    session = get_provider_client('vertex', api_key)
+    timeout, _ = _provider_http_config('vertex')
+    url = f"{VERTEX_BASE}/{VERTEX_MODEL}:{method}"
+    params = {"key": api_key}
+    if stream:
+        params["alt"] = "sse"
+    max_attempts = 4 if retry_rate_limit else 1
     for attempt in range(max_attempts):
         try:
-            req = urllib.request.Request(
-                url,
-                data=json.dumps(body).encode('utf-8'),
-                headers={"Content-Type": "application/json"},
-                method="POST",
-            )
-            with urllib.request.urlopen(req, timeout=90) as resp:
-                data = json.loads(resp.read().decode('utf-8'))
-            last_err = None
-            break
-        except urllib.error.HTTPError as e:
-            raw = e.read().decode('utf-8') if e.fp else ''
-            last_err = RuntimeError(f"Vertex API error {e.code}: {raw}")
-            if e.code == 429 and attempt < max_attempts - 1:
-                wait = 10 + attempt * 10
-                print(f"Vertex 429 (rate limit), retrying in {wait}s (attempt {attempt + 1}/{max_attempts})...")
-                time.sleep(wait)
-            else:
-                raise last_err
-        except urllib.error.URLError as e:
-            raise RuntimeError(f"Vertex API request failed: {e.reason}")
-    if last_err:
-        raise last_err
+            resp = session.post(url, params=params, json=body, timeout=timeout, stream=stream)
+        except requests.RequestException as e:
+            raise RuntimeError(f"Vertex API request failed: {e}")
+        if resp.status_code == 200:
+            return resp
+        err = RuntimeError(f"Vertex API error {resp.status_code}: {resp.text}")
+        if resp.status_code == 429 and attempt < max_attempts - 1:
+            wait = 10 + attempt * 10
+            print(f"Vertex 429 (rate limit), retrying in {wait}s (attempt {attempt + 1}/{max_attempts})...")
+            time.sleep(wait)
+        else:
+            raise err
+    raise RuntimeError("Vertex API request failed: retries exhausted")
+
+
+def _vertex_chat(api_key: str, system: str, user_message: str, max_tokens: int,
+                 retry_rate_limit: bool = True) -> Optional[str]:
+    """
+    Vertex AI via REST API only (aiplatform.googleapis.com).
+    Uses API key in query param; model: gemini-2.5-flash-lite (or VERTEX_AI_MODEL).
+    """
+    data = _vertex_request(api_key, 'generateContent', _vertex_body(system, user_message, max_tokens),
+                           retry_rate_limit=retry_rate_limit).json()
 
     # Parse response: candidates[0].content.parts[0].text
     candidates = data.get("candidates") or []
@@ -309,6 +702,32 @@ def _vertex_chat(api_key: str, system: str, user_message: str, max_tokens: int)
     return (parts[0].get("text") or "").strip()
 
 
+def _vertex_chat_stream(api_key: str, system: str, user_message: str, max_tokens: int,
+                        retry_rate_limit: bool = True) -> Iterator[str]:
+    """Vertex streamGenerateContent with alt=sse: one JSON response chunk per 'data:' line."""
+    resp = _vertex_request(api_key, 'streamGenerateContent', _vertex_body(system, user_message, max_tokens),
+                           stream=True, retry_rate_limit=retry_rate_limit)
+    # SSE responses usually carry no charset; without this requests decodes as ISO-8859-1
+    resp.encoding = 'utf-8'
+    try:
+        for line in resp.iter_lines(decode_unicode=True):
+            if not line or not line.startswith('data:'):
+                continue
+            try:
+                data = json.loads(line[5:].strip())
+            except ValueError:
+                continue
+            candidates = data.get("candidates") or []
+            if not candidates:
+                continue
+            for part in ((candidates[0].get("content") or {}).get("parts") or []):
+                text = part.get("text")
+                if text:
+                    yield text
+    finally:
+        resp.close()
+
+
 def test_provider(provider: str, api_key_override: Optional[str] = None) -> Tuple[bool, str]:
     """
     Test the given provider with optional api_key. Returns (success, message).
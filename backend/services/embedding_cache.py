@@ -0,0 +1,181 @@
+"""
+Query-embedding cache shared by website_kb, vector_store and api/vector_search.
+In-memory LRU with TTL, keyed by (provider, model, dimension, normalized text), plus an optional
+on-disk SQLite tier (EMBEDDING_CACHE_DB) so entries survive gunicorn restarts.
+
+Env:
+  EMBEDDING_CACHE_SIZE  max in-memory entries (default 1000, 0 disables the cache)
+  EMBEDDING_CACHE_TTL   seconds an entry stays valid (default 86400)
+  EMBEDDING_CACHE_DB    path to a SQLite file for the disk tier (default: disabled)
+"""
+
+import array
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+MAX_ENTRIES = _env_int("EMBEDDING_CACHE_SIZE", 1000)
+TTL_SECONDS = _env_int("EMBEDDING_CACHE_TTL", 86400)
+
+_entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, vector)
+_lock = threading.Lock()
+_stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "disk_errors": 0}
+_disk_ready = False
+
+
+def normalize_text(text: str) -> str:
+    """Case-, width- and whitespace-insensitive form used in cache keys."""
+    return " ".join(unicodedata.normalize("NFKC", text or "").casefold().split())
+
+
+def _make_key(provider: str, model: str, dimension: Optional[int], text: str) -> str:
+    raw = "\x1f".join([provider or "", model or "", str(dimension or ""), normalize_text(text)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _count(name: str) -> None:
+    with _lock:
+        _stats[name] += 1
+
+
+def _disk_path() -> Optional[str]:
+    path = (os.getenv("EMBEDDING_CACHE_DB") or "").strip()
+    if not path:
+        return None
+    if not os.path.isabs(path):
+        base = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        path = os.path.join(base, path)
+    return path
+
+
+def _disk_connect(path: str) -> sqlite3.Connection:
+    global _disk_ready
+    if not _disk_ready:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=5)
+    if not _disk_ready:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embedding_cache ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+        # Expired rows are purged once per process so the file does not grow without bound
+        conn.execute("DELETE FROM embedding_cache WHERE expires_at < ?", (time.time(),))
+        conn.commit()
+        _disk_ready = True
+    return conn
+
+
+def _disk_get(key: str) -> Optional[List[float]]:
+    path = _disk_path()
+    if not path:
+        return None
+    try:
+        conn = _disk_connect(path)
+        try:
+            row = conn.execute(
+                "SELECT vector, expires_at FROM embedding_cache WHERE key = ?", (key,)
+            ).fetchone()
+        finally:
+            conn.close()
+    except Exception:
+        _count("disk_errors")
+        return None
+    if not row or row[1] < time.time():
+        return None
+    vec = array.array("f")
+    vec.frombytes(row[0])
+    return vec.tolist()
+
+
+def _disk_put(key: str, vector: List[float], expires_at: float) -> None:
+    path = _disk_path()
+    if not path:
+        return
+    try:
+        conn = _disk_connect(path)
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO embedding_cache (key, vector, expires_at) VALUES (?, ?, ?)",
+                (key, array.array("f", vector).tobytes(), expires_at),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception:
+        _count("disk_errors")
+
+
+def _memory_put(key: str, vector: List[float], expires_at: float) -> None:
+    with _lock:
+        _entries[key] = (expires_at, vector)
+        _entries.move_to_end(key)
+        while len(_entries) > MAX_ENTRIES:
+            _entries.popitem(last=False)
+
+
+def get_or_embed(
+    provider: str,
+    model: str,
+    dimension: Optional[int],
+    text: str,
+    embed_fn: Callable[[str], List[float]],
+) -> List[float]:
+    """Return the cached embedding for text, calling embed_fn(text) on a miss.
+    Errors from embed_fn propagate and are not cached."""
+    if MAX_ENTRIES <= 0:
+        return embed_fn(text)
+    key = _make_key(provider, model, dimension, text)
+    now = time.time()
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            if entry[0] >= now:
+                _entries.move_to_end(key)
+                _stats["memory_hits"] += 1
+                return list(entry[1])
+            del _entries[key]
+    vector = _disk_get(key)
+    if vector is not None:
+        _count("disk_hits")
+        _memory_put(key, vector, now + TTL_SECONDS)
+        return list(vector)
+    _count("misses")
+    vector = list(embed_fn(text))
+    if vector:
+        expires_at = now + TTL_SECONDS
+        _memory_put(key, vector, expires_at)
+        _disk_put(key, vector, expires_at)
+    return vector
+
+
+def cache_stats() -> Dict[str, object]:
+    """Hit/miss counters and current size (per process)."""
+    with _lock:
+        stats = dict(_stats)
+        stats["size"] = len(_entries)
+    lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+    stats["hit_rate"] = round((stats["memory_hits"] + stats["disk_hits"]) / lookups, 3) if lookups else None
+    stats["max_entries"] = MAX_ENTRIES
+    stats["ttl_seconds"] = TTL_SECONDS
+    stats["disk_enabled"] = bool(_disk_path())
+    return stats
+
+
+def clear() -> None:
+    """Drop all in-memory entries (the disk tier expires by TTL)."""
+    with _lock:
+        _entries.clear()
@@ -0,0 +1,94 @@
+"""
+Lexical (keyword) side of Website KB search: Persian/English normalization, tokenizing, an in-memory
+BM25 index for the PostgreSQL path, FTS5 query building for the sqlite-vec path, and reciprocal rank
+fusion for combining lexical and vector rankings.
+"""
+
+import math
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, Hashable, List, Sequence, Tuple
+
+# Arabic code points that Persian text is often typed with, mapped to the Persian forms
+_CHAR_MAP = str.maketrans({
+    "\u064a": "\u06cc",  # Arabic yeh -> Persian yeh
+    "\u0649": "\u06cc",  # alef maksura -> Persian yeh
+    "\u0643": "\u06a9",  # Arabic kaf -> Persian kaf
+    "\u0629": "\u0647",  # teh marbuta -> heh
+    "\u0623": "\u0627",  # alef with hamza above -> alef
+    "\u0625": "\u0627",  # alef with hamza below -> alef
+    "\u0622": "\u0627",  # alef with madda -> alef
+    "\u0640": None,       # tatweel
+    "\u200c": " ",        # ZWNJ: prefixes/suffixes (mi-, -ha) become their own tokens
+    "\u200d": None,       # ZWJ
+})
+_DIGITS = str.maketrans(
+    "\u06f0\u06f1\u06f2\u06f3\u06f4\u06f5\u06f6\u06f7\u06f8\u06f9"
+    "\u0660\u0661\u0662\u0663\u0664\u0665\u0666\u0667\u0668\u0669",
+    "01234567890123456789",
+)
+_DIACRITICS = re.compile("[\u064b-\u065f\u0670]")
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+
+def normalize_for_search(text: str) -> str:
+    """Case-fold, unify Arabic/Persian letter variants and digits, drop diacritics."""
+    text = unicodedata.normalize("NFKC", text or "")
+    text = _DIACRITICS.sub("", text.translate(_CHAR_MAP).translate(_DIGITS))
+    return text.casefold()
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN.findall(normalize_for_search(text)) if t != "_"]
+
+
+def fts_match_query(text: str) -> str:
+    """FTS5 MATCH expression: any query token (quoted, so user text cannot inject FTS syntax)."""
+    tokens = list(dict.fromkeys(tokenize(text)))
+    return " OR ".join('"' + t.replace('"', '""') + '"' for t in tokens)
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of documents; search returns (doc position, score) best first."""
+
+    def __init__(self, docs: Sequence[str]):
+        self._term_freqs: List[Counter] = [Counter(tokenize(d)) for d in docs]
+        self._lengths = [sum(tf.values()) for tf in self._term_freqs]
+        self._avg_len = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        doc_freq: Counter = Counter()
+        for tf in self._term_freqs:
+            doc_freq.update(tf.keys())
+        n = len(self._term_freqs)
+        self._idf: Dict[str, float] = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()
+        }
+        self._postings: Dict[str, List[int]] = {}
+        for pos, tf in enumerate(self._term_freqs):
+            for term in tf:
+                self._postings.setdefault(term, []).append(pos)
+
+    def search(self, query: str, top_k: int) -> List[Tuple[int, float]]:
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for pos in self._postings[term]:
+                tf = self._term_freqs[pos][term]
+                norm = 1 - BM25_B + BM25_B * (self._lengths[pos] / self._avg_len if self._avg_len else 1)
+                scores[pos] = scores.get(pos, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+        return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:top_k]
+
+
+def rrf_fuse(rankings: Sequence[Sequence[Hashable]], k: int = RRF_K) -> List[Tuple[Hashable, float]]:
+    """Reciprocal rank fusion: score(d) = sum over rankings of 1 / (k + rank). Best first."""
+    scores: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, start=1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
@@ -0,0 +1,349 @@
+"""
+Background Website KB reindex scheduler.
+Admin edits call schedule_kb_reindex(); bursts of edits inside the debounce window collapse into one
+run. One worker thread per process runs reindexes one at a time, and a database lock (PostgreSQL
+advisory lock, or a lock file next to the SQLite DB) keeps other gunicorn workers from reindexing at
+the same time. The worker running a reindex publishes its progress and last-run stats to
+instance/kb_reindex_status.json, so get_reindex_status() reports them whichever worker answers.
+
+Env:
+  KB_REINDEX_DEBOUNCE_SECONDS  quiet period after the last edit before reindexing (default 3)
+  KB_REINDEX_MAX_DELAY_SECONDS a steady stream of edits still reindexes after this long (default 30)
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+try:
+    import fcntl
+    HAS_FCNTL = True
+except ImportError:
+    fcntl = None
+    HAS_FCNTL = False
+
+logger = logging.getLogger(__name__)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+DEBOUNCE_SECONDS = _env_float("KB_REINDEX_DEBOUNCE_SECONDS", 3.0)
+MAX_DELAY_SECONDS = _env_float("KB_REINDEX_MAX_DELAY_SECONDS", 30.0)
+# Retry delay when another worker holds the cluster lock
+LOCK_RETRY_SECONDS = 5.0
+# pg_advisory_lock key; any constant shared by all workers
+ADVISORY_LOCK_KEY = 0x4B42_5245  # "KBRE"
+
+
+def _isoformat(ts: Optional[float]) -> Optional[str]:
+    return datetime.utcfromtimestamp(ts).isoformat() if ts else None
+
+
+def _acquire_cluster_lock(app) -> Optional[Callable[[], None]]:
+    """Try to take the cross-process reindex lock. Returns a release function, or None when held elsewhere."""
+    db = app.extensions['sqlalchemy']
+    engine = db.engine
+    if engine.dialect.name == 'postgresql':
+        from sqlalchemy import text
+        conn = engine.connect()
+        try:
+            got = conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {'k': ADVISORY_LOCK_KEY}).scalar()
+        except Exception:
+            conn.close()
+            raise
+        if not got:
+            conn.close()
+            return None
+
+        def release_pg():
+            # Session-level lock: must be released explicitly, returning the connection to the pool keeps it
+            try:
+                conn.execute(text("SELECT pg_advisory_unlock(:k)"), {'k': ADVISORY_LOCK_KEY})
+                conn.commit()
+            except Exception:
+                conn.invalidate()
+            finally:
+                conn.close()
+        return release_pg
+
+    if not HAS_FCNTL:
+        return lambda: None
+    os.makedirs(app.instance_path, exist_ok=True)
+    handle = open(os.path.join(app.instance_path, 'kb_reindex.lock'), 'a')
+    try:
+        fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        handle.close()
+        return None
+
+    def release_file():
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+        finally:
+            handle.close()
+    return release_file
+
+
+def _status_file(app) -> str:
+    return os.path.join(app.instance_path, 'kb_reindex_status.json')
+
+
+def _read_status_file(path: str) -> Dict[str, Any]:
+    try:
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+class ReindexBusy(RuntimeError):
+    """Raised by run_now when a reindex is already running in this or another process."""
+
+
+class KBReindexScheduler:
+    """
+    Single-flight, debounced reindex runner. reindex_fn(on_progress) does the work and returns stats;
+    lock_fn(app) returns a release callable or None when the cluster lock is taken; status_path_fn(app)
+    is the JSON file runs are published to (shared by all workers of the instance).
+    """
+
+    def __init__(
+        self,
+        reindex_fn: Optional[Callable[..., Dict[str, Any]]] = None,
+        lock_fn: Optional[Callable[[Any], Optional[Callable[[], None]]]] = None,
+        debounce_seconds: float = DEBOUNCE_SECONDS,
+        max_delay_seconds: float = MAX_DELAY_SECONDS,
+        lock_retry_seconds: float = LOCK_RETRY_SECONDS,
+        status_path_fn: Optional[Callable[[Any], str]] = None,
+    ):
+        self._reindex_fn = reindex_fn
+        self._lock_fn = lock_fn or _acquire_cluster_lock
+        self._status_path_fn = status_path_fn or _status_file
+        self._status_path: Optional[str] = None
+        self.debounce_seconds = debounce_seconds
+        self.max_delay_seconds = max_delay_seconds
+        self.lock_retry_seconds = lock_retry_seconds
+        self._cond = threading.Condition()
+        self._run_lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._worker_pid: Optional[int] = None
+        self._app = None
+        self._first_request_at: Optional[float] = None
+        self._due_at: Optional[float] = None
+        self._pending_requests = 0
+        self._state = 'idle'
+        self._current: Optional[Dict[str, Any]] = None
+        self._last_run: Optional[Dict[str, Any]] = None
+        self._runs = 0
+
+    def _default_reindex(self, on_progress):
+        try:
+            from services.website_kb import build_kb_index
+        except ImportError:
+            from backend.services.website_kb import build_kb_index
+        return build_kb_index(on_progress=on_progress)
+
+    def schedule(self, app=None) -> None:
+        """Request a reindex. Returns immediately; the run starts after the debounce window."""
+        if app is None:
+            from flask import current_app
+            app = current_app._get_current_object()
+        now = time.time()
+        with self._cond:
+            self._app = app
+            self._pending_requests += 1
+            if self._first_request_at is None:
+                self._first_request_at = now
+            self._due_at = min(now + self.debounce_seconds, self._first_request_at + self.max_delay_seconds)
+            if self._state == 'idle':
+                self._state = 'scheduled'
+            self._ensure_worker()
+            self._cond.notify_all()
+
+    def _ensure_worker(self) -> None:
+        # Threads do not survive a fork (gunicorn --preload): start a new worker in the child
+        if self._worker is not None and self._worker.is_alive() and self._worker_pid == os.getpid():
+            return
+        self._worker_pid = os.getpid()
+        self._worker = threading.Thread(target=self._loop, name='kb-reindex', daemon=True)
+        self._worker.start()
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while self._due_at is None or self._due_at > time.time():
+                    timeout = None if self._due_at is None else max(0.0, self._due_at - time.time())
+                    self._cond.wait(timeout)
+                app = self._app
+                requests_coalesced = self._pending_requests
+                self._due_at = None
+                self._first_request_at = None
+                self._pending_requests = 0
+            outcome, _ = self._run(app, requests_coalesced)
+            if outcome == 'busy':
+                # Another worker is reindexing and may have read the sources before our edit: retry later
+                with self._cond:
+                    self._pending_requests += requests_coalesced
+                    retry_at = time.time() + self.lock_retry_seconds
+                    self._due_at = retry_at if self._due_at is None else min(self._due_at, retry_at)
+                    self._first_request_at = self._first_request_at or time.time()
+                    self._state = 'waiting_lock'
+
+    def _set_progress(self, phase: str, info: Dict[str, Any]) -> None:
+        with self._cond:
+            if self._current is not None:
+                self._current['phase'] = phase
+                self._current.update(info)
+        self._publish()
+
+    def _publish(self, runs: Optional[int] = None) -> None:
+        """Write the current run (or the idle state) and the last run to the shared status file.
+        Only called while holding the cluster lock, so workers never write it concurrently."""
+        path = self._status_path
+        if not path:
+            return
+        with self._cond:
+            data = {
+                'pid': os.getpid(),
+                'current': dict(self._current) if self._current else None,
+                'last_run': dict(self._last_run) if self._last_run else None,
+                'runs': runs if runs is not None else self._runs,
+                'updated_at': _isoformat(time.time()),
+            }
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning("KB reindex status not written: %s", e)
+
+    def _run(self, app, requests_coalesced: int):
+        """Run one reindex. Returns ('busy', None), ('ok', stats) or ('error', message)."""
+        if not self._run_lock.acquire(blocking=False):
+            return 'busy', None
+        try:
+            with app.app_context():
+                release = self._lock_fn(app)
+                if release is None:
+                    return 'busy', None
+                self._status_path = self._status_path_fn(app)
+                shared = _read_status_file(self._status_path)
+                shared_runs = int(shared.get('runs') or 0)
+                started = time.time()
+                with self._cond:
+                    self._state = 'running'
+                    self._current = {'started_at': _isoformat(started), 'phase': 'starting',
+                                     'requests': requests_coalesced}
+                    # Keep the instance's last run visible while this one is in progress
+                    self._last_run = self._last_run or shared.get('last_run')
+                self._publish(shared_runs)
+                result: Dict[str, Any] = {'started_at': _isoformat(started), 'requests': requests_coalesced}
+                stats: Dict[str, Any] = {}
+                try:
+                    reindex_fn = self._reindex_fn or self._default_reindex
+                    stats = reindex_fn(self._set_progress) or {}
+                    result.update({'ok': True, 'error': None})
+                    result.update({k: stats.get(k) for k in ('count', 'added', 'removed', 'unchanged')})
+                except Exception as e:
+                    logger.warning("KB reindex failed: %s", e)
+                    result.update({'ok': False, 'error': str(e)})
+                finally:
+                    finished = time.time()
+                    result['finished_at'] = _isoformat(finished)
+                    result['duration_ms'] = int((finished - started) * 1000)
+                    with self._cond:
+                        self._runs += 1
+                        self._last_run = result
+                        self._current = None
+                        self._state = 'scheduled' if self._due_at is not None else 'idle'
+                    self._publish(shared_runs + 1)
+                    release()
+                if not result['ok']:
+                    return 'error', result['error']
+                return 'ok', stats
+        finally:
+            self._run_lock.release()
+
+    def run_now(self, app=None) -> Dict[str, Any]:
+        """Reindex synchronously (manual admin reindex). Raises ReindexBusy if a run is already in progress."""
+        if app is None:
+            from flask import current_app
+            app = current_app._get_current_object()
+        outcome, payload = self._run(app, 0)
+        if outcome == 'busy':
+            raise ReindexBusy("KB reindex already running")
+        if outcome == 'error':
+            raise RuntimeError(payload)
+        return payload
+
+    def status(self, app=None) -> Dict[str, Any]:
+        """
+        This process's schedule (state, scheduled_for, pending_requests) merged with the shared status file:
+        a run in progress in any worker shows as current, and last_run/runs cover every worker.
+        """
+        if app is None:
+            try:
+                from flask import current_app
+                app = current_app._get_current_object()
+            except (ImportError, RuntimeError):
+                app = None
+        with self._cond:
+            status = {
+                'state': self._state,
+                'scheduled_for': _isoformat(self._due_at),
+                'pending_requests': self._pending_requests,
+                'current': dict(self._current) if self._current else None,
+                'last_run': dict(self._last_run) if self._last_run else None,
+                'runs': self._runs,
+            }
+        shared = _read_status_file(self._status_path_fn(app)) if app is not None else {}
+        if not shared:
+            return status
+        if shared.get('current') and status['current'] is None and _pid_alive(int(shared.get('pid') or 0)):
+            status['state'] = 'running'
+            status['current'] = dict(shared['current'], pid=shared.get('pid'))
+        shared_last = shared.get('last_run')
+        if shared_last and (shared_last.get('finished_at') or '') > ((status['last_run'] or {}).get('finished_at') or ''):
+            status['last_run'] = shared_last
+        status['runs'] = max(status['runs'], int(shared.get('runs') or 0))
+        return status
+
+
+_scheduler = KBReindexScheduler()
+
+
+def schedule_kb_reindex(app=None) -> None:
+    """Debounced background reindex (call after admin content edits)."""
+    _scheduler.schedule(app)
+
+
+def run_kb_reindex_now(app=None) -> Dict[str, Any]:
+    """Synchronous reindex through the same single-flight lock. Raises ReindexBusy when one is running."""
+    return _scheduler.run_now(app)
+
+
+def get_reindex_status() -> Dict[str, Any]:
+    """Scheduler state of this process, plus current run progress and last-run stats from any worker."""
+    return _scheduler.status()
@@ -0,0 +1,362 @@
+"""
+Process-local metrics with Prometheus text exposition, safe under multi-worker gunicorn.
+Each worker updates counters/histograms in memory (one lock, no I/O on the request path); a daemon
+thread writes a snapshot to METRICS_DIR/worker_<pid>_<start time>.json every METRICS_FLUSH_SECONDS
+(the start time keeps a reused pid from overwriting an exited worker's file). /api/metrics merges all
+worker files, so any worker can answer a scrape for the whole instance. Files of workers that have
+exited are still summed; once they are METRICS_STALE_SECONDS old the next scrape folds their counters
+and histograms into METRICS_DIR/retired.json and deletes them. Merged counters stay monotonic across
+worker restarts and redeploys, and the directory does not pile up files.
+
+Env:
+  METRICS_DIR            shared directory for per-worker snapshots (default: backend/instance/metrics;
+                         empty string = this process only)
+  METRICS_FLUSH_SECONDS  snapshot interval (default 5)
+  METRICS_STALE_SECONDS  age after which a snapshot of an exited worker is folded into retired.json (default 3600)
+  METRICS_TOKEN          when set, /api/metrics requires "Authorization: Bearer <token>"
+"""
+
+import json
+import os
+import socket
+import threading
+
+try:
+    import fcntl
+except ImportError:  # not on POSIX: retiring is serialized per process only
+    fcntl = None
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'http_requests_total': ('counter', 'HTTP requests by route, method and status.', None),
+    'http_request_duration_seconds': ('histogram', 'HTTP request latency by route and method.', LATENCY_BUCKETS),
+    'db_queries_per_request': ('histogram', 'SQL statements executed per HTTP request, by route.', COUNT_BUCKETS),
+    'ai_provider_calls_total': ('counter', 'AI provider chat calls by provider, mode and outcome.', None),
+    'ai_provider_call_duration_seconds': ('histogram', 'AI provider chat call latency by provider and mode.', LATENCY_BUCKETS),
+    'embedding_requests_total': ('counter', 'Embedding API requests by provider, kind and outcome.', None),
+    'embedding_texts_total': ('counter', 'Texts sent to the embedding API by provider and kind.', None),
+    'kb_search_duration_seconds': ('histogram', 'Website KB search latency by mode.', LATENCY_BUCKETS),
+    'ai_debug_log_dropped_total': ('counter', 'AI debug log records dropped because the write queue was full.', None),
+}
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, LabelKey], float] = {}
+_histograms: Dict[Tuple[str, LabelKey], List[float]] = {}  # bucket counts..., sum, count
+_flusher_pid: Optional[int] = None
+_started_at = time.time()
+
+try:
+    FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+except ValueError:
+    FLUSH_SECONDS = 5.0
+
+try:
+    STALE_SECONDS = float(os.getenv("METRICS_STALE_SECONDS", "3600"))
+except ValueError:
+    STALE_SECONDS = 3600.0
+
+
+def _metrics_dir() -> Optional[str]:
+    path = os.getenv("METRICS_DIR")
+    if path is None:
+        path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "instance", "metrics")
+    path = path.strip()
+    if not path:
+        return None
+    if not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), path)
+    return path
+
+
+def _key(labels: Optional[Dict[str, str]]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items())) if labels else ()
+
+
+def inc(name: str, labels: Optional[Dict[str, str]] = None, value: float = 1.0) -> None:
+    key = (name, _key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0.0) + value
+    _ensure_flusher()
+
+
+def observe(name: str, value: float, labels: Optional[Dict[str, str]] = None) -> None:
+    buckets = METRICS[name][2]
+    key = (name, _key(labels))
+    with _lock:
+        hist = _histograms.get(key)
+        if hist is None:
+            hist = _histograms[key] = [0.0] * (len(buckets) + 2)
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                hist[i] += 1
+                break
+        hist[-2] += value
+        hist[-1] += 1
+    _ensure_flusher()
+
+
+def _snapshot() -> Dict[str, object]:
+    with _lock:
+        counters = [[name, list(labels), value] for (name, labels), value in _counters.items()]
+        histograms = [[name, list(labels), list(values)] for (name, labels), values in _histograms.items()]
+    return {
+        'pid': os.getpid(),
+        'host': socket.gethostname(),
+        'started_at': _started_at,
+        'updated_at': time.time(),
+        'counters': counters,
+        'histograms': histograms,
+    }
+
+
+def flush() -> None:
+    """Write this worker's snapshot (atomic replace). No-op when METRICS_DIR is empty."""
+    directory = _metrics_dir()
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"worker_{os.getpid()}_{int(_started_at * 1000)}.json")
+    _write_json(path, _snapshot())
+
+
+def _write_json(path: str, data: Dict[str, object]) -> None:
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _flush_loop() -> None:
+    while True:
+        time.sleep(FLUSH_SECONDS)
+        try:
+            flush()
+        except Exception as e:
+            print(f"[metrics] flush failed: {e}", flush=True)
+
+
+def _ensure_flusher() -> None:
+    # Started lazily so it runs in each gunicorn worker (threads do not survive the fork)
+    global _flusher_pid
+    if _flusher_pid == os.getpid():
+        return
+    with _lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    if _metrics_dir():
+        threading.Thread(target=_flush_loop, name="metrics-flush", daemon=True).start()
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _is_stale(snap: Dict[str, object], host: str, now: float) -> bool:
+    """Snapshot of a worker that has exited (or, on another host, stopped flushing) more than STALE_SECONDS ago."""
+    if now - float(snap.get('updated_at') or 0) < STALE_SECONDS:
+        return False
+    return snap.get('host') != host or not _pid_alive(int(snap.get('pid') or 0))
+
+
+def _read_json(path: str) -> Optional[Dict[str, object]]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def _merge(snapshots: Iterable[Dict[str, object]]) -> Tuple[Dict[Tuple[str, LabelKey], float], Dict[Tuple[str, LabelKey], List[float]]]:
+    """Sum the counters and histograms of several snapshots."""
+    counters: Dict[Tuple[str, LabelKey], float] = {}
+    histograms: Dict[Tuple[str, LabelKey], List[float]] = {}
+    for snap in snapshots:
+        for name, labels, value in snap.get('counters') or []:
+            key = (name, tuple(tuple(p) for p in labels))
+            counters[key] = counters.get(key, 0.0) + value
+        for name, labels, values in snap.get('histograms') or []:
+            key = (name, tuple(tuple(p) for p in labels))
+            merged = histograms.get(key)
+            if merged is None or len(merged) != len(values):
+                histograms[key] = list(values)
+            else:
+                histograms[key] = [a + b for a, b in zip(merged, values)]
+    return counters, histograms
+
+
+_retire_lock = threading.Lock()
+
+
+def _retire(directory: str, names: List[str]) -> None:
+    """
+    Fold the snapshots `names` into retired.json, then delete them. Serialized across workers with a file
+    lock; files another worker already retired are skipped, and retired.json remembers the recent names it
+    folded so a crash between the write and the delete cannot count a file twice.
+    """
+    retired_path = os.path.join(directory, "retired.json")
+    with _retire_lock, open(os.path.join(directory, "retired.lock"), "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        retired = _read_json(retired_path) or {}
+        folded = list(retired.get('folded') or [])
+        pending = []
+        for name in names:
+            snap = None if name in folded else _read_json(os.path.join(directory, name))
+            if snap is not None:
+                pending.append(snap)
+                folded.append(name)
+        if pending:
+            counters, histograms = _merge([retired] + pending)
+            _write_json(retired_path, {
+                'updated_at': time.time(),
+                'counters': [[name, list(labels), value] for (name, labels), value in counters.items()],
+                'histograms': [[name, list(labels), values] for (name, labels), values in histograms.items()],
+                'folded': folded[-1000:],
+            })
+        for name in names:
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+
+
+def _load_snapshots() -> Tuple[List[Dict[str, object]], Optional[Dict[str, object]]]:
+    """(live and recently exited worker snapshots, retired totals or None). Retires stale snapshots first."""
+    directory = _metrics_dir()
+    if not directory:
+        return [_snapshot()], None
+    try:
+        flush()
+    except Exception:
+        pass
+    host, now = socket.gethostname(), time.time()
+    snapshots, stale = [], []
+    for name in os.listdir(directory):
+        if not (name.startswith("worker_") and name.endswith(".json")):
+            continue
+        snap = _read_json(os.path.join(directory, name))
+        if snap is None:
+            continue
+        if _is_stale(snap, host, now):
+            stale.append(name)
+        else:
+            snapshots.append(snap)
+    if stale:
+        try:
+            _retire(directory, stale)
+        except OSError as e:
+            print(f"[metrics] retiring snapshots failed: {e}", flush=True)
+    return snapshots, _read_json(os.path.join(directory, "retired.json"))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(labels: Iterable[Tuple[str, str]], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs) + "}"
+
+
+def _fmt(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def render() -> str:
+    """Prometheus text exposition (version 0.0.4) of all workers' metrics merged."""
+    snapshots, retired = _load_snapshots()
+    counters, histograms = _merge(snapshots + ([retired] if retired else []))
+
+    lines: List[str] = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        if kind == 'counter':
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_labels_text(labels)} {_fmt(value)}")
+            continue
+        for (metric, labels), values in sorted(histograms.items()):
+            if metric != name:
+                continue
+            cumulative = 0.0
+            for bound, count in zip(buckets, values[:len(buckets)]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels_text(labels, ('le', _fmt(bound)))} {_fmt(cumulative)}")
+            lines.append(f"{name}_bucket{_labels_text(labels, ('le', '+Inf'))} {_fmt(values[-1])}")
+            lines.append(f"{name}_sum{_labels_text(labels)} {_fmt(values[-2])}")
+            lines.append(f"{name}_count{_labels_text(labels)} {_fmt(values[-1])}")
+
+    lines.append("# HELP app_worker_info Worker processes that reported metrics (1 = process alive).")
+    lines.append("# TYPE app_worker_info gauge")
+    host = socket.gethostname()
+    for snap in snapshots:
+        pid = int(snap.get('pid') or 0)
+        alive = snap.get('host') != host or _pid_alive(pid)
+        labels = (('host', str(snap.get('host'))), ('pid', str(pid)))
+        lines.append(f"app_worker_info{_labels_text(labels)} {1 if alive else 0}")
+    lines.append("# HELP app_worker_start_time_seconds Unix time the worker process started.")
+    lines.append("# TYPE app_worker_start_time_seconds gauge")
+    for snap in snapshots:
+        labels = (('host', str(snap.get('host'))), ('pid', str(snap.get('pid'))))
+        lines.append(f"app_worker_start_time_seconds{_labels_text(labels)} {_fmt(snap.get('started_at') or 0)}")
+    return "\n".join(lines) + "\n"
+
+
+def count_embedding(provider: str, kind: str, texts: int, ok: bool) -> None:
+    """One embedding API request carrying `texts` inputs."""
+    inc('embedding_requests_total', {'provider': provider, 'kind': kind, 'outcome': 'ok' if ok else 'error'})
+    if ok:
+        inc('embedding_texts_total', {'provider': provider, 'kind': kind}, texts)
+
+
+# ---------- Per-request hooks (installed by app.py) ----------
+_request_state = threading.local()
+
+
+def _count_query(conn, cursor, statement, parameters, context, executemany) -> None:
+    state = getattr(_request_state, "queries", None)
+    if state is not None:
+        _request_state.queries = state + 1
+
+
+def install_sqlalchemy_hooks() -> None:
+    """Count SQL statements per request (statements on worker threads are not attributed to the request)."""
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    if not event.contains(Engine, "before_cursor_execute", _count_query):
+        event.listen(Engine, "before_cursor_execute", _count_query)
+
+
+def start_request() -> None:
+    _request_state.started = time.perf_counter()
+    _request_state.queries = 0
+
+
+def end_request(route: str, method: str, status: int) -> None:
+    started = getattr(_request_state, "started", None)
+    if started is None:
+        return
+    queries = getattr(_request_state, "queries", 0) or 0
+    _request_state.started = None
+    _request_state.queries = None
+    observe('http_request_duration_seconds', time.perf_counter() - started, {'route': route, 'method': method})
+    observe('db_queries_per_request', queries, {'route': route})
+    inc('http_requests_total', {'route': route, 'method': method, 'status': str(status)})
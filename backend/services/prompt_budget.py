@@ -0,0 +1,150 @@
+"""
+Token-budgeted prompt assembly for LLM calls (chat planner, session generation).
+Prompts are built from named sections, each with a token budget; list sections (KB snippets, exercise
+library) keep the most relevant items that fit. Token counts are estimated (no tokenizer dependency):
+about 4 characters per token for Latin text and 2 for Persian/Arabic, which errs on the high side.
+
+Static text (instructions, action catalogs) belongs in the system prompt and must not depend on the
+request, so providers with prompt caching (OpenAI automatic prefix caching, Anthropic cache_control)
+can reuse it between calls; use static_prompt() to memoize it.
+
+Env (token budgets):
+  PROMPT_BUDGET_PROFILE   member profile summary (default 200)
+  PROMPT_BUDGET_KB        all KB snippets together (default 600)
+  PROMPT_BUDGET_KB_ITEM   one KB snippet (default 250)
+  PROMPT_BUDGET_LIBRARY   exercise library list (default 900)
+  PROMPT_BUDGET_TRAINING  admin training/injury config (default 500)
+  PROMPT_BUDGET_PREVIOUS  previous session summary (default 300)
+"""
+
+import functools
+import os
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+BUDGETS = {
+    'profile': _env_int("PROMPT_BUDGET_PROFILE", 200),
+    'kb': _env_int("PROMPT_BUDGET_KB", 600),
+    'kb_item': _env_int("PROMPT_BUDGET_KB_ITEM", 250),
+    'library': _env_int("PROMPT_BUDGET_LIBRARY", 900),
+    'training': _env_int("PROMPT_BUDGET_TRAINING", 500),
+    'previous': _env_int("PROMPT_BUDGET_PREVIOUS", 300),
+}
+
+ELLIPSIS = "…"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count: ~4 chars/token for ASCII, ~2 chars/token for other scripts."""
+    if not text:
+        return 0
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return (len(text) - non_ascii + 3) // 4 + (non_ascii + 1) // 2
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to about max_tokens, at a word boundary when there is one, marking the cut with '…'."""
+    if not text or estimate_tokens(text) <= max_tokens:
+        return text or ""
+    if max_tokens <= 0:
+        return ""
+    lo, hi = 0, len(text)
+    while lo < hi:  # longest prefix that fits, leaving a token for the marker
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) <= max_tokens - 1:
+            lo = mid
+        else:
+            hi = mid - 1
+    cut = text[:lo]
+    space = cut.rfind(" ")
+    if space > lo * 0.6:
+        cut = cut[:space]
+    return cut.rstrip() + ELLIPSIS
+
+
+def select_items(
+    items: Sequence[str],
+    max_tokens: int,
+    scores: Optional[Sequence[float]] = None,
+    item_max_tokens: Optional[int] = None,
+    separator: str = "\n",
+) -> List[str]:
+    """
+    Most relevant items that fit in max_tokens together. scores (higher = more relevant) default to
+    the given order; each item is first cut to item_max_tokens. Returned best first.
+    """
+    order = range(len(items))
+    if scores is not None:
+        order = sorted(order, key=lambda i: scores[i], reverse=True)
+    sep_tokens = estimate_tokens(separator)
+    chosen: List[str] = []
+    used = 0
+    for i in order:
+        text = items[i]
+        if item_max_tokens is not None:
+            text = truncate_to_tokens(text, item_max_tokens)
+        if not text:
+            continue
+        cost = estimate_tokens(text) + (sep_tokens if chosen else 0)
+        if used + cost > max_tokens:
+            continue
+        chosen.append(text)
+        used += cost
+    return chosen
+
+
+class PromptBuilder:
+    """
+    Ordered prompt sections with per-section token budgets. Sections with no budget are kept whole.
+    build() joins the non-empty sections; report() gives the estimated tokens per section.
+    """
+
+    def __init__(self, separator: str = "\n\n"):
+        self.separator = separator
+        self._sections: List[Tuple[str, str]] = []
+
+    def add(self, name: str, text: str, max_tokens: Optional[int] = None, header: str = "") -> "PromptBuilder":
+        if text:
+            if max_tokens is not None:
+                text = truncate_to_tokens(text, max_tokens)
+            self._sections.append((name, header + text))
+        return self
+
+    def add_items(
+        self,
+        name: str,
+        items: Sequence[str],
+        max_tokens: int,
+        scores: Optional[Sequence[float]] = None,
+        item_max_tokens: Optional[int] = None,
+        header: str = "",
+        prefix: str = "",
+    ) -> "PromptBuilder":
+        # Blank items are dropped before the prefix is added, so they cannot pass as "- " and use budget
+        keep = [i for i, item in enumerate(items) if item and item.strip()]
+        chosen = select_items(
+            [prefix + items[i] for i in keep], max_tokens,
+            [scores[i] for i in keep] if scores is not None else None, item_max_tokens,
+        )
+        if chosen:
+            self._sections.append((name, header + "\n".join(chosen)))
+        return self
+
+    def build(self) -> str:
+        return self.separator.join(text for _, text in self._sections)
+
+    def report(self) -> Dict[str, int]:
+        return {name: estimate_tokens(text) for name, text in self._sections}
+
+
+def static_prompt(func: Callable[..., str]) -> Callable[..., str]:
+    """Memoize a function building a static prompt from hashable arguments (e.g. language, role).
+    Keeps the text byte-identical between calls so provider prompt caches hit."""
+    return functools.lru_cache(maxsize=64)(func)
@@ -0,0 +1,309 @@
+"""
+Chat provider routing for ai_provider: priority-ordered failover, per-provider circuit breakers and
+optional hedged requests. Provider-agnostic: call() takes provider names and a call_fn(name, last)
+that performs one attempt, so it runs the same against real SDK calls and local stub providers.
+
+Circuit breaker (per provider, per worker process): over the last AI_BREAKER_WINDOW calls, when at
+least AI_BREAKER_MIN_CALLS were made and the error rate or the slow-call rate (calls longer than
+AI_BREAKER_SLOW_SECONDS) reaches AI_BREAKER_FAILURE_RATE, the breaker opens and the provider is
+skipped for AI_BREAKER_COOLDOWN_SECONDS. Then one probe call is let through: success closes the
+breaker, failure opens it again.
+
+Hedging (AI_HEDGE=1): when the current attempt has not answered after the provider's p95 latency
+(clamped to AI_HEDGE_MIN_DELAY..AI_HEDGE_MAX_DELAY), the next provider is started as well and the
+first non-empty answer wins. The slower call is not cancelled; it finishes in the background and
+still feeds its breaker.
+"""
+
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+try:
+    from services import tracing
+except ImportError:
+    from backend.services import tracing
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+BREAKER_WINDOW = max(1, _env_int("AI_BREAKER_WINDOW", 20))
+BREAKER_MIN_CALLS = max(1, _env_int("AI_BREAKER_MIN_CALLS", 5))
+BREAKER_FAILURE_RATE = _env_float("AI_BREAKER_FAILURE_RATE", 0.5)
+BREAKER_SLOW_SECONDS = _env_float("AI_BREAKER_SLOW_SECONDS", 30.0)
+BREAKER_COOLDOWN_SECONDS = _env_float("AI_BREAKER_COOLDOWN_SECONDS", 30.0)
+HEDGE_ENABLED = str(os.getenv("AI_HEDGE", "0")).strip().lower() in ("1", "true", "yes")
+HEDGE_MIN_DELAY = _env_float("AI_HEDGE_MIN_DELAY", 2.0)
+HEDGE_MAX_DELAY = _env_float("AI_HEDGE_MAX_DELAY", 15.0)
+HEDGE_WORKERS = max(2, _env_int("AI_HEDGE_WORKERS", 8))
+# Successful-call latencies kept per provider for the p95 estimate
+LATENCY_SAMPLES = 100
+
+# call_fn(provider, last) -> answer text; last is True for the final candidate (it may retry harder)
+CallFn = Callable[[str, bool], Optional[str]]
+
+
+class CircuitOpen(RuntimeError):
+    """No provider could be tried: every candidate's breaker is open."""
+
+
+class CircuitBreaker:
+    """Error-rate and slow-call-rate breaker: closed -> open -> half_open (one probe) -> closed."""
+
+    def __init__(
+        self,
+        window: int = BREAKER_WINDOW,
+        min_calls: int = BREAKER_MIN_CALLS,
+        failure_rate: float = BREAKER_FAILURE_RATE,
+        slow_seconds: float = BREAKER_SLOW_SECONDS,
+        cooldown_seconds: float = BREAKER_COOLDOWN_SECONDS,
+    ):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_seconds = slow_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self._calls: Deque[Tuple[bool, bool]] = deque(maxlen=window)  # (ok, slow)
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self._state = 'closed'
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._opens = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """True when a call may be made now. In half_open this reserves the single probe call."""
+        with self._lock:
+            if not self._available():
+                return False
+            if self._state == 'open':
+                self._state = 'half_open'
+            if self._state == 'half_open':
+                self._probe_in_flight = True
+            return True
+
+    def available(self) -> bool:
+        """Like allow() without reserving a probe."""
+        with self._lock:
+            return self._available()
+
+    def _available(self) -> bool:
+        if self._state == 'closed':
+            return True
+        if self._state == 'open':
+            return time.monotonic() - self._opened_at >= self.cooldown_seconds
+        return not self._probe_in_flight
+
+    def record(self, ok: bool, latency: float) -> None:
+        slow = latency >= self.slow_seconds
+        with self._lock:
+            if ok:
+                self._latencies.append(latency)
+            if self._state == 'half_open':
+                self._probe_in_flight = False
+                if ok and not slow:
+                    self._state = 'closed'
+                    self._calls.clear()
+                else:
+                    self._trip()
+                return
+            self._calls.append((ok, slow))
+            if self._state == 'closed' and len(self._calls) >= self.min_calls:
+                failures = sum(1 for c_ok, _ in self._calls if not c_ok)
+                slow_calls = sum(1 for _, c_slow in self._calls if c_slow)
+                n = len(self._calls)
+                if failures / n >= self.failure_rate or slow_calls / n >= self.failure_rate:
+                    self._trip()
+
+    def _trip(self) -> None:
+        self._state = 'open'
+        self._opened_at = time.monotonic()
+        self._opens += 1
+        self._calls.clear()
+
+    def p95(self) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._latencies)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        p95 = self.p95()
+        with self._lock:
+            calls = list(self._calls)
+            return {
+                'state': self._state,
+                'recent_calls': len(calls),
+                'recent_errors': sum(1 for ok, _ in calls if not ok),
+                'recent_slow': sum(1 for _, slow in calls if slow),
+                'opens': self._opens,
+                'p95_ms': round(p95 * 1000, 1) if p95 is not None else None,
+            }
+
+
+class ProviderRouter:
+    """Tries providers in priority order; see the module docstring for breakers and hedging."""
+
+    def __init__(
+        self,
+        hedge_enabled: bool = HEDGE_ENABLED,
+        hedge_min_delay: float = HEDGE_MIN_DELAY,
+        hedge_max_delay: float = HEDGE_MAX_DELAY,
+        breaker_factory: Callable[[], CircuitBreaker] = CircuitBreaker,
+    ):
+        self.hedge_enabled = hedge_enabled
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_delay = hedge_max_delay
+        self._breaker_factory = breaker_factory
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._stats = {'calls': 0, 'failovers': 0, 'hedges': 0, 'hedge_wins': 0, 'short_circuited': 0, 'failed': 0}
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        with self._lock:
+            b = self._breakers.get(provider)
+            if b is None:
+                b = self._breakers[provider] = self._breaker_factory()
+            return b
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def _attempt(self, provider: str, call_fn: CallFn, last: bool) -> Tuple[Optional[str], Optional[str]]:
+        """One call. Returns (text, error); feeds the provider's breaker."""
+        started = time.monotonic()
+        try:
+            text = call_fn(provider, last)
+        except Exception as e:
+            self.breaker(provider).record(False, time.monotonic() - started)
+            return None, str(e) or e.__class__.__name__
+        self.breaker(provider).record(True, time.monotonic() - started)
+        return text, None
+
+    def _hedge_delay(self, provider: str) -> float:
+        p95 = self.breaker(provider).p95()
+        if p95 is None:
+            return self.hedge_max_delay
+        return min(self.hedge_max_delay, max(self.hedge_min_delay, p95))
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix='llm-hedge')
+            return self._pool
+
+    def call(self, providers: Sequence[str], call_fn: CallFn) -> Tuple[Optional[str], Optional[str], List[str]]:
+        """
+        Return (text, provider that answered, errors). text is None when every provider failed or
+        answered empty; errors lists "<provider>: <error>" per failed attempt. Raises CircuitOpen when
+        every breaker is open.
+        """
+        self._count('calls')
+        providers = list(providers)
+        if not any(self.breaker(p).available() for p in providers):
+            self._count('short_circuited')
+            self._count('failed')
+            raise CircuitOpen("All AI providers are temporarily disabled after repeated failures: " + ", ".join(providers))
+        if self.hedge_enabled and len(providers) > 1:
+            text, provider, errors = self._call_hedged(providers, call_fn)
+        else:
+            text, provider, errors = self._call_sequential(providers, call_fn)
+        if text is None:
+            self._count('failed')
+        return text, provider, errors
+
+    def next_allowed(self, providers: List[str], start: int = 0) -> Tuple[Optional[int], bool]:
+        """Index of the next provider from start whose breaker allows a call, and whether it is the last one."""
+        for i in range(start, len(providers)):
+            if self.breaker(providers[i]).allow():
+                last = not any(self.breaker(p).available() for p in providers[i + 1:])
+                return i, last
+            self._count('short_circuited')
+        return None, True
+
+    def _call_sequential(self, providers: List[str], call_fn: CallFn) -> Tuple[Optional[str], Optional[str], List[str]]:
+        errors: List[str] = []
+        idx, last = self.next_allowed(providers, 0)
+        while idx is not None:
+            name = providers[idx]
+            text, err = self._attempt(name, call_fn, last)
+            if text:
+                return text, name, errors
+            errors.append(f"{name}: {err or 'empty response'}")
+            idx, last = self.next_allowed(providers, idx + 1)
+            if idx is not None:
+                self._count('failovers')
+        return None, None, errors
+
+    def _call_hedged(self, providers: List[str], call_fn: CallFn) -> Tuple[Optional[str], Optional[str], List[str]]:
+        pool = self._get_pool()
+        trace = tracing.current_trace()
+        pending: Dict[Any, str] = {}
+        errors: List[str] = []
+        next_start = 0
+        first_name: Optional[str] = None
+
+        def run(name: str, last: bool):
+            with tracing.use_trace(trace):
+                return self._attempt(name, call_fn, last)
+
+        def launch() -> Optional[str]:
+            nonlocal next_start
+            idx, last = self.next_allowed(providers, next_start)
+            if idx is None:
+                next_start = len(providers)
+                return None
+            next_start = idx + 1
+            pending[pool.submit(run, providers[idx], last)] = providers[idx]
+            return providers[idx]
+
+        first_name = launch()
+        current = first_name
+        while pending:
+            can_hedge = next_start < len(providers) and len(pending) == 1
+            timeout = self._hedge_delay(current) if can_hedge else None
+            done, _ = wait(list(pending), timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                hedged = launch()
+                if hedged is not None:
+                    self._count('hedges')
+                    current = hedged
+                continue
+            for fut in done:
+                name = pending.pop(fut)
+                text, err = fut.result()
+                if text:
+                    if name != first_name and pending:
+                        self._count('hedge_wins')
+                    return text, name, errors
+                errors.append(f"{name}: {err or 'empty response'}")
+            if not pending:
+                current = launch()
+                if current is not None:
+                    self._count('failovers')
+        return None, None, errors
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            breakers = dict(self._breakers)
+        stats['hedge_enabled'] = self.hedge_enabled
+        stats['providers'] = {name: b.snapshot() for name, b in breakers.items()}
+        return stats
@@ -0,0 +1,185 @@
+"""
+SQL query-count guard and N+1 detector for development and tests.
+Hooks SQLAlchemy's before_cursor_execute, records every statement run while a QueryRecorder is active
+on the current thread/context, and groups statements by shape (literals and bind values stripped).
+A shape repeated N+1_THRESHOLD times or more in one request is reported as a likely N+1.
+
+In the app (SQL_QUERY_GUARD=1) each request gets a recorder: responses carry X-Query-Count and, when
+detected, X-Query-N-Plus-One headers, and offenders are logged. In tests:
+
+    from services.query_guard import count_queries
+
+    def test_members_list(client):
+        with count_queries(max_queries=5):
+            client.get('/api/admin/members')
+
+or use the query_budget pytest fixture (import it into conftest.py):
+
+    def test_threads(client, query_budget):
+        with query_budget(max_queries=4, forbid_n_plus_one=True):
+            client.get('/api/messages/threads')
+
+Statements on other threads (action pool, background workers) are not attributed to the request.
+
+Env:
+  SQL_QUERY_GUARD            record queries per request (default off)
+  SQL_QUERY_GUARD_MAX        log a warning when a request runs more statements than this (default 50)
+  SQL_N_PLUS_ONE_THRESHOLD   repeats of one statement shape reported as N+1 (default 5)
+"""
+
+import logging
+import os
+import re
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List, Optional, Tuple
+
+# The query_budget fixture is only defined under pytest; the app never imports pytest itself
+if "pytest" in sys.modules:
+    import pytest
+    HAS_PYTEST = True
+else:
+    pytest = None
+    HAS_PYTEST = False
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, str(default)))
+    except ValueError:
+        return default
+
+
+ENABLED = str(os.getenv("SQL_QUERY_GUARD", "0")).strip().lower() in ("1", "true", "yes")
+MAX_QUERIES = _env_int("SQL_QUERY_GUARD_MAX", 50)
+N_PLUS_ONE_THRESHOLD = max(2, _env_int("SQL_N_PLUS_ONE_THRESHOLD", 5))
+
+_active: ContextVar[Tuple["QueryRecorder", ...]] = ContextVar("query_recorders", default=())
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_BIND_PARAM = re.compile(r"%\(\w+\)s|:\w+|\?|%s|\$\d+")
+_IN_LIST = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+_POSTCOMPILE = re.compile(r"\(?__\[POSTCOMPILE_\w+\]\)?")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """Statement with literals and bind parameters replaced by ?, IN lists collapsed, whitespace squeezed."""
+    shape = _POSTCOMPILE.sub("(?)", statement)
+    shape = _STRING_LITERAL.sub("?", shape)
+    shape = _BIND_PARAM.sub("?", shape)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = _IN_LIST.sub("IN (?)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised by count_queries when the block ran more statements than allowed, or an N+1 was forbidden."""
+
+
+class QueryRecorder:
+    """Statements executed while active; see the module docstring."""
+
+    def __init__(self, n_plus_one_threshold: int = N_PLUS_ONE_THRESHOLD):
+        self.n_plus_one_threshold = n_plus_one_threshold
+        self.statements: List[str] = []
+        self.started = time.perf_counter()
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def shapes(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for statement in self.statements:
+            shape = statement_shape(statement)
+            counts[shape] = counts.get(shape, 0) + 1
+        return counts
+
+    def n_plus_one(self) -> List[Tuple[str, int]]:
+        """(shape, repeats) of shapes run at least n_plus_one_threshold times, most repeated first."""
+        repeated = [(s, n) for s, n in self.shapes().items() if n >= self.n_plus_one_threshold]
+        return sorted(repeated, key=lambda item: item[1], reverse=True)
+
+    def summary(self, limit: int = 5) -> str:
+        lines = [f"{self.count} SQL statements"]
+        for shape, n in sorted(self.shapes().items(), key=lambda item: item[1], reverse=True)[:limit]:
+            lines.append(f"  {n}x {shape[:200]}")
+        return "\n".join(lines)
+
+
+def _on_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    recorders = _active.get()
+    if recorders:
+        for recorder in recorders:
+            recorder.statements.append(statement)
+
+
+def install_sqlalchemy_hooks() -> None:
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    if not event.contains(Engine, "before_cursor_execute", _on_execute):
+        event.listen(Engine, "before_cursor_execute", _on_execute)
+
+
+def start_recording(n_plus_one_threshold: int = N_PLUS_ONE_THRESHOLD):
+    """Activate a new recorder in the current context. Returns (recorder, token for stop_recording)."""
+    install_sqlalchemy_hooks()
+    recorder = QueryRecorder(n_plus_one_threshold)
+    token = _active.set(_active.get() + (recorder,))
+    return recorder, token
+
+
+def stop_recording(token) -> None:
+    _active.reset(token)
+
+
+@contextmanager
+def count_queries(
+    max_queries: Optional[int] = None,
+    forbid_n_plus_one: bool = False,
+    n_plus_one_threshold: int = N_PLUS_ONE_THRESHOLD,
+):
+    """Record statements run in the block; raise QueryBudgetExceeded when max_queries is exceeded or,
+    with forbid_n_plus_one, when a statement shape repeats n_plus_one_threshold times."""
+    recorder, token = start_recording(n_plus_one_threshold)
+    try:
+        yield recorder
+    finally:
+        stop_recording(token)
+    if max_queries is not None and recorder.count > max_queries:
+        raise QueryBudgetExceeded(f"Expected at most {max_queries} queries, got {recorder.summary()}")
+    if forbid_n_plus_one and recorder.n_plus_one():
+        raise QueryBudgetExceeded(f"N+1 query pattern: {recorder.summary()}")
+
+
+# ---------- Per-request guard (installed by app.py when SQL_QUERY_GUARD=1) ----------
+def begin_request():
+    return start_recording()
+
+
+def end_request(state, route: str, response=None) -> None:
+    """Stop the request's recorder, add X-Query-Count / X-Query-N-Plus-One headers and log offenders."""
+    recorder, token = state
+    stop_recording(token)
+    repeated = recorder.n_plus_one()
+    if response is not None:
+        response.headers['X-Query-Count'] = str(recorder.count)
+        if repeated:
+            response.headers['X-Query-N-Plus-One'] = str(repeated[0][1])
+    if repeated:
+        logger.warning("[query_guard] possible N+1 in %s: %s", route, recorder.summary())
+    elif recorder.count > MAX_QUERIES:
+        logger.warning("[query_guard] %s ran %s", route, recorder.summary())
+
+
+if HAS_PYTEST:
+    @pytest.fixture
+    def query_budget():
+        """Pytest fixture returning count_queries: `with query_budget(max_queries=3): client.get(...)`."""
+        return count_queries
@@ -6,6 +6,12 @@ Uses the admin-configured AI provider (OpenAI, Anthropic, or Gemini) via service
 import json
 from typing import Dict, Any, List, Optional, Tuple
 
+from services.prompt_budget import BUDGETS, PromptBuilder, static_prompt, truncate_to_tokens
+
+TRAINING_LEVELS = ('beginner', 'intermediate', 'advanced')
+# Exercises considered for the library section of session prompts (ranked, then cut to the token budget)
+LIBRARY_CANDIDATES = 200
+
 
 def _ai_chat(system: str, user: str, max_tokens: int = 800, db=None) -> Optional[str]:
     """Call the configured AI provider (from admin AI settings). Returns None if unavailable.
@@ -352,6 +358,65 @@ Rules:
     return None
 
 
+def _movement_terms(movement) -> str:
+    """Lower-cased fa/en text of an injury config movement, for matching against exercise names."""
+    if isinstance(movement, dict):
+        return " ".join(str(movement.get(k) or '') for k in ('fa', 'en')).strip().lower()
+    return str(movement or '').strip().lower()
+
+
+def _exercise_relevance(ex, training_level: str, gender: str, allowed_terms: List[str],
+                        forbidden_terms: List[str], previous_names: set) -> Optional[float]:
+    """Rank an exercise for the session prompt library. None = must not be offered (forbidden movement)."""
+    names = [(ex.name_fa or '').strip().lower(), (ex.name_en or '').strip().lower()]
+
+    def matches(term: str) -> bool:
+        return bool(term) and any(n and (n in term or term in n) for n in names)
+
+    if any(matches(t) for t in forbidden_terms):
+        return None
+    score = 0.0
+    if any(matches(t) for t in allowed_terms):
+        score += 3
+    level = (ex.level or '').strip().lower()
+    if level == training_level:
+        score += 2
+    elif level in TRAINING_LEVELS and training_level in TRAINING_LEVELS \
+            and TRAINING_LEVELS.index(level) < TRAINING_LEVELS.index(training_level):
+        score += 1
+    suitability = (ex.gender_suitability or 'both').strip().lower()
+    if suitability == 'both' or not gender or suitability == gender.strip().lower():
+        score += 1
+    if ex.name_en in previous_names:
+        score += 1  # lets the model progress the same movements
+    return score
+
+
+@static_prompt
+def _single_session_system_prompt(lang_fa: bool) -> str:
+    """Instructions for _generate_single_session. Static per language (request values go in the user
+    prompt) so provider prompt caches can reuse it."""
+    if lang_fa:
+        return """تو یک مربی حرفه‌ای تناسب اندام هستی. بر اساس اطلاعات عضو و تنظیمات ادمین، دقیقاً یک جلسه تمرینی طراحی کن.
+قوانین:
+- هدف اصلی عضو (purpose در Session to design) را رعایت کن. sets، reps، rest مطابق Admin Config.
+- خروجی فقط یک آرایه JSON معتبر با دقیقاً ۱ جلسه باشد. جلسه: week و day مطابق Session to design، name_fa، name_en، exercises.
+- هر exercise: name_fa, name_en, sets, reps, rest, instructions_fa, instructions_en.
+- فقط از حرکات لیست Exercise Library استفاده کن. نام حرکت را دقیقاً از لیست کپی کن.
+- سطح (training_level)، اهداف و آسیب‌ها را رعایت کن.
+- اگر عضو آسیب دارد: حرکات اصلاحی را در تمرین اصلی ادغام کن. فقط از حرکات ALLOWED استفاده کن. حرکات FORBIDDEN را هرگز استفاده نکن.
+- بدون توضیح اضافه؛ فقط آرایه JSON با ۱ جلسه."""
+    return """You are a professional fitness coach. Based on member info and admin Training Info, design exactly 1 training session.
+Rules:
+- The member's primary purpose (purpose in Session to design) MUST drive the design. Use sets, reps, rest from Admin Config.
+- Output only a valid JSON array with exactly 1 session. Session: week and day as in Session to design, name_fa, name_en, exercises.
+- Each exercise: name_fa, name_en, sets, reps, rest, instructions_fa, instructions_en.
+- Use ONLY exercises from the Exercise Library list. Copy exercise names exactly.
+- Respect training level (training_level), fitness goals, and injuries.
+- If member has injuries: merge corrective movements into the main training. Use ONLY ALLOWED movements. NEVER use FORBIDDEN movements.
+- No extra text; only the JSON array with 1 session."""
+
+
 def _generate_single_session(
     user_id: int,
     program_id: int,
@@ -413,6 +478,8 @@ def _generate_single_session(
 
     # Get admin's Training Info (Configuration)
     admin_training_info = ""
+    allowed_terms: List[str] = []
+    forbidden_terms: List[str] = []
     try:
         config = db.session.query(Configuration).first()
         if config and config.training_levels:
@@ -452,6 +519,8 @@ def _generate_single_session(
                 forbidden = val.get('forbidden_movements') or []
                 allowed_str = ", ".join(_movement_text(m) for m in allowed[:12] if m)
                 forbidden_str = ", ".join(_movement_text(m) for m in forbidden[:12] if m)
+                allowed_terms.extend(_movement_terms(m) for m in allowed)
+                forbidden_terms.extend(_movement_terms(m) for m in forbidden)
                 admin_training_info += (
                     f"\nInjury {inj_key}: purposes={purposes_fa}/{purposes_en}. "
                     f"ALLOWED movements (use these, include corrective where appropriate): {allowed_str or 'none'}. "
@@ -461,15 +530,11 @@ def _generate_single_session(
         pass
 
     # Get exercise library
-    exercises = db.session.query(Exercise).order_by(Exercise.id).limit(80).all()
+    exercises = db.session.query(Exercise).order_by(Exercise.id).limit(LIBRARY_CANDIDATES).all()
     if profile and profile.gym_access is False:
         exercises = [e for e in exercises if e.category and 'functional' in (e.category or '').lower()]
     if not exercises:
         exercises = db.session.query(Exercise).limit(50).all()
-    exercise_list = []
-    for ex in exercises:
-        exercise_list.append(f"{ex.name_fa} / {ex.name_en} (target: {ex.target_muscle_fa or ex.target_muscle_en})")
-    exercises_text = "\n".join(exercise_list[:50])
 
     # Compute week/day for the single session we're generating
     week = (session_index // workout_days) + 1
@@ -477,7 +542,9 @@ def _generate_single_session(
 
     lang_fa = language == 'fa'
     prev_context = ""
+    previous_names = set()
     if previous_session:
+        previous_names = {e.get("name_en") for e in (previous_session.get("exercises") or []) if e.get("name_en")}
         prev_summary = json.dumps({
             "week": previous_session.get("week"),
             "day": previous_session.get("day"),
@@ -488,36 +555,31 @@ def _generate_single_session(
                 for e in (previous_session.get("exercises") or [])[:8]
             ],
         }, ensure_ascii=False)
-        prev_context = f"\n\nPrevious session (design current to progress from this):\n{prev_summary}"
-
-    system_fa = f"""تو یک مربی حرفه‌ای تناسب اندام هستی. بر اساس اطلاعات عضو و تنظیمات ادمین، دقیقاً یک جلسه تمرینی طراحی کن.
-قوانین:
-- هدف اصلی عضو (purpose={purpose}) را رعایت کن. sets، reps، rest مطابق Admin Config.
-- خروجی فقط یک آرایه JSON معتبر با دقیقاً ۱ جلسه باشد. جلسه: week={week}, day={day}، name_fa، name_en، exercises.
-- هر exercise: name_fa, name_en, sets, reps, rest, instructions_fa, instructions_en.
-- فقط از حرکات لیست Exercise Library استفاده کن. نام حرکت را دقیقاً از لیست کپی کن.
-- سطح ({training_level})، اهداف و آسیب‌ها را رعایت کن.
-- اگر عضو آسیب دارد: حرکات اصلاحی را در تمرین اصلی ادغام کن. فقط از حرکات ALLOWED استفاده کن. حرکات FORBIDDEN را هرگز استفاده نکن.
-- بدون توضیح اضافه؛ فقط آرایه JSON با ۱ جلسه."""
-    system_en = f"""You are a professional fitness coach. Based on member info and admin Training Info, design exactly 1 training session.
-Rules:
-- The member's primary purpose (purpose={purpose}) MUST drive the design. Use sets, reps, rest from Admin Config.
-- Output only a valid JSON array with exactly 1 session. Session: week={week}, day={day}, name_fa, name_en, exercises.
-- Each exercise: name_fa, name_en, sets, reps, rest, instructions_fa, instructions_en.
-- Use ONLY exercises from the Exercise Library list. Copy exercise names exactly.
-- Respect training level ({training_level}), fitness goals, and injuries.
-- If member has injuries: merge corrective movements into the main training. Use ONLY ALLOWED movements. NEVER use FORBIDDEN movements.
-- No extra text; only the JSON array with 1 session."""
-
-    user_msg = f"""Member profile: {profile_summary}
+        prev_context = "Previous session (design current to progress from this):\n" + truncate_to_tokens(prev_summary, BUDGETS['previous'])
 
-Admin Training Info:
-{admin_training_info}
-
-Exercise Library (use only these - copy names exactly):
-{exercises_text}{prev_context}"""
+    # Library section: forbidden movements dropped, the rest ranked by relevance and cut to the token budget
+    gender = (profile.gender if profile else '') or ''
+    exercise_list = []
+    exercise_scores = []
+    for ex in exercises:
+        score = _exercise_relevance(ex, training_level, gender, allowed_terms, forbidden_terms, previous_names)
+        if score is None:
+            continue
+        exercise_list.append(f"{ex.name_fa} / {ex.name_en} (target: {ex.target_muscle_fa or ex.target_muscle_en})")
+        exercise_scores.append(score)
+
+    builder = PromptBuilder()
+    builder.add('session', f"Session to design: week={week}, day={day}, purpose={purpose}, training_level={training_level}")
+    builder.add('profile', profile_summary, BUDGETS['profile'], header="Member profile: ")
+    builder.add('training', admin_training_info, BUDGETS['training'], header="Admin Training Info:\n")
+    builder.add_items(
+        'library', exercise_list, BUDGETS['library'], scores=exercise_scores,
+        header="Exercise Library (use only these - copy names exactly):\n",
+    )
+    builder.add('previous', prev_context)
+    user_msg = builder.build()
 
-    out = _ai_chat(system_fa if lang_fa else system_en, user_msg, max_tokens=2500, db=db)
+    out = _ai_chat(_single_session_system_prompt(lang_fa), user_msg, max_tokens=2500, db=db)
     if not out:
         from services.ai_provider import get_last_chat_error
         api_err = get_last_chat_error()
@@ -0,0 +1,150 @@
+"""
+Lightweight per-request span tracing for the chat pipeline.
+A trace is started per chat request (app.chat); code on the request path records spans with the
+span() context manager, the traced() decorator, or add_span() for a stage it already timed. Spans are
+written to the ai_debug.jsonl entry of the turn and, when SERVER_TIMING_HEADER is on, returned in a
+Server-Timing response header. With no active trace every call is a cheap no-op.
+
+Worker threads do not inherit the trace: capture current_trace() before submitting and wrap the
+worker in use_trace(trace).
+
+Env:
+  CHAT_TRACE            record spans for chat requests (default on)
+  SERVER_TIMING_HEADER  add a Server-Timing header to JSON chat responses (default off)
+"""
+
+import functools
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+
+def _env_flag(name: str, default: str) -> bool:
+    return str(os.getenv(name, default)).strip().lower() in ("1", "true", "yes")
+
+
+TRACE_ENABLED = _env_flag("CHAT_TRACE", "1")
+SERVER_TIMING_ENABLED = _env_flag("SERVER_TIMING_HEADER", "0")
+
+_current: ContextVar[Optional["Trace"]] = ContextVar("chat_trace", default=None)
+_TOKEN_UNSAFE = re.compile(r"[^A-Za-z0-9_.\-]")
+
+
+class Trace:
+    """Spans of one request. Safe to add to from several threads."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self._spans: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+
+    def add(self, name: str, start: float, end: float, attrs: Optional[Dict[str, Any]] = None) -> None:
+        span = {
+            "name": name,
+            "start_ms": round((start - self.started) * 1000, 1),
+            "duration_ms": round((end - start) * 1000, 1),
+            "thread": threading.current_thread().name,
+        }
+        if attrs:
+            span.update(attrs)
+        with self._lock:
+            self._spans.append(span)
+
+    def spans(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return sorted(self._spans, key=lambda s: s["start_ms"])
+
+    def total_ms(self) -> float:
+        return round((time.perf_counter() - self.started) * 1000, 1)
+
+    def server_timing(self) -> str:
+        """Server-Timing value: one entry per span name (durations summed, count in desc), plus total."""
+        totals: Dict[str, List[float]] = {}
+        for span in self.spans():
+            entry = totals.setdefault(_TOKEN_UNSAFE.sub("_", span["name"]), [0.0, 0])
+            entry[0] += span["duration_ms"]
+            entry[1] += 1
+        parts = [
+            f'{name};dur={dur:.1f}' + (f';desc="x{count}"' if count > 1 else "")
+            for name, (dur, count) in totals.items()
+        ]
+        parts.append(f"total;dur={self.total_ms():.1f}")
+        return ", ".join(parts)
+
+
+def start_trace(name: str):
+    """Begin a trace in the current context. Returns a token for end_trace (None when tracing is off)."""
+    if not TRACE_ENABLED:
+        return None
+    return _current.set(Trace(name))
+
+
+def end_trace(token) -> Optional[Trace]:
+    """End the trace started with token and return it."""
+    if token is None:
+        return None
+    trace = _current.get()
+    _current.reset(token)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+def current_spans() -> Optional[List[Dict[str, Any]]]:
+    trace = _current.get()
+    return trace.spans() if trace is not None else None
+
+
+@contextmanager
+def use_trace(trace: Optional[Trace]):
+    """Make trace current on a worker thread for the duration of the block."""
+    if trace is None:
+        yield
+        return
+    token = _current.set(trace)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+def add_span(name: str, start: float, end: Optional[float] = None, **attrs) -> None:
+    """Record a span from perf_counter() timestamps taken by the caller."""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, start, end if end is not None else time.perf_counter(), attrs)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.perf_counter(), attrs)
+
+
+def traced(name: Optional[str] = None) -> Callable:
+    """Decorator: record each call of the function as a span (default name: module.function)."""
+    def decorator(func):
+        span_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return func(*args, **kwargs)
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
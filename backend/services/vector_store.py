@@ -3,11 +3,21 @@ Vector store for Website KB - REST only (no SDKs).
 Uses sqlite-vec + Vertex/Gemini or OpenAI embeddings via REST API.
 """
 
+import hashlib
 import json
 import os
 import sqlite3
+import threading
+import time
 import requests
-from typing import List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    from services import embedding_cache, kb_lexical, metrics
+except ImportError:
+    from backend.services import embedding_cache, kb_lexical, metrics
 
 try:
     import sqlite_vec
@@ -24,6 +34,18 @@ DEFAULT_EMBEDDING_MODEL = (
     else os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
 )
 DEFAULT_EMBEDDING_DIM = int(os.getenv("VECTOR_EMBEDDING_DIM", "768" if EMBEDDING_PROVIDER == "vertex" else "1536"))
+# Reindex embeds chunks in batches (one request per batch), several batches in flight at once
+EMBEDDING_BATCH_SIZE = max(1, int(os.getenv("EMBEDDING_BATCH_SIZE", "32")))
+EMBEDDING_BATCH_WORKERS = max(1, int(os.getenv("EMBEDDING_BATCH_WORKERS", "4")))
+EMBEDDING_BATCH_RETRIES = max(0, int(os.getenv("EMBEDDING_BATCH_RETRIES", "4")))
+# Readers wait this long for a reindex write lock instead of failing with "database is locked"
+SQLITE_BUSY_TIMEOUT_MS = max(0, int(os.getenv("WEBSITE_KB_VEC_BUSY_TIMEOUT_MS", "5000")))
+
+# One open connection per (thread, db path); extension loaded and schema verified once per process.
+# A thread's connections are closed with its thread-local state when the thread exits.
+_local = threading.local()
+_schema_ready = set()
+_schema_lock = threading.Lock()
 
 
 def _sqlite_db_path(db_uri: str) -> Optional[str]:
@@ -71,35 +93,117 @@ def _ensure_schema(conn: sqlite3.Connection) -> None:
         "id INTEGER PRIMARY KEY AUTOINCREMENT,"
         "content TEXT NOT NULL)"
     )
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(website_kb_chunks)").fetchall()]
+    if "content_hash" not in columns:
+        conn.execute("ALTER TABLE website_kb_chunks ADD COLUMN content_hash TEXT")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_website_kb_chunks_hash ON website_kb_chunks (content_hash)"
+    )
     conn.execute(
         f"CREATE VIRTUAL TABLE IF NOT EXISTS website_kb_embeddings "
         f"USING vec0(embedding float[{DEFAULT_EMBEDDING_DIM}], chunk_id INTEGER)"
     )
     conn.commit()
+    _ensure_fts(conn)
+
+
+def _ensure_fts(conn: sqlite3.Connection) -> None:
+    """Keyword index (rowid = chunk id, normalized text). Backfilled when it is out of step with the chunks."""
+    try:
+        conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS website_kb_fts "
+            "USING fts5(content, tokenize='unicode61 remove_diacritics 2')"
+        )
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5: search falls back to vector only
+        return
+    fts_count = conn.execute("SELECT COUNT(*) FROM website_kb_fts").fetchone()[0]
+    chunk_count = conn.execute("SELECT COUNT(*) FROM website_kb_chunks").fetchone()[0]
+    if fts_count != chunk_count:
+        conn.execute("DELETE FROM website_kb_fts")
+        rows = conn.execute("SELECT id, content FROM website_kb_chunks").fetchall()
+        conn.executemany(
+            "INSERT INTO website_kb_fts (rowid, content) VALUES (?, ?)",
+            [(row_id, kb_lexical.normalize_for_search(content)) for row_id, content in rows],
+        )
+    conn.commit()
+
+
+def _has_fts(conn: sqlite3.Connection) -> bool:
+    row = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'website_kb_fts'").fetchone()
+    return row is not None
+
+
+def _open_connection(db_path: str) -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path, timeout=SQLITE_BUSY_TIMEOUT_MS / 1000.0)
+    try:
+        _load_vec_extension(conn)
+        conn.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        if db_path not in _schema_ready:
+            with _schema_lock:
+                if db_path not in _schema_ready:
+                    _ensure_schema(conn)
+                    _schema_ready.add(db_path)
+    except Exception:
+        conn.close()
+        raise
+    return conn
 
 
 def _connect(db_uri: str) -> sqlite3.Connection:
+    """Return this thread's connection for the vector DB, opening it on first use."""
     db_path = _sqlite_db_path(db_uri)
     if not db_path:
         raise RuntimeError(
             "Vector store requires SQLite. Use DATABASE_URL=sqlite:///... or set "
             "WEBSITE_KB_VEC_DB=instance/website_kb_vec.db"
         )
-    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
-    conn = sqlite3.connect(db_path)
-    _load_vec_extension(conn)
-    _ensure_schema(conn)
+    pid = os.getpid()
+    conns = getattr(_local, "conns", None)
+    if conns is None or getattr(_local, "pid", None) != pid:
+        # Connections must not cross a fork (gunicorn --preload): start a fresh set in the child
+        conns = _local.conns = {}
+        _local.pid = pid
+    conn = conns.get(db_path)
+    if conn is None:
+        conn = conns[db_path] = _open_connection(db_path)
     return conn
 
 
+@contextmanager
+def _connection(db_uri: str):
+    """Borrow this thread's connection; rolls back an open transaction if the block raises."""
+    conn = _connect(db_uri)
+    try:
+        yield conn
+    except Exception:
+        try:
+            conn.rollback()
+        except sqlite3.Error:
+            _drop_connection(db_uri)
+        raise
+
+
+def _drop_connection(db_uri: str) -> None:
+    db_path = _sqlite_db_path(db_uri)
+    conn = (getattr(_local, "conns", None) or {}).pop(db_path, None)
+    if conn is not None:
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+
 def is_enabled(db_uri: str) -> bool:
     if not HAS_SQLITE_VEC:
         return False
     if not _sqlite_db_path(db_uri):
         return False
     try:
-        conn = _connect(db_uri)
-        conn.close()
+        _connect(db_uri)
         return True
     except Exception:
         return False
@@ -180,9 +284,145 @@ def _embed_openai_rest(text: str) -> List[float]:
 
 def embed_text(text: str) -> List[float]:
     """Embed text using Vertex or OpenAI via REST only."""
+    try:
+        if EMBEDDING_PROVIDER == "vertex":
+            vector = _embed_vertex_rest(text)
+        else:
+            vector = _embed_openai_rest(text)
+    except Exception:
+        metrics.count_embedding(EMBEDDING_PROVIDER, "single", 1, ok=False)
+        raise
+    metrics.count_embedding(EMBEDDING_PROVIDER, "single", 1, ok=True)
+    return vector
+
+
+def _embedding_api_key() -> str:
+    """API key for the configured embedding provider. Raises when none is configured."""
     if EMBEDDING_PROVIDER == "vertex":
-        return _embed_vertex_rest(text)
-    return _embed_openai_rest(text)
+        api_key = _get_vertex_api_key()
+        if not api_key:
+            raise RuntimeError(
+                "Vertex API key required. Set VERTEX_API_KEY or GOOGLE_API_KEY, "
+                "or configure Vertex in Admin > AI Settings."
+            )
+        return api_key
+    api_key = _get_openai_api_key()
+    if not api_key:
+        raise RuntimeError(
+            "OpenAI API key required. Set OPENAI_API_KEY or configure OpenAI in Admin > AI Settings."
+        )
+    return api_key
+
+
+def _embed_batch_rest(texts: List[str], api_key: str) -> List[List[float]]:
+    """One REST request for several texts: Vertex predict with multiple instances, or OpenAI list input."""
+    if EMBEDDING_PROVIDER == "vertex":
+        endpoint = f"https://aiplatform.googleapis.com/v1/publishers/google/models/{DEFAULT_EMBEDDING_MODEL}:predict"
+        payload = {"instances": [{"content": t} for t in texts]}
+        resp = requests.post(endpoint, params={"key": api_key}, json=payload, timeout=60)
+        resp.raise_for_status()
+        predictions = resp.json().get("predictions") or []
+        if len(predictions) != len(texts):
+            raise RuntimeError(f"Vertex returned {len(predictions)} embeddings for {len(texts)} texts.")
+        return [list((p.get("embeddings") or {}).get("values") or []) for p in predictions]
+    url = "https://api.openai.com/v1/embeddings"
+    headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+    payload = {"model": DEFAULT_EMBEDDING_MODEL, "input": texts}
+    resp = requests.post(url, headers=headers, json=payload, timeout=60)
+    resp.raise_for_status()
+    items = sorted(resp.json().get("data") or [], key=lambda d: d.get("index", 0))
+    if len(items) != len(texts):
+        raise RuntimeError(f"OpenAI returned {len(items)} embeddings for {len(texts)} texts.")
+    return [list(item.get("embedding") or []) for item in items]
+
+
+def _embed_batch_with_retry(texts: List[str], api_key: str) -> List[List[float]]:
+    """Embed one batch, backing off and retrying on 429 (honours Retry-After when sent)."""
+    for attempt in range(EMBEDDING_BATCH_RETRIES + 1):
+        try:
+            vectors = _embed_batch_rest(texts, api_key)
+        except Exception as e:
+            metrics.count_embedding(EMBEDDING_PROVIDER, "batch", len(texts), ok=False)
+            if not isinstance(e, requests.HTTPError):
+                raise
+            resp = e.response
+            if resp is None or resp.status_code != 429 or attempt >= EMBEDDING_BATCH_RETRIES:
+                raise
+            try:
+                wait = float(resp.headers.get("Retry-After") or 0)
+            except ValueError:
+                wait = 0
+            time.sleep(wait or min(30, 2 ** attempt))
+            continue
+        metrics.count_embedding(EMBEDDING_PROVIDER, "batch", len(texts), ok=True)
+        return vectors
+    raise RuntimeError("Embedding batch failed: retries exhausted")
+
+
+def embed_texts(texts: List[str]) -> Tuple[List[Optional[List[float]]], List[str]]:
+    """
+    Embed many texts in batches of EMBEDDING_BATCH_SIZE, up to EMBEDDING_BATCH_WORKERS batches
+    concurrently. Returns (vectors, errors); vectors[i] is None when the batch holding texts[i] failed.
+    """
+    if not texts:
+        return [], []
+    # Resolve the key here: worker threads have no Flask app context for Admin settings
+    api_key = _embedding_api_key()
+    batches = [texts[i:i + EMBEDDING_BATCH_SIZE] for i in range(0, len(texts), EMBEDDING_BATCH_SIZE)]
+
+    def run(batch: List[str]):
+        try:
+            return _embed_batch_with_retry(batch, api_key), None
+        except Exception as e:
+            return [None] * len(batch), str(e)
+
+    if len(batches) == 1:
+        outcomes = [run(batches[0])]
+    else:
+        with ThreadPoolExecutor(max_workers=min(EMBEDDING_BATCH_WORKERS, len(batches))) as pool:
+            outcomes = list(pool.map(run, batches))
+    vectors: List[Optional[List[float]]] = []
+    errors: List[str] = []
+    for batch_vectors, error in outcomes:
+        vectors.extend(batch_vectors)
+        if error:
+            errors.append(error)
+    return vectors, errors
+
+
+def embed_query(text: str) -> List[float]:
+    """Embed a search query through the shared query-embedding cache."""
+    return embedding_cache.get_or_embed(
+        EMBEDDING_PROVIDER, DEFAULT_EMBEDDING_MODEL, DEFAULT_EMBEDDING_DIM, text, embed_text
+    )
+
+
+def content_hash(text: str) -> str:
+    """Hash of a chunk plus the embedding model: a changed model re-embeds everything."""
+    raw = f"{EMBEDDING_PROVIDER}:{DEFAULT_EMBEDDING_MODEL}:{DEFAULT_EMBEDDING_DIM}\x1f{text}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def plan_incremental_reindex(
+    chunks: List[str], existing: List[Tuple[int, Optional[str]]]
+) -> Tuple[List[Tuple[str, str]], List[int], Dict[str, int]]:
+    """
+    Compare wanted chunks with existing (id, content_hash) rows.
+    Returns (to_add as (hash, text) in chunk order, stale row ids to delete, kept {hash: row id}).
+    Rows without a hash (indexed before hashing existed) and duplicate rows are stale.
+    """
+    wanted: Dict[str, str] = {}
+    for chunk in chunks:
+        wanted.setdefault(content_hash(chunk), chunk)
+    kept: Dict[str, int] = {}
+    stale_ids: List[int] = []
+    for row_id, row_hash in existing:
+        if row_hash and row_hash in wanted and row_hash not in kept:
+            kept[row_hash] = row_id
+        else:
+            stale_ids.append(row_id)
+    to_add = [(h, text) for h, text in wanted.items() if h not in kept]
+    return to_add, stale_ids, kept
 
 
 def _chunk_text(text: str, chunk_size: int = 800, overlap: int = 120) -> List[str]:
@@ -204,42 +444,94 @@ def _chunk_text(text: str, chunk_size: int = 800, overlap: int = 120) -> List[st
 
 
 def reindex_website_kb(db_uri: str, kb_text: str) -> Tuple[int, List[str]]:
-    errors: List[str] = []
     if not kb_text or not kb_text.strip():
         return 0, ["KB text is empty."]
     chunks = _chunk_text(kb_text)
     if not chunks:
         return 0, ["No chunks produced from KB text."]
-
+    stats = reindex_website_kb_chunks(db_uri, chunks)
+    return stats["count"], stats["errors"]
+
+
+def reindex_website_kb_chunks(
+    db_uri: str,
+    chunks: List[str],
+    embed_fn: Optional[Callable[[List[str]], Tuple[List[Optional[List[float]]], List[str]]]] = None,
+    on_progress: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+) -> Dict[str, Any]:
+    """
+    Incremental reindex: only chunks whose content hash is new are embedded; rows whose hash is
+    no longer wanted are deleted. All or nothing: if any embedding batch or insert fails, the tables are
+    left as they were (errors set, added/removed 0). Returns {count, added, removed, unchanged, errors}.
+    embed_fn defaults to embed_texts; on_progress(phase, info) reports the embedding/writing phases.
+    """
+    progress = on_progress or (lambda phase, info: None)
+    if not chunks:
+        return {"count": 0, "added": 0, "removed": 0, "unchanged": 0, "errors": ["No chunks produced from KB text."]}
     if not _sqlite_db_path(db_uri):
-        return 0, ["Vector store requires SQLite. Use DATABASE_URL=sqlite:///... or WEBSITE_KB_VEC_DB."]
-
-    conn = _connect(db_uri)
-    try:
-        conn.execute("DELETE FROM website_kb_chunks")
-        conn.execute("DELETE FROM website_kb_embeddings")
-        conn.commit()
-
-        for chunk in chunks:
+        return {"count": 0, "added": 0, "removed": 0, "unchanged": 0,
+                "errors": ["Vector store requires SQLite. Use DATABASE_URL=sqlite:///... or WEBSITE_KB_VEC_DB."]}
+
+    with _connection(db_uri) as conn:
+        existing = conn.execute("SELECT id, content_hash FROM website_kb_chunks").fetchall()
+    to_add, stale_ids, kept = plan_incremental_reindex(chunks, existing)
+    unchanged = len(kept)
+
+    # Embed before touching the tables so searches keep the old index while the reindex runs
+    progress("embedding", {"chunks": len(to_add), "unchanged": unchanged})
+    vectors, errors = (embed_fn or embed_texts)([text for _, text in to_add])
+    errors = list(errors)
+    if errors or any(vector is None for vector in vectors):
+        # Keep the previous chunks searchable rather than deleting content whose replacement is missing
+        return {"count": len(existing), "added": 0, "removed": 0, "unchanged": unchanged,
+                "errors": errors or ["Embedding failed for some chunks."]}
+
+    progress("writing", {"add": len(to_add), "remove": len(stale_ids)})
+
+    added = 0
+    with _connection(db_uri) as conn:
+        has_fts = _has_fts(conn)
+        for start in range(0, len(stale_ids), 500):
+            batch = stale_ids[start:start + 500]
+            placeholders = ",".join("?" for _ in batch)
+            conn.execute(f"DELETE FROM website_kb_embeddings WHERE chunk_id IN ({placeholders})", tuple(batch))
+            conn.execute(f"DELETE FROM website_kb_chunks WHERE id IN ({placeholders})", tuple(batch))
+            if has_fts:
+                conn.execute(f"DELETE FROM website_kb_fts WHERE rowid IN ({placeholders})", tuple(batch))
+
+        for (chunk_hash, chunk), vector in zip(to_add, vectors):
             try:
-                vector = embed_text(chunk)
                 if len(vector) != DEFAULT_EMBEDDING_DIM:
                     raise RuntimeError(f"Embedding dimension mismatch: {len(vector)} != {DEFAULT_EMBEDDING_DIM}")
                 cursor = conn.execute(
-                    "INSERT INTO website_kb_chunks (content) VALUES (?)",
-                    (chunk,)
+                    "INSERT INTO website_kb_chunks (content, content_hash) VALUES (?, ?)",
+                    (chunk, chunk_hash)
                 )
                 chunk_id = cursor.lastrowid
                 conn.execute(
                     "INSERT INTO website_kb_embeddings (chunk_id, embedding) VALUES (?, ?)",
                     (chunk_id, _serialize_vector(vector))
                 )
+                if has_fts:
+                    conn.execute(
+                        "INSERT INTO website_kb_fts (rowid, content) VALUES (?, ?)",
+                        (chunk_id, kb_lexical.normalize_for_search(chunk))
+                    )
+                added += 1
             except Exception as e:
                 errors.append(str(e))
+        if errors:
+            conn.rollback()
+            return {"count": len(existing), "added": 0, "removed": 0, "unchanged": unchanged,
+                    "errors": errors}
         conn.commit()
-        return len(chunks), errors
-    finally:
-        conn.close()
+        return {
+            "count": unchanged + added,
+            "added": added,
+            "removed": len(stale_ids),
+            "unchanged": unchanged,
+            "errors": errors,
+        }
 
 
 def search_website_kb(db_uri: str, query_text: str, limit: int = 4) -> List[str]:
@@ -247,13 +539,15 @@ def search_website_kb(db_uri: str, query_text: str, limit: int = 4) -> List[str]
         return []
     if not _sqlite_db_path(db_uri):
         return []
+    vector = embed_query(query_text)
+    return [text for _, text in search_website_kb_vector(db_uri, vector, limit)]
 
-    vector = embed_text(query_text)
-    if len(vector) != DEFAULT_EMBEDDING_DIM:
-        return []
 
-    conn = _connect(db_uri)
-    try:
+def search_website_kb_vector(db_uri: str, vector: List[float], limit: int = 4) -> List[Tuple[int, str]]:
+    """Nearest chunks to an already computed query embedding, as (chunk id, content) best first."""
+    if not _sqlite_db_path(db_uri) or len(vector) != DEFAULT_EMBEDDING_DIM:
+        return []
+    with _connection(db_uri) as conn:
         cursor = conn.execute(
             "SELECT chunk_id FROM website_kb_embeddings "
             "WHERE embedding MATCH ? "
@@ -266,23 +560,49 @@ def search_website_kb(db_uri: str, query_text: str, limit: int = 4) -> List[str]
             return []
         placeholders = ",".join("?" for _ in ids)
         rows = conn.execute(
-            f"SELECT content FROM website_kb_chunks WHERE id IN ({placeholders})",
+            f"SELECT id, content FROM website_kb_chunks WHERE id IN ({placeholders})",
             tuple(ids)
         ).fetchall()
-        return [row[0] for row in rows if row and row[0]]
-    finally:
-        conn.close()
+    content = {row[0]: row[1] for row in rows if row and row[1]}
+    return [(chunk_id, content[chunk_id]) for chunk_id in ids if chunk_id in content]
+
+
+def search_website_kb_lexical(db_uri: str, query_text: str, limit: int = 4) -> List[Tuple[int, str]]:
+    """FTS5 keyword search (BM25 ranked), as (chunk id, content) best first. No embedding call."""
+    if not _sqlite_db_path(db_uri):
+        return []
+    match = kb_lexical.fts_match_query(query_text)
+    if not match:
+        return []
+    with _connection(db_uri) as conn:
+        if not _has_fts(conn):
+            return []
+        rows = conn.execute(
+            "SELECT c.id, c.content FROM website_kb_fts f "
+            "JOIN website_kb_chunks c ON c.id = f.rowid "
+            "WHERE website_kb_fts MATCH ? "
+            "ORDER BY bm25(website_kb_fts) "
+            "LIMIT ?",
+            (match, limit)
+        ).fetchall()
+    return [(row[0], row[1]) for row in rows if row[1]]
+
+
+def get_website_kb_stamp(db_uri: str) -> Tuple[int, int]:
+    """(row count, max id) of website_kb_chunks: changes whenever a reindex adds or removes chunks."""
+    if not _sqlite_db_path(db_uri):
+        return (0, 0)
+    with _connection(db_uri) as conn:
+        row = conn.execute("SELECT COUNT(*), COALESCE(MAX(id), 0) FROM website_kb_chunks").fetchone()
+    return (row[0], row[1]) if row else (0, 0)
 
 
 def get_website_kb_count(db_uri: str) -> int:
     if not _sqlite_db_path(db_uri):
         return 0
     try:
-        conn = _connect(db_uri)
-        try:
+        with _connection(db_uri) as conn:
             row = conn.execute("SELECT COUNT(*) FROM website_kb_chunks").fetchone()
             return row[0] if row else 0
-        finally:
-            conn.close()
     except Exception:
         return 0
@@ -8,14 +8,29 @@ import json
 import logging
 import math
 import os
+import threading
+import time
 
 logger = logging.getLogger(__name__)
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from datetime import datetime
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
 import requests
 from flask import current_app
 
+try:
+    from services import embedding_cache, kb_lexical, metrics, tracing
+except ImportError:
+    from backend.services import embedding_cache, kb_lexical, metrics, tracing
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    np = None
+    HAS_NUMPY = False
+
 try:
     from services import vector_store
     HAS_VECTOR_STORE = True
@@ -28,6 +43,33 @@ except ImportError:
         HAS_VECTOR_STORE = False
 
 
+# Process-level KB matrix index for the PostgreSQL path: (generation, db_stamp, checked_at, ids, texts, matrix).
+# build_kb_index bumps _kb_generation; reindexes done by other workers are noticed through a cheap
+# (count, max id, max updated_at) stamp checked at most every KB_INDEX_REFRESH_SECONDS.
+try:
+    KB_INDEX_REFRESH_SECONDS = float(os.getenv("KB_INDEX_REFRESH_SECONDS", "30"))
+except ValueError:
+    KB_INDEX_REFRESH_SECONDS = 30.0
+_kb_generation = 0
+_kb_index: Optional[Tuple[int, Any, float, List[int], List[str], Any]] = None
+_kb_index_lock = threading.Lock()
+# BM25 index over the same texts as _kb_index: (texts list it was built from, index)
+_kb_lexical: Optional[Tuple[List[str], Any]] = None
+
+# search_kb mode: hybrid (keyword + vector, fused with RRF), vector, or lexical (no embedding call)
+KB_SEARCH_MODE = (os.getenv("KB_SEARCH_MODE") or "hybrid").strip().lower()
+# Hybrid search answers from the keyword index alone when the query embedding takes longer than this,
+# and skips embedding entirely for KB_EMBED_BACKOFF_SECONDS after a timeout or error.
+try:
+    KB_EMBED_TIMEOUT_SECONDS = float(os.getenv("KB_EMBED_TIMEOUT_SECONDS", "2"))
+    KB_EMBED_BACKOFF_SECONDS = float(os.getenv("KB_EMBED_BACKOFF_SECONDS", "30"))
+except ValueError:
+    KB_EMBED_TIMEOUT_SECONDS, KB_EMBED_BACKOFF_SECONDS = 2.0, 30.0
+_embed_pool: Optional[ThreadPoolExecutor] = None
+_embed_pool_lock = threading.Lock()
+_embed_unavailable_until = 0.0
+
+
 def _get_embedding_api_key() -> tuple:
     """Get Vertex or OpenAI API key from env or Admin AI Settings. Returns (key, provider)."""
     provider = (os.getenv("EMBEDDING_PROVIDER") or "vertex").strip().lower()
@@ -73,6 +115,16 @@ def _embed_via_rest(text: str) -> List[float]:
             "Embedding API key required. Set VERTEX_API_KEY or GOOGLE_API_KEY, "
             "or configure Vertex/Gemini in Admin > AI Settings."
         )
+    try:
+        vector = _embed_with_key(text, api_key, provider)
+    except Exception:
+        metrics.count_embedding(provider, "single", 1, ok=False)
+        raise
+    metrics.count_embedding(provider, "single", 1, ok=True)
+    return vector
+
+
+def _embed_with_key(text: str, api_key: str, provider: str) -> List[float]:
     if provider == "vertex":
         model = os.getenv("VERTEX_EMBEDDING_MODEL", "text-embedding-004")
         endpoint = f"https://aiplatform.googleapis.com/v1/publishers/google/models/{model}:predict"
@@ -127,12 +179,39 @@ def _generate_embedding(text: str) -> List[float]:
     return _embed_via_rest(text)
 
 
-def get_kb_source_text() -> str:
-    """Build KB source from all website data: SiteSettings, Configuration, Exercises, Session phases. No manual editing."""
+def _generate_embeddings(texts: List[str]) -> List[List[float]]:
+    """Embed many chunks, batched and concurrent when vector_store is available. Raises on any failure."""
+    if HAS_VECTOR_STORE and vector_store and hasattr(vector_store, 'embed_texts'):
+        vectors, errors = vector_store.embed_texts(texts)
+        if errors:
+            raise RuntimeError("; ".join(errors[:3]))
+        return vectors
+    return [_embed_via_rest(t) for t in texts]
+
+
+def _generate_query_embedding(query: str) -> List[float]:
+    """Embed a search query through the shared query-embedding cache."""
+    if HAS_VECTOR_STORE and vector_store and hasattr(vector_store, 'embed_query'):
+        return vector_store.embed_query(query)
+    provider = (os.getenv("EMBEDDING_PROVIDER") or "vertex").strip().lower()
+    model = (
+        os.getenv("VERTEX_EMBEDDING_MODEL", "text-embedding-004")
+        if provider == "vertex"
+        else os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small")
+    )
+    return embedding_cache.get_or_embed(provider, model, None, query, _embed_via_rest)
+
+
+def get_kb_sections() -> List[Tuple[str, str]]:
+    """
+    Build KB source from all website data: SiteSettings, Configuration, Exercises, Session phases. No manual editing.
+    Returns (section_key, text) pairs with stable boundaries: one per site/config section and one per exercise
+    ('exercise:<id>'), so editing one exercise only changes that exercise's chunks.
+    """
     db = _get_db()
     from models import SiteSettings, Configuration, Exercise
 
-    parts: List[str] = []
+    parts: List[Tuple[str, str]] = []
 
     # --- Site Settings ---
     try:
@@ -190,7 +269,7 @@ def get_kb_source_text() -> str:
                 except json.JSONDecodeError:
                     pass
             if site_parts:
-                parts.append("## Site Settings\n" + "\n".join(site_parts))
+                parts.append(("site_settings", "## Site Settings\n" + "\n".join(site_parts)))
     except Exception:
         pass
 
@@ -225,7 +304,7 @@ def get_kb_source_text() -> str:
                             )
                     level_texts.append("")
                 if level_texts:
-                    parts.append("## Training Levels Info\n" + "\n".join(level_texts))
+                    parts.append(("training_levels", "## Training Levels Info\n" + "\n".join(level_texts)))
             except json.JSONDecodeError:
                 pass
 
@@ -260,7 +339,7 @@ def get_kb_source_text() -> str:
                         injury_texts.append(f"  notes: {notes_fa} / {notes_en}")
                     injury_texts.append("")
                 if injury_texts:
-                    parts.append("## Injuries & Corrective Movements\n" + "\n".join(injury_texts))
+                    parts.append(("injuries", "## Injuries & Corrective Movements\n" + "\n".join(injury_texts)))
             except json.JSONDecodeError:
                 pass
     except Exception:
@@ -270,9 +349,9 @@ def get_kb_source_text() -> str:
     try:
         exercises = db.session.query(Exercise).order_by(Exercise.id).all()
         if exercises:
-            ex_parts = []
             for ex in exercises:
-                ex_parts.append(
+                parts.append((
+                    f"exercise:{ex.id}",
                     f"Exercise: {ex.name_fa} / {ex.name_en} | "
                     f"target: {ex.target_muscle_fa} / {ex.target_muscle_en} | "
                     f"level={ex.level} intensity={ex.intensity} | "
@@ -281,36 +360,56 @@ def get_kb_source_text() -> str:
                     f"equipment_fa={ex.equipment_needed_fa or ''} equipment_en={ex.equipment_needed_en or ''} | "
                     f"trainer_notes_fa={ex.trainer_notes_fa or ''} trainer_notes_en={ex.trainer_notes_en or ''} | "
                     f"injury_contraindications={ex.injury_contraindications or ''}"
-                )
-            if ex_parts:
-                parts.append("## Exercise Library\n" + "\n".join(ex_parts))
+                ))
     except Exception:
         pass
 
+    return parts
+
+
+def get_kb_source_text() -> str:
+    """Whole KB source as one document (sections, then the exercise library under one heading)."""
+    sections = get_kb_sections()
+    parts = [text for key, text in sections if not key.startswith("exercise:")]
+    exercises = [text for key, text in sections if key.startswith("exercise:")]
+    if exercises:
+        parts.append("## Exercise Library\n" + "\n".join(exercises))
     return "\n\n".join(parts) if parts else ''
 
 
+def get_kb_chunks() -> List[str]:
+    """Chunk each KB section on its own (800 chars, 120 overlap) so chunk boundaries never cross sections."""
+    chunks: List[str] = []
+    for _key, text in get_kb_sections():
+        chunks.extend(_chunk_text(text))
+    return chunks
+
+
 def trigger_kb_reindex_safe() -> bool:
-    """Reindex KB after website content changes (synchronous)."""
+    """Reindex KB now (synchronous), through the same single-flight lock as background reindexes."""
     try:
-        build_kb_index()
+        try:
+            from services.kb_reindex import run_kb_reindex_now
+        except ImportError:
+            from backend.services.kb_reindex import run_kb_reindex_now
+        run_kb_reindex_now()
         return True
     except Exception as e:
-        import logging
-        logging.getLogger(__name__).warning("KB auto-reindex failed: %s", e)
+        logger.warning("KB auto-reindex failed: %s", e)
         return False
 
 
 def trigger_kb_reindex_async() -> bool:
-    """Reindex KB in background so UI responses return immediately."""
+    """Schedule a debounced background reindex so UI responses return immediately."""
     try:
-        import threading
-        t = threading.Thread(target=trigger_kb_reindex_safe, daemon=True)
-        t.start()
+        try:
+            from services.kb_reindex import schedule_kb_reindex
+        except ImportError:
+            from backend.services.kb_reindex import schedule_kb_reindex
+        schedule_kb_reindex()
         return True
     except Exception as e:
-        import logging
-        logging.getLogger(__name__).warning("KB async reindex failed: %s", e)
+        logger.warning("KB async reindex failed: %s", e)
         return False
 
 
@@ -335,45 +434,199 @@ def _chunk_text(text: str) -> List[str]:
     return chunks
 
 
-def build_kb_index() -> Dict[str, Any]:
-    """Build KB index. Uses sqlite-vec when SQLite, else SQLAlchemy WebsiteKBChunk. Vertex/OpenAI embeddings."""
-    text = get_kb_source_text()
-    logger.info("[KB Reindex] KB text length=%s chars, use_sqlite_vec=%s", len(text or ""), _use_sqlite_vec())
+def build_kb_index(embed_fn=None, on_progress=None) -> Dict[str, Any]:
+    """
+    Build KB index incrementally. Uses sqlite-vec when SQLite, else SQLAlchemy WebsiteKBChunk. Vertex/OpenAI embeddings.
+    Chunks are content-hashed: only new/changed chunks are embedded and chunks no longer in the source are deleted.
+    embed_fn(texts) -> (vectors, errors) replaces vector_store.embed_texts (tests pass a fake embedder);
+    on_progress(phase, info) is called as the reindex moves through collecting/embedding/writing.
+    """
+    progress = on_progress or (lambda phase, info: None)
+    progress('collecting', {})
+    chunks = get_kb_chunks()
+    logger.info("[KB Reindex] %s chunks, use_sqlite_vec=%s", len(chunks), _use_sqlite_vec())
 
     if _use_sqlite_vec():
         uri = _get_db_uri()
-        count, errors = vector_store.reindex_website_kb(uri, text)
-        if errors:
-            raise RuntimeError("; ".join(errors[:3]))
+        if not chunks:
+            raise RuntimeError("KB text is empty.")
+        stats = vector_store.reindex_website_kb_chunks(uri, chunks, embed_fn=embed_fn, on_progress=progress)
+        if stats.get('errors'):
+            raise RuntimeError("; ".join(stats['errors'][:3]))
+        if stats['added'] or stats['removed']:
+            bump_kb_generation()
+        logger.info("[KB Reindex] added=%s removed=%s unchanged=%s", stats['added'], stats['removed'], stats['unchanged'])
         return {
             'updated_at': datetime.utcnow().isoformat(),
-            'count': count,
+            'count': stats['count'],
+            'added': stats['added'],
+            'removed': stats['removed'],
+            'unchanged': stats['unchanged'],
         }
 
     # PostgreSQL fallback: SQLAlchemy WebsiteKBChunk
     db = _get_db()
     from models import WebsiteKBChunk
 
-    chunks = _chunk_text(text)
-    db.session.query(WebsiteKBChunk).delete()
-    db.session.commit()
+    existing = [(row_id, row_hash) for row_id, row_hash in
+                db.session.query(WebsiteKBChunk.id, WebsiteKBChunk.content_hash).all()]
+    if HAS_VECTOR_STORE and vector_store and hasattr(vector_store, 'plan_incremental_reindex'):
+        to_add, stale_ids, kept = vector_store.plan_incremental_reindex(chunks, existing)
+    else:
+        # No hashing helper available: full rebuild
+        to_add = [(None, chunk) for chunk in chunks]
+        stale_ids = [row_id for row_id, _ in existing]
+        kept = {}
+
+    # Embed before touching the table so searches keep the old index while the reindex runs
+    progress('embedding', {'chunks': len(to_add), 'unchanged': len(kept)})
+    if embed_fn is not None:
+        embeddings, errors = embed_fn([text for _, text in to_add])
+        if errors:
+            raise RuntimeError("; ".join(errors[:3]))
+    else:
+        embeddings = _generate_embeddings([text for _, text in to_add])
+
+    progress('writing', {'add': len(to_add), 'remove': len(stale_ids)})
 
-    for idx, chunk in enumerate(chunks):
-        embedding = _generate_embedding(chunk)
+    for start in range(0, len(stale_ids), 500):
+        batch = stale_ids[start:start + 500]
+        db.session.query(WebsiteKBChunk).filter(WebsiteKBChunk.id.in_(batch)).delete(synchronize_session=False)
+    # Kept rows hold their chunk_index (the search id), so new rows are numbered after the highest one left
+    from sqlalchemy import func
+    next_index = (db.session.query(func.max(WebsiteKBChunk.chunk_index)).scalar() or 0) + 1
+    for (chunk_hash, chunk), embedding in zip(to_add, embeddings):
         row = WebsiteKBChunk(
-            chunk_index=idx + 1,
+            chunk_index=next_index,
             text=chunk,
+            content_hash=chunk_hash,
             embedding_json=json.dumps(embedding),
         )
         db.session.add(row)
+        next_index += 1
+    db.session.flush()
+    total, distinct = db.session.query(
+        func.count(WebsiteKBChunk.id), func.count(func.distinct(WebsiteKBChunk.chunk_index))
+    ).one()
+    if total != distinct:
+        db.session.rollback()
+        raise RuntimeError(f"KB reindex left duplicate chunk ids ({total} rows, {distinct} distinct); rolled back.")
     db.session.commit()
+    if to_add or stale_ids:
+        bump_kb_generation()
+    logger.info("[KB Reindex] added=%s removed=%s unchanged=%s", len(to_add), len(stale_ids), len(kept))
 
     return {
         'updated_at': datetime.utcnow().isoformat(),
-        'count': len(chunks),
+        'count': len(kept) + len(to_add),
+        'added': len(to_add),
+        'removed': len(stale_ids),
+        'unchanged': len(kept),
     }
 
 
+def bump_kb_generation() -> int:
+    """Invalidate the in-memory KB index; it is rebuilt lazily on the next search."""
+    global _kb_generation
+    with _kb_index_lock:
+        _kb_generation += 1
+        return _kb_generation
+
+
+def get_kb_version() -> str:
+    """
+    Version of the KB content for keying caches derived from it (planner plans). Combines this process's
+    generation with a (count, max id, ...) stamp of the chunk table, so reindexes by any worker change it.
+    """
+    try:
+        if _use_sqlite_vec():
+            stamp = vector_store.get_website_kb_stamp(_get_db_uri())
+        else:
+            stamp = _kb_db_stamp()
+    except Exception as e:
+        logger.warning("[KB] version stamp unavailable: %s", e)
+        stamp = ()
+    return f"{_kb_generation}:{':'.join(str(part) for part in stamp)}"
+
+
+def _kb_db_stamp() -> Tuple[Any, ...]:
+    """Cheap fingerprint of website_kb_chunks, changes whenever any worker reindexes."""
+    db = _get_db()
+    from models import WebsiteKBChunk
+    from sqlalchemy import func
+
+    row = db.session.query(
+        func.count(WebsiteKBChunk.id), func.max(WebsiteKBChunk.id), func.max(WebsiteKBChunk.updated_at)
+    ).one()
+    return tuple(row)
+
+
+def _build_kb_matrix() -> Tuple[List[int], List[str], Any]:
+    """Load chunks once into a float32 matrix of L2-normalized embeddings (rows with other dims are skipped)."""
+    chunks = [c for c in load_kb_chunks() if c.get('embedding')]
+    if not chunks:
+        return [], [], None
+    dim = len(chunks[0]['embedding'])
+    chunks = [c for c in chunks if len(c['embedding']) == dim]
+    matrix = np.asarray([c['embedding'] for c in chunks], dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return [c['id'] for c in chunks], [c['text'] for c in chunks], matrix
+
+
+def _get_kb_matrix() -> Tuple[List[int], List[str], Any]:
+    """Return (ids, texts, matrix), rebuilding only when the generation or the DB stamp changed."""
+    global _kb_index
+    index = _kb_index
+    now = time.time()
+    if index is not None and index[0] == _kb_generation and now - index[2] < KB_INDEX_REFRESH_SECONDS:
+        return index[3], index[4], index[5]
+    with _kb_index_lock:
+        index = _kb_index
+        generation = _kb_generation
+        stamp = _kb_db_stamp()
+        if index is not None and index[0] == generation and index[1] == stamp:
+            _kb_index = (generation, stamp, now, index[3], index[4], index[5])
+            return index[3], index[4], index[5]
+        ids, texts, matrix = _build_kb_matrix()
+        _kb_index = (generation, stamp, now, ids, texts, matrix)
+        logger.info("[KB Index] Built in-memory index: %s chunks (generation %s)", len(ids), generation)
+        return ids, texts, matrix
+
+
+def _search_kb_matrix(q_embed: List[float], top_k: int) -> List[Dict[str, Any]]:
+    """Cosine top-k over the in-memory matrix: one matrix-vector product plus argpartition."""
+    ids, texts, matrix = _get_kb_matrix()
+    if matrix is None or not ids:
+        return []
+    q = np.asarray(q_embed, dtype=np.float32)
+    if q.shape[0] != matrix.shape[1]:
+        return []
+    q_norm = float(np.linalg.norm(q))
+    if q_norm == 0:
+        return []
+    scores = matrix @ (q / q_norm)
+    k = min(top_k, scores.shape[0])
+    if k < scores.shape[0]:
+        top = np.argpartition(-scores, k - 1)[:k]
+    else:
+        top = np.arange(scores.shape[0])
+    top = top[np.argsort(-scores[top])]
+    return [{'score': float(scores[i]), 'text': texts[i], 'id': ids[i]} for i in top]
+
+
+def _get_kb_bm25(texts: List[str]):
+    """BM25 index for the current in-memory chunk list, rebuilt when the list is replaced."""
+    global _kb_lexical
+    cached = _kb_lexical
+    if cached is not None and cached[0] is texts:
+        return cached[1]
+    index = kb_lexical.BM25Index(texts)
+    _kb_lexical = (texts, index)
+    return index
+
+
 def load_kb_chunks() -> List[Dict[str, Any]]:
     """Load chunks (PostgreSQL path only)."""
     db = _get_db()
@@ -405,34 +658,132 @@ def _cosine_similarity(a: List[float], b: List[float]) -> float:
     return dot / (norm_a * norm_b)
 
 
-def search_kb(query: str, top_k: int = 3) -> List[Dict[str, Any]]:
-    """Search KB. Uses sqlite-vec when SQLite, else cosine on SQLAlchemy chunks. Vertex/OpenAI embeddings."""
-    if _use_sqlite_vec():
-        uri = _get_db_uri()
-        texts = vector_store.search_website_kb(uri, query, limit=max(1, min(top_k, 10)))
-        return [{'score': 1.0, 'text': t, 'id': i + 1} for i, t in enumerate(texts)]
+def _query_embedding_within_deadline(query: str) -> Optional[List[float]]:
+    """Query embedding, or None when the provider errors, exceeds KB_EMBED_TIMEOUT_SECONDS or is backing off."""
+    global _embed_pool, _embed_unavailable_until
+    if time.time() < _embed_unavailable_until:
+        return None
+    if _embed_pool is None:
+        with _embed_pool_lock:
+            if _embed_pool is None:
+                _embed_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='kb-embed')
+    app = current_app._get_current_object()
 
-    chunks = load_kb_chunks()
-    if not chunks:
-        return []
+    def run():
+        # API keys may come from Admin AI Settings, which needs an app context
+        with app.app_context():
+            return _generate_query_embedding(query)
 
+    future = _embed_pool.submit(run)
     try:
-        q_embed = _generate_embedding(query)
-    except Exception:
-        return []
+        return future.result(timeout=KB_EMBED_TIMEOUT_SECONDS)
+    except FutureTimeout:
+        # Left running: the result still lands in the query-embedding cache for the next search
+        logger.warning("[KB Search] query embedding exceeded %ss, using keyword search", KB_EMBED_TIMEOUT_SECONDS)
+    except Exception as e:
+        logger.warning("[KB Search] query embedding failed, using keyword search: %s", e)
+    _embed_unavailable_until = time.time() + KB_EMBED_BACKOFF_SECONDS
+    return None
+
+
+def _search_vector(q_embed: List[float], top_k: int) -> List[Dict[str, Any]]:
+    if _use_sqlite_vec():
+        rows = vector_store.search_website_kb_vector(_get_db_uri(), q_embed, limit=top_k)
+        return [{'score': 1.0 / rank, 'text': text, 'id': chunk_id}
+                for rank, (chunk_id, text) in enumerate(rows, start=1)]
+
+    if HAS_NUMPY:
+        return _search_kb_matrix(q_embed, top_k)
 
     scored = []
-    for ch in chunks:
+    for ch in load_kb_chunks():
         score = _cosine_similarity(q_embed, ch.get('embedding') or [])
         scored.append((score, ch))
     scored.sort(key=lambda x: x[0], reverse=True)
-
     return [
         {'score': float(s), 'text': ch.get('text', ''), 'id': ch.get('id')}
-        for s, ch in scored[:max(1, min(top_k, 10))]
+        for s, ch in scored[:top_k]
     ]
 
 
+def _search_lexical(query: str, top_k: int) -> List[Dict[str, Any]]:
+    """Keyword search: FTS5 on sqlite-vec, in-memory BM25 over the loaded chunks on PostgreSQL."""
+    if _use_sqlite_vec():
+        rows = vector_store.search_website_kb_lexical(_get_db_uri(), query, limit=top_k)
+        return [{'score': 1.0 / rank, 'text': text, 'id': chunk_id}
+                for rank, (chunk_id, text) in enumerate(rows, start=1)]
+
+    if HAS_NUMPY:
+        ids, texts, _ = _get_kb_matrix()
+    else:
+        chunks = load_kb_chunks()
+        ids, texts = [c['id'] for c in chunks], [c['text'] for c in chunks]
+    if not ids:
+        return []
+    index = _get_kb_bm25(texts)
+    return [{'score': score, 'text': texts[pos], 'id': ids[pos]} for pos, score in index.search(query, top_k)]
+
+
+@tracing.traced('kb.search')
+def search_kb(query: str, top_k: int = 3) -> List[Dict[str, Any]]:
+    started = time.perf_counter()
+    try:
+        return _search_kb(query, top_k)
+    finally:
+        metrics.observe('kb_search_duration_seconds', time.perf_counter() - started, {'mode': KB_SEARCH_MODE})
+
+
+def _search_kb(query: str, top_k: int) -> List[Dict[str, Any]]:
+    """
+    Search KB. Hybrid by default: keyword hits (FTS5 / BM25) and embedding hits (sqlite-vec, or cosine on
+    SQLAlchemy chunks) fused with reciprocal rank fusion. Falls back to keyword hits alone when the
+    embedding provider is slow or unavailable. KB_SEARCH_MODE=vector|lexical selects a single side.
+    """
+    if not query or not query.strip():
+        return []
+    top_k = max(1, min(top_k, 10))
+    candidates = max(top_k * 4, 20)
+
+    lexical: List[Dict[str, Any]] = []
+    if KB_SEARCH_MODE != 'vector':
+        try:
+            with tracing.span('kb.lexical'):
+                lexical = _search_lexical(query, candidates)
+        except Exception as e:
+            logger.warning("[KB Search] keyword search failed: %s", e)
+        if KB_SEARCH_MODE == 'lexical':
+            return lexical[:top_k]
+
+    with tracing.span('kb.embed_query'):
+        if KB_SEARCH_MODE == 'vector':
+            try:
+                q_embed = _generate_query_embedding(query)
+            except Exception:
+                return []
+        else:
+            q_embed = _query_embedding_within_deadline(query)
+    vector: List[Dict[str, Any]] = []
+    if q_embed is not None:
+        with tracing.span('kb.vector'):
+            vector = _search_vector(q_embed, candidates)
+
+    if not lexical:
+        return vector[:top_k]
+    if not vector:
+        return lexical[:top_k]
+    # Keyed on (id, text) rather than id alone: SQLAlchemy chunk ids are chunk_index values, which indexes
+    # built before chunk ids were kept unique may still repeat, and distinct chunks must not be merged
+    hits = {}
+    for hit in vector + lexical:
+        hits.setdefault(_fusion_key(hit), hit)
+    fused = kb_lexical.rrf_fuse([[_fusion_key(h) for h in vector], [_fusion_key(h) for h in lexical]])
+    return [{'score': score, 'text': hits[key]['text'], 'id': hits[key]['id']} for key, score in fused[:top_k]]
+
+
+def _fusion_key(hit: Dict[str, Any]) -> Tuple[Any, str]:
+    return hit['id'], hit['text']
+
+
 def get_kb_status() -> Dict[str, Any]:
     """Return KB status (count, updated_at)."""
     if _use_sqlite_vec():
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""KB reindex scheduler with a fake embedder (no API key, no Flask app) - run from backend dir: python test_kb_reindex.py"""
+import contextlib
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.kb_reindex import KBReindexScheduler, ReindexBusy
+
+
+class FakeApp:
+    """Just what the scheduler uses from a Flask app."""
+
+    def __init__(self, instance_path):
+        self.instance_path = instance_path
+
+    def app_context(self):
+        return contextlib.nullcontext()
+
+
+class FakeEmbedder:
+    """embed_fn(texts) -> (vectors, errors); counts calls and texts."""
+
+    def __init__(self, dim=4):
+        self.dim = dim
+        self.calls = 0
+        self.texts = 0
+
+    def __call__(self, texts):
+        self.calls += 1
+        self.texts += len(texts)
+        return [[float(len(t))] * self.dim for t in texts], []
+
+
+def make_reindex_fn(embedder, chunks, gate=None):
+    """reindex_fn(on_progress) embedding `chunks` with `embedder`; waits on `gate` (an Event) if given."""
+    def reindex(on_progress):
+        on_progress('embedding', {'chunks': len(chunks)})
+        if gate is not None:
+            gate.wait(5)
+        vectors, errors = embedder(chunks)
+        if errors:
+            raise RuntimeError("; ".join(errors))
+        on_progress('writing', {'add': len(vectors)})
+        return {'count': len(vectors), 'added': len(vectors), 'removed': 0, 'unchanged': 0}
+    return reindex
+
+
+def wait_for(predicate, timeout=5.0):
+    end = time.time() + timeout
+    while time.time() < end:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class KBReindexSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.app = FakeApp(self.tmp.name)
+        self.embedder = FakeEmbedder()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def scheduler(self, reindex_fn, **kwargs):
+        kwargs.setdefault('lock_fn', lambda app: (lambda: None))
+        return KBReindexScheduler(reindex_fn=reindex_fn, **kwargs)
+
+    def test_debounce_coalesces_a_burst_of_edits_into_one_run(self):
+        scheduler = self.scheduler(
+            make_reindex_fn(self.embedder, ['a', 'bb', 'ccc']), debounce_seconds=0.2, max_delay_seconds=5
+        )
+        for _ in range(5):
+            scheduler.schedule(self.app)
+        self.assertEqual(scheduler.status(self.app)['state'], 'scheduled')
+        self.assertTrue(wait_for(lambda: scheduler.status(self.app)['runs'] == 1))
+        time.sleep(0.3)
+        status = scheduler.status(self.app)
+        self.assertEqual(status['runs'], 1)
+        self.assertEqual(self.embedder.calls, 1)
+        self.assertEqual(self.embedder.texts, 3)
+        self.assertEqual(status['last_run']['requests'], 5)
+        self.assertTrue(status['last_run']['ok'])
+
+    def test_single_flight_and_status_shared_between_workers(self):
+        gate = threading.Event()
+        running = self.scheduler(make_reindex_fn(self.embedder, ['a', 'b'], gate))
+        other_worker = self.scheduler(make_reindex_fn(self.embedder, ['a', 'b']))
+        results = {}
+        thread = threading.Thread(target=lambda: results.update(stats=running.run_now(self.app)))
+        thread.start()
+        try:
+            self.assertTrue(wait_for(lambda: (running.status(self.app)['current'] or {}).get('phase') == 'embedding'))
+            with self.assertRaises(ReindexBusy):
+                running.run_now(self.app)
+            # Another process sees the run through the status file
+            status = other_worker.status(self.app)
+            self.assertEqual(status['state'], 'running')
+            self.assertEqual(status['current']['phase'], 'embedding')
+        finally:
+            gate.set()
+            thread.join(5)
+        self.assertEqual(results['stats']['added'], 2)
+        self.assertEqual(self.embedder.calls, 1)
+        status = other_worker.status(self.app)
+        self.assertIsNone(status['current'])
+        self.assertEqual(status['runs'], 1)
+        self.assertEqual(status['last_run']['added'], 2)
+
+    def test_cluster_lock_held_elsewhere_is_busy(self):
+        scheduler = self.scheduler(make_reindex_fn(self.embedder, ['a']), lock_fn=lambda app: None)
+        with self.assertRaises(ReindexBusy):
+            scheduler.run_now(self.app)
+        self.assertEqual(self.embedder.calls, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""AI provider routing against local stub providers (no API keys) - run from backend dir: python test_provider_router.py"""
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from services.provider_router import CircuitBreaker, CircuitOpen, ProviderRouter
+
+
+class StubProviders:
+    """call_fn for ProviderRouter: each provider answers, raises or sleeps as configured; records calls."""
+
+    def __init__(self, **behaviour):
+        # name -> answer text, an Exception to raise, or (delay seconds, answer text)
+        self.behaviour = behaviour
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def __call__(self, provider, last):
+        with self._lock:
+            self.calls.append((provider, last))
+        result = self.behaviour[provider]
+        if isinstance(result, Exception):
+            raise result
+        if isinstance(result, tuple):
+            delay, result = result
+            time.sleep(delay)
+        return result
+
+
+def breaker(**kwargs):
+    kwargs.setdefault('window', 4)
+    kwargs.setdefault('min_calls', 2)
+    kwargs.setdefault('failure_rate', 0.5)
+    kwargs.setdefault('slow_seconds', 10.0)
+    kwargs.setdefault('cooldown_seconds', 0.2)
+    return CircuitBreaker(**kwargs)
+
+
+class ProviderRouterTest(unittest.TestCase):
+    def test_fails_over_in_priority_order(self):
+        router = ProviderRouter(hedge_enabled=False, breaker_factory=breaker)
+        stub = StubProviders(openai=RuntimeError('boom'), gemini='', anthropic='answer')
+        text, provider, errors = router.call(['openai', 'gemini', 'anthropic'], stub)
+        self.assertEqual((text, provider), ('answer', 'anthropic'))
+        self.assertEqual([name for name, _ in stub.calls], ['openai', 'gemini', 'anthropic'])
+        self.assertEqual([last for _, last in stub.calls], [False, False, True])
+        self.assertEqual(errors, ['openai: boom', 'gemini: empty response'])
+        self.assertEqual(router.stats()['failovers'], 2)
+
+    def test_all_providers_failing_returns_none(self):
+        router = ProviderRouter(hedge_enabled=False, breaker_factory=breaker)
+        stub = StubProviders(openai=RuntimeError('down'), gemini=RuntimeError('down'))
+        text, provider, errors = router.call(['openai', 'gemini'], stub)
+        self.assertIsNone(text)
+        self.assertIsNone(provider)
+        self.assertEqual(len(errors), 2)
+        self.assertEqual(router.stats()['failed'], 1)
+
+    def test_breaker_opens_after_repeated_errors_then_probes(self):
+        router = ProviderRouter(hedge_enabled=False, breaker_factory=breaker)
+        stub = StubProviders(openai=RuntimeError('down'), gemini='fallback')
+        for _ in range(2):
+            router.call(['openai', 'gemini'], stub)
+        self.assertEqual(router.breaker('openai').snapshot()['state'], 'open')
+
+        # Open: openai is skipped, gemini answers without an openai attempt
+        stub.calls.clear()
+        text, provider, _ = router.call(['openai', 'gemini'], stub)
+        self.assertEqual((text, provider), ('fallback', 'gemini'))
+        self.assertEqual([name for name, _ in stub.calls], ['gemini'])
+
+        # Every breaker open: short-circuit without calling anything
+        with self.assertRaises(CircuitOpen):
+            router.call(['openai'], stub)
+
+        # After the cooldown one probe goes through (half_open); a failed probe opens it again
+        time.sleep(0.25)
+        self.assertTrue(router.breaker('openai').allow())
+        self.assertEqual(router.breaker('openai').snapshot()['state'], 'half_open')
+        self.assertFalse(router.breaker('openai').allow())
+        router.breaker('openai').record(False, 0.01)
+        self.assertEqual(router.breaker('openai').snapshot()['state'], 'open')
+
+        # A successful probe closes it
+        time.sleep(0.25)
+        stub.behaviour['openai'] = 'recovered'
+        stub.calls.clear()
+        text, provider, _ = router.call(['openai', 'gemini'], stub)
+        self.assertEqual((text, provider), ('recovered', 'openai'))
+        self.assertEqual(router.breaker('openai').snapshot()['state'], 'closed')
+
+    def test_slow_calls_open_the_breaker(self):
+        router = ProviderRouter(hedge_enabled=False, breaker_factory=lambda: breaker(slow_seconds=0.05))
+        stub = StubProviders(openai=(0.06, 'slow answer'))
+        for _ in range(2):
+            self.assertEqual(router.call(['openai'], stub)[0], 'slow answer')
+        self.assertEqual(router.breaker('openai').snapshot()['state'], 'open')
+
+    def test_hedged_first_answer_wins(self):
+        router = ProviderRouter(hedge_enabled=True, hedge_min_delay=0.05, hedge_max_delay=0.05, breaker_factory=breaker)
+        stub = StubProviders(openai=(0.5, 'slow'), gemini=(0.01, 'fast'))
+        started = time.monotonic()
+        text, provider, errors = router.call(['openai', 'gemini'], stub)
+        self.assertEqual((text, provider), ('fast', 'gemini'))
+        self.assertLess(time.monotonic() - started, 0.4)
+        self.assertEqual(errors, [])
+        stats = router.stats()
+        self.assertEqual((stats['hedges'], stats['hedge_wins']), (1, 1))
+
+    def test_hedge_not_started_when_primary_answers_in_time(self):
+        router = ProviderRouter(hedge_enabled=True, hedge_min_delay=0.3, hedge_max_delay=0.3, breaker_factory=breaker)
+        stub = StubProviders(openai=(0.01, 'primary'), gemini='unused')
+        text, provider, _ = router.call(['openai', 'gemini'], stub)
+        self.assertEqual((text, provider), ('primary', 'openai'))
+        self.assertEqual([name for name, _ in stub.calls], ['openai'])
+        self.assertEqual(router.stats()['hedges'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
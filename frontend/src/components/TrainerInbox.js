@@ -5,6 +5,7 @@ import './TrainerInbox.css';
 
 const API_BASE = `${getApiBase()}/api/messages`;
 const ADMIN_BASE = `${getApiBase()}/api/admin`;
+const THREADS_PAGE_SIZE = 100;
 
 const TrainerInbox = () => {
   const [threads, setThreads] = useState([]);
@@ -13,6 +14,8 @@ const TrainerInbox = () => {
   const [body, setBody] = useState('');
   const [loading, setLoading] = useState(false);
   const [loadingThreads, setLoadingThreads] = useState(true);
+  const [threadsNextOffset, setThreadsNextOffset] = useState(null);
+  const [loadingMoreThreads, setLoadingMoreThreads] = useState(false);
   const [loadingThread, setLoadingThread] = useState(false);
   const [progressCheckRequests, setProgressCheckRequests] = useState([]);
   const [loadingProgressRequests, setLoadingProgressRequests] = useState(false);
@@ -52,8 +55,9 @@ const TrainerInbox = () => {
   const loadThreads = useCallback(async () => {
     setLoadingThreads(true);
     try {
-      const res = await axios.get(API_BASE, getAxiosConfig());
+      const res = await axios.get(`${API_BASE}?limit=${THREADS_PAGE_SIZE}`, getAxiosConfig());
       let list = res.data.threads || [];
+      setThreadsNextOffset(res.data.next_offset ?? null);
       if (list.length === 0) {
         try {
           const membersRes = await axios.get(`${ADMIN_BASE}/members`, getAxiosConfig());
@@ -75,6 +79,20 @@ const TrainerInbox = () => {
     }
   }, [getAxiosConfig]);
 
+  const loadMoreThreads = async () => {
+    if (threadsNextOffset == null) return;
+    setLoadingMoreThreads(true);
+    try {
+      const res = await axios.get(`${API_BASE}?limit=${THREADS_PAGE_SIZE}&offset=${threadsNextOffset}`, getAxiosConfig());
+      const more = res.data.threads || [];
+      setThreads(prev => [...prev, ...more.filter(t => !prev.some(p => p.user_id === t.user_id))]);
+      setThreadsNextOffset(res.data.next_offset ?? null);
+    } catch (_) {
+    } finally {
+      setLoadingMoreThreads(false);
+    }
+  };
+
   const loadThread = async (memberId, username) => {
     if (!memberId) return;
     setSelectedMember({ id: memberId, username: username || threads.find(t => t.user_id === memberId)?.username || 'Member' });
@@ -167,19 +185,26 @@ const TrainerInbox = () => {
               <p>No messages from members yet.</p>
             </div>
           ) : (
-            threads.map((thread) => (
-              <button
-                key={thread.user_id}
-                type="button"
-                className={`trainer-inbox-thread-btn ${selectedMember?.id === thread.user_id ? 'active' : ''}`}
-                onClick={() => handleSelectMember(thread)}
-              >
-                <span className="thread-username">{thread.username}</span>
-                {thread.unread_count > 0 && (
-                  <span className="thread-unread">{thread.unread_count}</span>
-                )}
-              </button>
-            ))
+            <>
+              {threads.map((thread) => (
+                <button
+                  key={thread.user_id}
+                  type="button"
+                  className={`trainer-inbox-thread-btn ${selectedMember?.id === thread.user_id ? 'active' : ''}`}
+                  onClick={() => handleSelectMember(thread)}
+                >
+                  <span className="thread-username">{thread.username}</span>
+                  {thread.unread_count > 0 && (
+                    <span className="thread-unread">{thread.unread_count}</span>
+                  )}
+                </button>
+              ))}
+              {threadsNextOffset != null && (
+                <button type="button" className="trainer-inbox-thread-btn" onClick={loadMoreThreads} disabled={loadingMoreThreads}>
+                  {loadingMoreThreads ? 'Loading...' : 'Load more'}
+                </button>
+              )}
+            </>
           )}
         </div>
         <div className="trainer-inbox-chat">